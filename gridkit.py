@@ -11,12 +11,37 @@ extraction procedures, and write CSV's with the high-voltage network
 extract.
 """
 from __future__ import print_function, unicode_literals, division
-import os, sys, io, re, csv, argparse, logging, subprocess, functools, getpass, operator
+import os, sys, io, re, csv, argparse, logging, subprocess, functools, getpass, operator, time, gzip, math, hashlib
+import multiprocessing, multiprocessing.pool, threading
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
 from util.postgres import PgWrapper as PgClient, PSQL
+from util.osmfile import read_osm, is_o5m, is_osm_xml
+from util.polyfile import PolyfileParser, write_polyfile
+from util.profiling import StageProfiler, auto_explain_options
+from util.stages import read_manifest, stage_dependencies, stage_hashes, stages_to_run, run_stages
 from util.which import which
 
 __author__ = 'Bart Wiegmans'
 
+# at module level, so that the workers of process_areas have them when
+# they are started without forking
+OSM2PGSQL  = which('osm2pgsql')
+OSMCONVERT = which('osmconvert')
+OSMFILTER  = which('osmfilter')
+OSMOSIS    = which('osmosis')
+BASE_DIR   = os.path.realpath(os.path.dirname(__file__))
+POWERSTYLE = os.path.join(BASE_DIR, 'power.style')
+LOG_FORMAT = '%(levelname)s [%(asctime)s] / %(message)s'
+# simplified --poly borders, in the working directory
+POLY_CACHE = 'gridkit-poly-cache'
+
 if sys.version_info >= (3,0):
     raw_input = input
 
@@ -72,11 +97,12 @@ def setup_database(pg_client, database_name, interactive):
     print("Database", database_name, "set up")
     return database_name
 
-def do_import(osm_data_file, database_name, database_params):
+def do_import(osm_data_file, database_name, database_params, append=False):
     if 'password' in database_params:
         os.environ['PGPASS'] = database_params['password']
+    # appending (a change file) requires the slim tables of a previous import
     command_line = [OSM2PGSQL, '-d', database_name,
-                    '-c', '-k', '-s', '-S', POWERSTYLE]
+                    '-a' if append else '-c', '-k', '-s', '-S', POWERSTYLE]
     if 'port' in database_params:
         command_line.extend(['-P', str(database_params['port'])])
     if 'user' in database_params:
@@ -87,71 +113,361 @@ def do_import(osm_data_file, database_name, database_params):
     logging.info("Calling %s", ' '.join(command_line))
     subprocess.check_call(command_line)
 
-def do_conversion(pg_client, voltage_cutoff=220000):
+# osm2pgsql stores nodes in spherical mercator, in fixed point
+# centimeters; prepare-tables.sql divides by 100 again
+EARTH_RADIUS = 6378137.0
+MAX_LATITUDE = 85.0511287798
+
+def mercator_fixed(lon, lat):
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = math.radians(lon) * EARTH_RADIUS
+    y = math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) * EARTH_RADIUS
+    return int(round(x * 100)), int(round(y * 100))
+
+def pg_array(values):
+    return '{' + ','.join(map(str, values)) + '}'
+
+def pg_text_array(tags):
+    # tags as a key, value, key, value... array, like osm2pgsql's
+    quote = lambda s: '"' + s.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return '{' + ','.join(quote(s) for k, v in sorted(tags.items()) for s in (k, v)) + '}'
+
+def power_ways(osm_data_file, node_ids):
+    for osm_object in read_osm(osm_data_file):
+        if osm_object[0] == 'w' and 'power' in osm_object[3]:
+            _, way_id, way_nodes, tags = osm_object
+            node_ids.update(way_nodes)
+            yield way_id, pg_array(way_nodes), pg_text_array(tags)
+
+def power_nodes(osm_data_file, node_ids):
+    for osm_object in read_osm(osm_data_file):
+        if osm_object[0] != 'n':
+            # like osm2pgsql, we require the nodes to come first
+            break
+        _, node_id, lon, lat, tags = osm_object
+        if node_id in node_ids or 'power' in tags:
+            x, y = mercator_fixed(lon, lat)
+            yield node_id, y, x, pg_text_array(tags)
+
+def do_native_import(pg_client, osm_data_file):
+    # import only the power objects (and the nodes of power ways) into
+    # tables shaped like the slim tables of osm2pgsql. The ways are read
+    # first, to learn which nodes are needed; the second pass stops at
+    # the first way.
+    pg_client.do_query('''
+DROP TABLE IF EXISTS planet_osm_nodes;
+DROP TABLE IF EXISTS planet_osm_ways;
+CREATE TABLE planet_osm_nodes (
+    id   bigint not null,
+    lat  integer not null,
+    lon  integer not null,
+    tags text[]
+);
+CREATE TABLE planet_osm_ways (
+    id    bigint not null,
+    nodes bigint[] not null,
+    tags  text[]
+);''')
+    node_ids = set()
+    logging.info("Reading power ways from %s", osm_data_file)
+    pg_client.do_putcsv('planet_osm_ways', power_ways(osm_data_file, node_ids))
+    logging.info("Reading power nodes and %d nodes of power ways from %s", len(node_ids), osm_data_file)
+    pg_client.do_putcsv('planet_osm_nodes', power_nodes(osm_data_file, node_ids))
+    pg_client.do_query('''
+ALTER TABLE planet_osm_nodes ADD PRIMARY KEY (id);
+ALTER TABLE planet_osm_ways ADD PRIMARY KEY (id);
+ANALYZE planet_osm_nodes;
+ANALYZE planet_osm_ways;''')
+
+def read_config(*config_files):
+    # read GRIDKIT_ settings from shell-style configuration files, later
+    # files override earlier ones
+    config = dict()
+    for config_file in config_files:
+        if not os.path.isfile(config_file):
+            continue
+        with io.open(config_file, 'r') as handle:
+            for line in handle:
+                match = re.match(r'\s*GRIDKIT_(\w+)=(\S*)', line)
+                if match:
+                    config[match.group(1).lower()] = match.group(2)
+    return config
+
+def read_stage_markers(pg_client):
+    pg_client.do_query('''
+CREATE TABLE IF NOT EXISTS gridkit_stages (
+    stage_name varchar(64) primary key,
+    stage_hash char(40) not null,
+    completed  timestamp not null default now()
+)''')
+    io_handle = io.StringIO()
+    pg_client.do_getcsv('SELECT stage_name, stage_hash FROM gridkit_stages', io_handle)
+    io_handle.seek(0,0)
+    rows = csv.reader(io_handle)
+    next(rows, None) # header
+    return dict(rows)
+
+def clear_stage_markers(pg_client, keep=()):
+    query = 'DELETE FROM gridkit_stages'
+    if keep:
+        query += ' WHERE stage_name NOT IN ({0})'.format(
+            ', '.join("'{0}'".format(stage_name) for stage_name in keep))
+    pg_client.do_query(query)
+
+def mark_stage(pg_client, stage_name, stage_hash):
+    pg_client.do_query('''
+DELETE FROM gridkit_stages WHERE stage_name = '{0}';
+INSERT INTO gridkit_stages (stage_name, stage_hash) VALUES ('{0}', '{1}');
+'''.format(stage_name, stage_hash))
+
+def conversion_stages(manifest=None):
+    return read_manifest(manifest or os.path.join(BASE_DIR, 'src', 'stages.conf'))
+
+def execute_stages(pg_client, config, stages, dependencies, profiler=None, jobs=1,
+                   search_path=None, after_stage=None, label=''):
+    # concurrent stages each need a connection of their own, as do
+    # stages with another search_path
+    local   = threading.local()
+    clients = list()
+    def stage_client():
+        if jobs <= 1 and search_path is None:
+            return pg_client
+        if not hasattr(local, 'client'):
+            local.client = pg_client.clone()
+            if pg_client.notices is not None:
+                local.client.collect_notices()
+            local.client.check_connection()
+            if search_path is not None:
+                local.client.do_query('SET search_path TO {0}'.format(search_path))
+            clients.append(local.client)
+        return local.client
+
+    def run_stage(stage):
+        client = stage_client()
+        logging.info("Running %s%s", label, stage.name)
+        stage_variables = dict((n, config[n]) for n in stage.variables)
+        if profiler is not None:
+            profiler.run_stage(client, label + stage.name, stage.path, stage_variables)
+        else:
+            client.do_queryfile(stage.path, stage_variables)
+        if after_stage is not None:
+            after_stage(client, stage)
+
+    try:
+        run_stages(stages, dependencies, run_stage, jobs)
+    finally:
+        for client in clients:
+            client.close()
+
+def do_conversion(pg_client, config, resume=False, profiler=None, jobs=1, manifest=None):
+    stages       = conversion_stages(manifest)
+    dependencies = stage_dependencies(stages)
+    hashes       = stage_hashes(stages, dependencies, config)
+    markers      = read_stage_markers(pg_client)
+    if not resume:
+        markers.clear()
+    run          = stages_to_run(stages, dependencies, hashes, markers)
+    clear_stage_markers(pg_client, keep=[stage.name for stage in stages if stage not in run])
+    for stage in stages:
+        if stage not in run:
+            logging.info("Skipping %s (unchanged)", stage.name)
+    execute_stages(pg_client, config, run, dependencies, profiler, jobs,
+                   after_stage=lambda client, stage: mark_stage(client, stage.name, hashes[stage.name]))
+    logging.info("Conversion done")
+
+# stages that can run for a region (around the changes of an update,
+# or a tile) on its own; the stages that follow run on the complete
+# network
+REGION_STAGES = ('prepare-tables.sql', 'node-', 'spatial-', 'topology-')
+UPDATE_SCHEMA = 'gridkit_update'
+TILE_SCHEMA   = 'gridkit_tile_{0}'
+DROPPED_RELATION = re.compile(r'^\s*drop (table|sequence) if exists (\w+)', re.I | re.M)
+
+def read_changes(osc_file):
+    # ids and types of the nodes and ways in an OSM change file
+    opener = gzip.open if osc_file.endswith('.gz') else io.open
+    with opener(osc_file, 'rb') as handle:
+        action = None
+        # python 2 cElementTree only accepts byte strings as events
+        for event, element in ElementTree.iterparse(handle, events=(str('start'), str('end'))):
+            if event == 'start':
+                if element.tag in ('create', 'modify', 'delete'):
+                    action = element
+            elif element.tag in ('node', 'way'):
+                yield int(element.get('id')), element.tag[0]
+                # keep memory use constant
+                element.clear()
+                if action is not None:
+                    action.clear()
+
+def split_stages(stages):
+    # stages before, for and after the region stages
+    region_stages = [stage for stage in stages if stage.name.startswith(REGION_STAGES)]
+    first = stages.index(region_stages[0])
+    return stages[:first], region_stages, [stage for stage in stages[first:] if stage not in region_stages]
+
+def prepare_region_schema(pg_client, stages, schema):
+    # names are looked up through the search_path, so unless the region
+    # schema has them, the stages would drop the tables of the network
+    queries = list()
+    for stage in stages:
+        with io.open(stage.path, 'r', encoding='utf-8') as handle:
+            for kind, name in DROPPED_RELATION.findall(handle.read()):
+                queries.append('CREATE {0} IF NOT EXISTS {1}.{2}{3};'.format(
+                    kind.upper(), schema, name.lower(), ' ()' if kind.lower() == 'table' else ''))
+    pg_client.do_query('\n'.join(queries))
+
+def do_update(pg_client, config, osc_file, database_name, database_params, profiler=None, jobs=1):
+    f = functools.partial(os.path.join, BASE_DIR, 'src')
+    pg_client.do_query('''
+DROP TABLE IF EXISTS update_changes;
+CREATE TABLE update_changes (
+    osm_id   bigint not null,
+    osm_type char(1) not null
+)''')
+    logging.info("Reading changes from %s", osc_file)
+    pg_client.do_putcsv('update_changes', read_changes(osc_file))
+    do_import(osc_file, database_name, database_params, append=True)
+
+    pg_client.do_queryfile(f('update-1-area.sql'), dict((n, config[n]) for n in ('terminal_radius', 'update_buffer')))
+    if not int(list(pg_client.do_iterrows('SELECT count(*) FROM update_area'))[0][0]):
+        logging.info("No power objects changed")
+        return
+
+    stages        = conversion_stages()
+    dependencies  = stage_dependencies(stages)
+    hashes        = stage_hashes(stages, dependencies, config)
+    _, region_stages, later_stages = split_stages(stages)
+
+    logging.info("Converting the update region")
+    pg_client.do_queryfile(f('update-2-region.sql'))
+    prepare_region_schema(pg_client, region_stages, UPDATE_SCHEMA)
+    execute_stages(pg_client, config, region_stages, dependencies, profiler, jobs,
+                   search_path='{0}, public'.format(UPDATE_SCHEMA))
+    pg_client.do_queryfile(f('update-3-merge.sql'))
+    pg_client.do_query('DROP SCHEMA {0} CASCADE'.format(UPDATE_SCHEMA))
+
+    # the network is now as the region stages would have left it
+    read_stage_markers(pg_client)
+    for stage in region_stages:
+        mark_stage(pg_client, stage.name, hashes[stage.name])
+    clear_stage_markers(pg_client, keep=[stage.name for stage in stages if stage not in later_stages])
+    execute_stages(pg_client, config, later_stages, dependencies, profiler, jobs,
+                   after_stage=lambda client, stage: mark_stage(client, stage.name, hashes[stage.name]))
+    logging.info("Update done")
+
+def do_tiled_conversion(pg_client, config, tile_size, profiler=None, jobs=1, stage_jobs=1):
     f = functools.partial(os.path.join, BASE_DIR, 'src')
-    # preparing tables
-    logging.info("Preparing tables")
-    pg_client.do_queryfile(f('prepare-functions.sql'))
-    pg_client.do_queryfile(f('prepare-tables.sql'))
-
-    # shared node algorithms
-    logging.info("Shared-node algorithms started")
-    pg_client.do_queryfile(f('node-1-find-shared.sql'))
-    pg_client.do_queryfile(f('node-2-merge-lines.sql'))
-    pg_client.do_queryfile(f('node-3-line-joints.sql'))
-    logging.info("Shared-node algorithms finished")
-
-    # spatial algorithms
-    logging.info("Spatial algorithms started")
-    pg_client.do_queryfile(f('spatial-1-merge-stations.sql'))
-    pg_client.do_queryfile(f('spatial-2-eliminate-line-overlap.sql'))
-    pg_client.do_queryfile(f('spatial-3-attachment-joints.sql'))
-    pg_client.do_queryfile(f('spatial-4-terminal-intersections.sql'))
-    pg_client.do_queryfile(f('spatial-5-terminal-joints.sql'))
-    pg_client.do_queryfile(f('spatial-6-merge-lines.sql'))
-    logging.info("Spatial algorithms finished")
-
-    # topological algoritms
-    logging.info("Topological algorithms started")
-    pg_client.do_queryfile(f('topology-1-connections.sql'))
-    pg_client.do_queryfile(f('topology-2-dangling-joints.sql'))
-    pg_client.do_queryfile(f('topology-3-redundant-splits.sql'))
-    pg_client.do_queryfile(f('topology-4-redundant-joints.sql'))
-    logging.info("Topological algorithms finished")
-
-    logging.info("Electric algorithms started")
-    pg_client.do_queryfile(f('electric-1-tags.sql'))
-    pg_client.do_queryfile(f('electric-2-patch.sql'))
-    pg_client.do_queryfile(f('electric-3-compute.sql'))
-
-    pg_client.do_queryfile(f('electric-4-reference.sql'))
-    logging.info("Electric algorithms finished")
-
-
-    pg_client.do_queryfile(f('topology-3a-assign-tags.sql'))
-    pg_client.do_queryfile(f('topology-3b-electrical-properties.sql'))
-
-    with io.open(f('topology-4-high-voltage-network.sql'), 'r') as handle:
-        query_text = handle.read().replace('220000', str(voltage_cutoff))
-        pg_client.do_query(query_text)
-
-    pg_client.do_queryfile(f('topology-5-abstraction.sql'))
-    logging.info("Topological algorithms done")
-
-def export_network_csv(pg_client, full_export=False, base_name='gridkit'):
+    stages       = conversion_stages()
+    dependencies = stage_dependencies(stages)
+    hashes       = stage_hashes(stages, dependencies, config)
+    mark         = lambda client, stage: mark_stage(client, stage.name, hashes[stage.name])
+    first_stages, region_stages, later_stages = split_stages(stages)
+    read_stage_markers(pg_client)
+    clear_stage_markers(pg_client)
+    execute_stages(pg_client, config, first_stages, dependencies, profiler, after_stage=mark)
+
+    pg_client.do_queryfile(f('tile-1-grid.sql'), {'tile_size': tile_size, 'tile_margin': config['tile_margin']})
+    tiles = [int(row[0]) for row in pg_client.do_iterrows('SELECT tile_id FROM conversion_tiles ORDER BY tile_id')]
+    if not tiles:
+        logging.warn("No power objects to convert")
+        return
+    logging.info("Converting %d tiles", len(tiles))
+
+    def convert_tile(tile_id):
+        # each tile on a connection of its own
+        schema = TILE_SCHEMA.format(tile_id)
+        client = pg_client.clone()
+        if pg_client.notices is not None:
+            client.collect_notices()
+        try:
+            client.check_connection()
+            client.do_queryfile(f('tile-2-region.sql'), {'tile_id': tile_id, 'tile_schema': schema})
+            prepare_region_schema(client, region_stages, schema)
+            execute_stages(client, config, region_stages, dependencies, profiler, stage_jobs,
+                           search_path='{0}, public'.format(schema), label='{0}/'.format(schema))
+        finally:
+            client.close()
+        logging.info("Converted tile %d", tile_id)
+
+    pool = multiprocessing.pool.ThreadPool(jobs)
+    try:
+        pool.map(convert_tile, tiles)
+    finally:
+        pool.close()
+        pool.join()
+
+    logging.info("Stitching tiles")
+    pg_client.do_queryfile(f('tile-3-tables.sql'), {'tile_schema': TILE_SCHEMA.format(tiles[0])})
+    for tile_id in tiles:
+        schema = TILE_SCHEMA.format(tile_id)
+        pg_client.do_queryfile(f('tile-4-collect.sql'), {'tile_id': tile_id, 'tile_schema': schema})
+        pg_client.do_query('DROP SCHEMA {0} CASCADE'.format(schema))
+    pg_client.do_queryfile(f('tile-5-stitch.sql'))
+
+    # the network is now as the region stages would have left it
+    for stage in region_stages:
+        mark(pg_client, stage)
+    execute_stages(pg_client, config, later_stages, dependencies, profiler, stage_jobs, after_stage=mark)
+    logging.info("Conversion done")
+
+# (table, file name suffix, exported only with --full-export)
+EXPORT_TABLES = [
+    ('heuristic_vertices', 'all-vertices', True),
+    ('heuristic_links', 'all-links', True),
+    ('heuristic_vertices_highvoltage', 'highvoltage-vertices', False),
+    ('heuristic_links_highvoltage', 'highvoltage-links', False),
+]
+
+COMPRESSION_EXTENSIONS = {
+    None: '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+def open_export(file_name, compression=None):
+    if compression is None:
+        return io.open(file_name, 'w', encoding='utf-8')
+    if compression == 'gzip':
+        compressed = gzip.open(file_name, 'wb')
+    elif compression == 'zstd':
+        compressed = zstandard.ZstdCompressor().stream_writer(io.open(file_name, 'wb'))
+    return io.TextIOWrapper(compressed, encoding='utf-8')
+
+def export_table(pg_client, table, file_name, compression=None):
+    # write to a temporary file first, so that file_name is either
+    # complete or absent
+    temp_name = file_name + '.tmp'
+    try:
+        with open_export(temp_name, compression) as handle:
+            pg_client.do_getcsv(table, handle)
+        getattr(os, 'replace', os.rename)(temp_name, file_name)
+    finally:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+
+def export_network_csv(pg_client, full_export=False, base_name='gridkit', compression=None):
     logging.info("Running export")
-    if full_export:
-        with io.open(base_name + '-all-vertices.csv', 'w') as handle:
-            pg_client.do_getcsv('heuristic_vertices', handle)
-        with io.open(base_name + '-all-links.csv', 'w') as handle:
-            pg_client.do_getcsv('heuristic_links', handle)
-
-    with io.open(base_name + '-highvoltage-vertices.csv', 'w') as handle:
-        pg_client.do_getcsv('heuristic_vertices_highvoltage', handle)
-
-    with io.open(base_name + '-highvoltage-links.csv', 'w') as handle:
-        pg_client.do_getcsv('heuristic_links_highvoltage', handle)
-
+    exports = [(table, '{0}-{1}.csv{2}'.format(base_name, suffix, COMPRESSION_EXTENSIONS[compression]))
+               for table, suffix, full_only in EXPORT_TABLES if full_export or not full_only]
+
+    def run_export(export):
+        # each table is exported on a separate connection
+        table, file_name = export
+        client = pg_client.clone()
+        try:
+            client.check_connection()
+            export_table(client, table, file_name, compression)
+        finally:
+            client.close()
+        logging.info("Exported %s to %s", table, file_name)
+
+    pool = multiprocessing.pool.ThreadPool(len(exports))
+    try:
+        pool.map(run_export, exports)
+    finally:
+        pool.close()
+        pool.join()
     logging.info("Export done")
 
 
@@ -160,31 +476,162 @@ def file_age_cmp(a, b):
     return os.path.getmtime(b) - os.path.getmtime(a)
 
 
-if __name__ == '__main__':
-    logging.basicConfig(format='%(levelname)s [%(asctime)s] / %(message)s', level=logging.INFO)
+def area_database_name(polyfile):
+    # cleanup the name for use as a database name
+    polygon_name, ext = os.path.splitext(os.path.basename(polyfile))
+    return 'gridkit_' + re.sub('[^A-Z0-9]+', '_', polygon_name, 0, re.I)
+
+def simplified_polyfile(polyfile, tolerance):
+    # a polygon file with fewer points that contains the area of
+    # polyfile, kept in POLY_CACHE; osmconvert tests every node against
+    # every edge of the border. The name is made unique by the path of
+    # polyfile, for areas of the same name in different directories.
+    base_name, ext = os.path.splitext(os.path.basename(polyfile))
+    path_hash  = hashlib.sha1(os.path.realpath(polyfile).encode('utf-8')).hexdigest()[:8]
+    simplified = os.path.join(POLY_CACHE, '{0}-{1}-{2:g}{3}'.format(base_name, path_hash, tolerance, ext))
+    if os.path.isfile(simplified) and file_age_cmp(simplified, polyfile) < 0:
+        return simplified
+    try:
+        import numpy
+    except ImportError:
+        logging.warn("Simplifying %s requires numpy, using it as it is", polyfile)
+        return polyfile
+    from util.geometry import MultiPolygon
+    with io.open(polyfile, 'r') as handle:
+        name, sections = PolyfileParser().parse(handle.read())
+    area = MultiPolygon.from_sections(sections)
+    while tolerance > 1e-7:
+        try:
+            simple = area.simplify(tolerance)
+            break
+        except ValueError as e:
+            logging.info("%s, trying again", e)
+            tolerance /= 2
+    else:
+        logging.warn("Could not simplify %s, using it as it is", polyfile)
+        return polyfile
+    sections = simple.sections()
+    logging.info("Simplified %s from %d to %d points", polyfile,
+                 sum(len(p.points) for p in area.polygons + area.holes),
+                 sum(len(points) for points in sections.values()))
+    try:
+        if not os.path.isdir(POLY_CACHE):
+            os.makedirs(POLY_CACHE)
+        with io.open(simplified, 'w') as handle:
+            write_polyfile(handle, name, sections)
+    except (IOError, OSError) as e:
+        logging.warn("Cannot write %s (%s), using %s as it is", simplified, e, polyfile)
+        return polyfile
+    return simplified
+
+def extract_area(osmfile, polyfile, border=None):
+    # border is the polygon file osmconvert uses, polyfile by default
+    polygon_name, ext = os.path.splitext(os.path.basename(polyfile))
+    osmfile_name, ext = os.path.splitext(osmfile)
+    osmfile_for_area = '{0}-{1}.o5m'.format(osmfile_name, polygon_name)
+    if os.path.isfile(osmfile_for_area) and file_age_cmp(osmfile_for_area, osmfile) < 0:
+        logging.info("File %s already exists and is newer than %s", osmfile_for_area, osmfile)
+    else:
+        logging.info("Extracting area %s from %s to make %s", polygon_name, osmfile, osmfile_for_area)
+        subprocess.check_call([OSMCONVERT, osmfile, '--complete-ways', '-B='+(border or polyfile), '-o='+osmfile_for_area])
+    return osmfile_for_area
+
+def redirect_output(log_file):
+    # send our own logging and that of the subprocesses (osm2pgsql,
+    # psql) to the log file, so that parallel areas don't interleave
+    sys.stdout.flush()
+    sys.stderr.flush()
+    fd = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    os.dup2(fd, sys.stdout.fileno())
+    os.dup2(fd, sys.stderr.fileno())
+    os.close(fd)
+
+def process_area(area):
+    # runs the complete pipeline for one polygon; returns the area name,
+    # the error message (or None) and the elapsed time
+    global OSM2PGSQL
+    polyfile, border, osmfile, db_params, config, importer, osm2pgsql, export_options, stage_jobs, profile, explain, log_file = area
+    area_name, ext = os.path.splitext(os.path.basename(polyfile))
+    # set by --osm2pgsql
+    OSM2PGSQL = osm2pgsql
+    logging.basicConfig(format=LOG_FORMAT, level=logging.INFO)
+    started = time.time()
+    if log_file is not None:
+        redirect_output(log_file)
+    try:
+        area_osmfile  = extract_area(osmfile, polyfile, border)
+        database_name = area_database_name(polyfile)
+        pg_client = PgClient()
+        pg_client.update_params(db_params)
+        if explain:
+            pg_client.collect_notices()
+        # select 'postgres' database for creating other databases
+        pg_client.update_params({'database':'postgres'})
+        pg_client.check_connection()
+        setup_database(pg_client, database_name, False)
+        # setup-database automatically uses the right connection
+        if importer == 'native':
+            do_native_import(pg_client, area_osmfile)
+        else:
+            do_import(area_osmfile, database_name, db_params)
+        profiler = StageProfiler(explain) if profile else None
+        do_conversion(pg_client, config, profiler=profiler, jobs=stage_jobs)
+        if profiler is not None:
+            profiler.write(database_name + '-profile.json')
+        export_network_csv(pg_client, base_name=database_name, **export_options)
+    except Exception as e:
+        logging.exception("Processing area %s failed", area_name)
+        return area_name, str(e), time.time() - started
+    return area_name, None, time.time() - started
+
+def process_areas(areas, jobs=1):
+    if jobs <= 1:
+        results = list(map(process_area, areas))
+    else:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            results = list(pool.imap_unordered(process_area, areas))
+            pool.close()
+        except KeyboardInterrupt:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    for area_name, error, elapsed in sorted(results):
+        if error is None:
+            logging.info("Area %s done in %.0fs", area_name, elapsed)
+        else:
+            logging.error("Area %s failed after %.0fs: %s", area_name, elapsed, error)
+    return all(error is None for _, error, _ in results)
 
 
-    OSM2PGSQL  = which('osm2pgsql')
-    OSMCONVERT = which('osmconvert')
-    OSMFILTER  = which('osmfilter')
-    OSMOSIS    = which('osmosis')
-    BASE_DIR   = os.path.realpath(os.path.dirname(__file__))
-    POWERSTYLE = os.path.join(BASE_DIR, 'power.style')
+if __name__ == '__main__':
+    logging.basicConfig(format=LOG_FORMAT, level=logging.INFO)
 
     parse_pair = lambda s: tuple(s.split('=', 1))
     ap = argparse.ArgumentParser()
     # polygon filter files
     ap.add_argument('--filter', action='store_true', help='Filter input file for power data (requires osmfilter)')
     ap.add_argument('--poly',type=str,nargs='+', help='Polygon file(s) to limit the areas of the input file (requires osmconvert)')
+    ap.add_argument('--poly-tolerance', type=float, default=0.001, metavar='DEGREES', help='Simplify the --poly borders for osmconvert to within DEGREES, only ever enlarging the area (0 to use them as they are)')
+    ap.add_argument('--jobs', type=int, default=1, help='Number of --poly areas (each logging to <database>.log) or tiles to process in parallel')
+    ap.add_argument('--tile-size', type=int, metavar='SIZE', help='Convert in square tiles of SIZE meters (with a margin of GRIDKIT_TILE_MARGIN) and stitch them together')
     ap.add_argument('--no-interactive', action='store_false', dest='interactive', help='Proceed automatically without asking questions')
     ap.add_argument('--no-import', action='store_false', dest='_import', help='Skip import step')
     ap.add_argument('--no-conversion', action='store_false', dest='convert', help='Skip conversion step')
     ap.add_argument('--no-export', action='store_false', dest='export', help='Skip export step')
+    ap.add_argument('--update', type=str, metavar='OSC', help='Apply an OSM change file to a converted database, recomputing only the area around the changes')
+    ap.add_argument('--resume', action='store_true', help='Skip conversion stages that have completed with unchanged inputs')
+    ap.add_argument('--stage-jobs', type=int, default=1, help='Number of independent conversion stages to run concurrently, each on its own connection')
     ap.add_argument('--pg', type=parse_pair, default=[], nargs='+', help='Connection arguments to PostgreSQL, eg. --pg user=gridkit database=europe')
     ap.add_argument('--psql', type=str, help='Location of psql binary', default=PSQL)
     ap.add_argument('--osm2pgsql', type=str, help='Location of osm2pgsql binary', default=OSM2PGSQL)
+    ap.add_argument('--importer', choices=['native', 'osm2pgsql'], help='Import only the power data of an .osm or .o5m file (native, the default for those), or all data with osm2pgsql (the default for others), which --update requires')
+    ap.add_argument('--profile', action='store_true', help='Write timings and row counts per conversion stage to <database>-profile.json')
+    ap.add_argument('--explain', type=int, metavar='MS', help='Add query plans of statements taking at least MS milliseconds to the profile (implies --profile, requires superuser)')
     ap.add_argument('--voltage', type=int, help='High-voltage cutoff level', default=220000)
     ap.add_argument('--full-export', action='store_true', dest='full_export')
+    ap.add_argument('--compress', choices=['gzip', 'zstd'], help='Compress the exported CSV files')
     ap.add_argument('osmfile', nargs='?')
     args = ap.parse_args()
 
@@ -193,8 +640,27 @@ if __name__ == '__main__':
     OSM2PGSQL   = args.osm2pgsql
     osmfile     = args.osmfile
     interactive = args.interactive and os.isatty(sys.stdin.fileno())
+    if args.update:
+        if args.poly:
+            ap.error("--update cannot be combined with --poly")
+        # the change file replaces the import
+        args._import = False
+    if args.tile_size and args.poly:
+        ap.error("--tile-size cannot be combined with --poly")
     if args._import and args.osmfile is None:
         ap.error("OSM source file required")
+    if args.importer is None:
+        native = args.osmfile is not None and (is_o5m(args.osmfile) or is_osm_xml(args.osmfile))
+        args.importer = 'native' if native else 'osm2pgsql'
+    if args._import and args.importer == 'native' and not args.poly and not args.filter \
+       and not (is_o5m(args.osmfile) or is_osm_xml(args.osmfile)):
+        ap.error("The native importer reads .osm and .o5m files; convert {0} with osmconvert or use --importer osm2pgsql".format(args.osmfile))
+    if args.compress == 'zstd' and zstandard is None:
+        ap.error("zstd compression requires the zstandard module")
+    export_options = dict(full_export=args.full_export, compression=args.compress)
+
+    config = read_config(os.path.join(BASE_DIR, 'src', 'defaults.conf'), 'gridkit.conf')
+    config['high_voltage'] = args.voltage
 
     if args.filter:
         if not OSMFILTER:
@@ -209,6 +675,11 @@ if __name__ == '__main__':
     # get effective database parameters
     db_params = dict((k[2:].lower(), v) for k, v in os.environ.items() if k.startswith('PG'))
     db_params.update(**dict(args.pg))
+    if args.update and not db_params.get('database'):
+        ap.error("--update requires the database to update, eg. --pg database=europe")
+    if args.explain is not None:
+        args.profile = True
+        db_params['options'] = ' '.join(filter(None, [db_params.get('options'), auto_explain_options(args.explain)]))
 
     # need 'root' database for polyfile based extraction
     if args.poly:
@@ -216,6 +687,8 @@ if __name__ == '__main__':
 
     pg_client = PgClient()
     pg_client.update_params(db_params)
+    if args.explain is not None:
+        pg_client.collect_notices()
 
     if pg_client.check_connection():
         logging.info("Connection OK")
@@ -227,38 +700,24 @@ if __name__ == '__main__':
         quit(1)
 
 
-    if OSM2PGSQL is None or not (os.path.isfile(OSM2PGSQL) and os.access(OSM2PGSQL, os.X_OK)):
-        logging.error("Cannot find osm2pgsql executable")
-        quit(1)
+    if (args._import and args.importer == 'osm2pgsql') or args.update:
+        if OSM2PGSQL is None or not (os.path.isfile(OSM2PGSQL) and os.access(OSM2PGSQL, os.X_OK)):
+            logging.error("Cannot find osm2pgsql executable")
+            quit(1)
 
 
     if args.poly:
-        osmfiles = dict()
+        areas = list()
         for polyfile in args.poly:
             if not os.path.isfile(polyfile):
                 logging.warn("%s is not a file", polyfile)
                 continue
-            polygon_name, ext = os.path.splitext(os.path.basename(polyfile))
-            osmfile_name, ext = os.path.splitext(osmfile)
-            osmfile_for_area = '{0}-{1}.o5m'.format(osmfile_name, polygon_name)
-            if os.path.isfile(osmfile_for_area) and file_age_cmp(osmfile_for_area, osmfile) < 0:
-                logging.info("File %s already exists and is newer than %s", osmfile_for_area, osmfile)
-            else:
-                logging.info("Extracting area %s from %s to make %s", polygon_name, osmfile, osmfile_for_area)
-                subprocess.check_call([OSMCONVERT, osmfile, '--complete-ways', '-B='+polyfile, '-o='+osmfile_for_area])
-            osmfiles[polygon_name] = osmfile_for_area
-
-        for area_name, area_osmfile in osmfiles.items():
-            # cleanup the name for use as a database name
-            database_name = 'gridkit_' + re.sub('[^A-Z0-9]+', '_', area_name, 0, re.I)
-            # select 'postgres' database for creating other databases
-            pg_client.update_params({'database':'postgres'})
-            pg_client.check_connection()
-            setup_database(pg_client, database_name, False)
-            # setup-database automatically uses the right connection
-            do_import(area_osmfile, database_name, db_params)
-            do_conversion(pg_client, args.voltage)
-            export_network_csv(pg_client, args.full_export, database_name)
+            log_file = area_database_name(polyfile) + '.log' if args.jobs > 1 else None
+            border   = simplified_polyfile(polyfile, args.poly_tolerance) if args.poly_tolerance > 0 else polyfile
+            areas.append((polyfile, border, osmfile, db_params, config, args.importer, OSM2PGSQL, export_options, args.stage_jobs,
+                          args.profile, args.explain is not None, log_file))
+        if not process_areas(areas, args.jobs):
+            quit(1)
 
     else:
         database_name = db_params.get('database') or db_params.get('postgres')
@@ -268,12 +727,35 @@ if __name__ == '__main__':
             database_name = re.sub(r'[^A-Z0-9_]+', '_', osmfile_name.lower(), 0, re.I)
         if args._import:
             database_name = setup_database(pg_client, database_name, interactive)
-            do_import(osmfile, database_name, db_params)
-        if args.convert:
+            if args.importer == 'native':
+                do_native_import(pg_client, osmfile)
+            else:
+                do_import(osmfile, database_name, db_params)
+            # a new import invalidates all conversion stages
+            read_stage_markers(pg_client)
+            clear_stage_markers(pg_client)
+        if args.update:
+            profiler = StageProfiler(args.explain is not None) if args.profile else None
+            try:
+                do_update(pg_client, config, args.update, database_name, db_params, profiler, args.stage_jobs)
+            except KeyboardInterrupt:
+                logging.warn("Execution interrupted - update is not finished")
+                quit(1)
+            finally:
+                if profiler is not None:
+                    profiler.write(database_name + '-profile.json')
+        elif args.convert:
+            profiler = StageProfiler(args.explain is not None) if args.profile else None
             try:
-                do_conversion(pg_client, args.voltage)
+                if args.tile_size:
+                    do_tiled_conversion(pg_client, config, args.tile_size, profiler, args.jobs, args.stage_jobs)
+                else:
+                    do_conversion(pg_client, config, args.resume, profiler, args.stage_jobs)
             except KeyboardInterrupt:
                 logging.warn("Execution interrupted - process is not finished")
                 quit(1)
+            finally:
+                if profiler is not None:
+                    profiler.write((database_name or 'gridkit') + '-profile.json')
         if args.export:
-            export_network_csv(pg_client, args.full_export, database_name or 'gridkit')
+            export_network_csv(pg_client, base_name=database_name or 'gridkit', **export_options)
@@ -16,7 +16,7 @@ insert into high_voltage_stations (station_id, station_location)
      select n.station_id, n.station_location
        from topology_nodes n
        join station_structure s on n.station_id = s.station_id
-      where 220000 <= any(s.voltage)
+      where :high_voltage <= any(s.voltage)
         and (not 16.7 = all(s.frequency) or array_length(s.frequency,1) is null);
 
 
@@ -26,7 +26,7 @@ insert into high_voltage_lines (line_id, line_extent)
      select e.line_id, line_extent
        from topology_edges e
        join line_structure l on l.line_id = e.line_id
-      where l.voltage >= 220000 and (l.frequency != 16.7 or l.frequency is null)
+      where l.voltage >= :high_voltage and (l.frequency != 16.7 or l.frequency is null)
 
       union
 
@@ -34,11 +34,11 @@ insert into high_voltage_lines (line_id, line_extent)
        from topology_edges e
        join station_structure a on a.station_id = e.station_id[1]
        join station_structure b on b.station_id = e.station_id[2]
-      where (not 220000 >= all(a.voltage) or array_length(a.voltage, 1) is null)
-        and (not 220000 >= all(b.voltage) or array_length(b.voltage, 1) is null)
+      where (not :high_voltage >= all(a.voltage) or array_length(a.voltage, 1) is null)
+        and (not :high_voltage >= all(b.voltage) or array_length(b.voltage, 1) is null)
         and (not 16.7 = all(a.frequency) or array_length(a.frequency, 1) is null)
         and (not 16.7 = all(b.frequency) or array_length(b.frequency, 1) is null)
-        and ( 220000 <= any(a.voltage) or 220000 <= any(b.voltage) );
+        and ( :high_voltage <= any(a.voltage) or :high_voltage <= any(b.voltage) );
 
 -- but we can have added lines to stations not in the high-voltage
 -- set, and that is not good
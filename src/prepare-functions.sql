@@ -57,4 +57,34 @@ begin
 end;
 $$ language plpgsql;
 
+drop table if exists power_type_names;
+
+/* lookup table for power types */
+create table power_type_names (
+    power_name varchar(64) primary key,
+    power_type char(1) not null,
+    check (power_type in ('s','l','g', 'v'))
+);
+
+-- all things recognised as power objects
+insert into power_type_names (power_name, power_type)
+    values ('station', 's'),
+           ('substation', 's'),
+           ('sub_station', 's'),
+           ('plant', 's'),
+           ('cable', 'l'),
+           ('line', 'l'),
+           ('minor_cable', 'l'),
+           ('minor_line', 'l'),
+           ('minor_undeground_cable', 'l'),
+           ('generator', 'g'),
+           ('gas generator', 'g'),
+           ('wind generator', 'g'),
+           ('hydro', 'g'),
+           ('hydroelectric', 'g'),
+           ('heliostat', 'g'),
+           -- virtual elements
+           ('merge', 'v'),
+           ('joint', 'v');
+
 commit;
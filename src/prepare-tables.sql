@@ -4,7 +4,6 @@ drop table if exists node_geometry;
 drop table if exists way_geometry;
 drop table if exists station_polygon;
 
-drop table if exists power_type_names;
 drop table if exists power_station;
 drop table if exists power_line;
 drop table if exists power_generator;
@@ -64,13 +63,6 @@ create table derived_objects (
      source_type char(1)
 );
 
-/* lookup table for power types */
-create table power_type_names (
-    power_name varchar(64) primary key,
-    power_type char(1) not null,
-    check (power_type in ('s','l','g', 'v'))
-);
-
 create table power_station (
     station_id integer primary key,
     power_name varchar(64) not null,
@@ -102,29 +94,6 @@ create table power_generator (
 
 create index power_generator_location_idx on power_generator using gist(location);
 
--- all things recognised as power objects
-insert into power_type_names (power_name, power_type)
-    values ('station', 's'),
-           ('substation', 's'),
-           ('sub_station', 's'),
-           ('plant', 's'),
-           ('cable', 'l'),
-           ('line', 'l'),
-           ('minor_cable', 'l'),
-           ('minor_line', 'l'),
-           ('minor_undeground_cable', 'l'),
-           ('generator', 'g'),
-           ('gas generator', 'g'),
-           ('wind generator', 'g'),
-           ('hydro', 'g'),
-           ('hydroelectric', 'g'),
-           ('heliostat', 'g'),
-           -- virtual elements
-           ('merge', 'v'),
-           ('joint', 'v');
-
-
-
 -- we could read this out of the planet_osm_point table, but i'd
 -- prefer calculating under my own control.
 insert into node_geometry (node_id, point)
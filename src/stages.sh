@@ -0,0 +1,25 @@
+# run_stages MANIFEST: run the stages listed in a stage manifest (see
+# src/stages.conf) in order, with psql variables taken from the
+# GRIDKIT_ settings; stops at the first failing stage
+run_stages() {
+    local manifest=$1
+    local base_dir=$(dirname "$1")
+    local stage variables inputs outputs name setting
+    while read -r stage variables inputs outputs
+    do
+        case "$stage" in
+            ''|'#'*) continue ;;
+        esac
+        local psql_variables=()
+        if [ "$variables" != "-" ]
+        then
+            for name in ${variables//,/ }
+            do
+                setting=GRIDKIT_${name^^}
+                psql_variables+=(-v "$name=${!setting}")
+            done
+        fi
+        psql -v ON_ERROR_STOP=1 "${psql_variables[@]}" \
+             -f "$base_dir/$stage" < /dev/null || return 1
+    done < "$manifest"
+}
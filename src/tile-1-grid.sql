@@ -0,0 +1,71 @@
+/* divide the power objects over a grid of square tiles, each of which
+ * is converted separately; the region of a tile includes a margin, so
+ * that objects near its edges are converted with their surroundings */
+begin;
+drop table if exists conversion_tiles;
+drop table if exists tile_objects;
+
+create table conversion_tiles (
+    tile_id integer primary key,
+    core    geometry(polygon, 3857) not null,
+    region  geometry(polygon, 3857) not null,
+    -- identifiers of the tile are shifted past those of earlier tiles
+    station_offset   integer,
+    station_count    integer,
+    line_offset      integer,
+    line_count       integer,
+    generator_offset integer,
+    generator_count  integer
+);
+
+create table tile_objects (
+    tile_id  integer not null,
+    osm_id   bigint not null,
+    osm_type char(1) not null
+);
+
+create temporary table tile_power_objects (
+    osm_id   bigint not null,
+    osm_type char(1) not null,
+    geometry geometry(geometry, 3857) not null
+) on commit drop;
+
+insert into tile_power_objects (osm_id, osm_type, geometry)
+     select n.id, 'n', st_setsrid(st_makepoint(n.lon/100.0, n.lat/100.0), 3857)
+       from planet_osm_nodes n
+       join power_type_names t on hstore(n.tags)->'power' = t.power_name;
+
+insert into tile_power_objects (osm_id, osm_type, geometry)
+     select w.id, 'w', st_collect(st_setsrid(st_makepoint(n.lon/100.0, n.lat/100.0), 3857))
+       from planet_osm_ways w
+       join power_type_names t on hstore(w.tags)->'power' = t.power_name
+       join planet_osm_nodes n on n.id = any(w.nodes)
+      group by w.id;
+
+create index tile_power_objects_geometry on tile_power_objects using gist (geometry);
+
+insert into conversion_tiles (tile_id, core, region)
+     select row_number() over (order by y, x), t.core, st_expand(t.core, :tile_margin)
+       from (
+            select st_xmin(e.extent), st_ymin(e.extent), st_xmax(e.extent), st_ymax(e.extent)
+              from (select st_extent(geometry) from tile_power_objects) e (extent)
+       ) e (xmin, ymin, xmax, ymax),
+       generate_series(floor(e.xmin / :tile_size)::bigint * :tile_size, e.xmax::bigint, :tile_size) x,
+       generate_series(floor(e.ymin / :tile_size)::bigint * :tile_size, e.ymax::bigint, :tile_size) y,
+       lateral (select st_makeenvelope(x, y, x + :tile_size, y + :tile_size, 3857)) t (core);
+
+insert into tile_objects (tile_id, osm_id, osm_type)
+     select t.tile_id, o.osm_id, o.osm_type
+       from conversion_tiles t
+       join tile_power_objects o on st_intersects(o.geometry, t.region);
+
+-- there is nothing to convert in much of the world
+delete from conversion_tiles t
+      where not exists (select 1 from tile_objects o
+                         join tile_power_objects p on p.osm_id = o.osm_id and p.osm_type = o.osm_type
+                        where o.tile_id = t.tile_id and st_intersects(p.geometry, t.core));
+delete from tile_objects o
+      where not exists (select 1 from conversion_tiles t where t.tile_id = o.tile_id);
+
+create index tile_objects_tile_id on tile_objects (tile_id);
+commit;
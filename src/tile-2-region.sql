@@ -0,0 +1,16 @@
+/* copy the power objects in the region of a tile into the schema of
+ * the tile, where the conversion stages run for just this tile */
+begin;
+drop schema if exists :tile_schema cascade;
+create schema :tile_schema;
+
+-- the ways complete with all their nodes
+create table :tile_schema.planet_osm_ways as
+     select w.* from planet_osm_ways w
+      where w.id in (select osm_id from tile_objects where tile_id = :tile_id and osm_type = 'w');
+
+create table :tile_schema.planet_osm_nodes as
+     select n.* from planet_osm_nodes n
+      where n.id in (select unnest(nodes) from :tile_schema.planet_osm_ways)
+         or n.id in (select osm_id from tile_objects where tile_id = :tile_id and osm_type = 'n');
+commit;
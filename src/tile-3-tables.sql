@@ -0,0 +1,64 @@
+/* the tables that the tiles are stitched into, shaped like those of
+ * (any) one tile */
+begin;
+drop table if exists node_geometry;
+drop table if exists way_geometry;
+drop table if exists source_objects;
+drop table if exists source_tags;
+drop table if exists derived_objects;
+drop table if exists power_station;
+drop table if exists power_line;
+drop table if exists power_generator;
+drop table if exists topology_nodes;
+drop table if exists topology_edges;
+drop table if exists topology_generators;
+drop table if exists tile_topology_nodes;
+drop table if exists tile_topology_edges;
+drop table if exists tile_topology_generators;
+
+drop sequence if exists station_id;
+drop sequence if exists line_id;
+drop sequence if exists generator_id;
+
+create sequence station_id;
+create sequence line_id;
+create sequence generator_id;
+
+create table node_geometry       (like :tile_schema.node_geometry including all);
+create table way_geometry        (like :tile_schema.way_geometry including all);
+create table source_objects      (like :tile_schema.source_objects including all);
+create table source_tags         (like :tile_schema.source_tags including all);
+create table derived_objects     (like :tile_schema.derived_objects including all);
+create table power_station       (like :tile_schema.power_station including all);
+create table power_line          (like :tile_schema.power_line including all);
+create table power_generator     (like :tile_schema.power_generator including all);
+create table topology_nodes      (like :tile_schema.topology_nodes including all);
+create table topology_edges      (like :tile_schema.topology_edges including all);
+create table topology_generators (like :tile_schema.topology_generators including all);
+
+-- network elements of all tiles, identified by the OSM objects they
+-- were derived from; owned elements lie in the core of their tile
+create table tile_topology_nodes (
+    tile_id          integer not null,
+    station_id       integer primary key,
+    station_location geometry(point, 3857),
+    topology_name    varchar(64),
+    osm_key          text not null,
+    owned            boolean not null
+);
+
+create table tile_topology_edges (
+    tile_id       integer not null,
+    line_id       integer primary key,
+    station_id    integer array,
+    line_extent   geometry(linestring, 3857),
+    topology_name varchar(64),
+    osm_key       text not null,
+    owned         boolean not null
+);
+
+create table tile_topology_generators (
+    station_id   integer not null,
+    generator_id integer not null
+);
+commit;
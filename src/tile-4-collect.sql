@@ -0,0 +1,149 @@
+/* collect the result of one tile; identifiers in each tile start from
+ * 1 again, so they are shifted past those of the tiles before */
+begin;
+update conversion_tiles
+   set station_count    = (select last_value from :tile_schema.station_id),
+       line_count       = (select last_value from :tile_schema.line_id),
+       generator_count  = (select last_value from :tile_schema.generator_id),
+       station_offset   = (select coalesce(max(station_offset + station_count), 0) from conversion_tiles),
+       line_offset      = (select coalesce(max(line_offset + line_count), 0) from conversion_tiles),
+       generator_offset = (select coalesce(max(generator_offset + generator_count), 0) from conversion_tiles)
+ where tile_id = :tile_id;
+
+-- the history of the objects this tile keeps (those in its core), so
+-- that the electric stages can trace lines and stations back to their
+-- tags; objects near the border have a history in the neighbouring
+-- tiles as well, which is left there
+create temporary table tile_lineage (
+    power_id   integer not null,
+    power_type char(1) not null,
+    primary key (power_id, power_type)
+) on commit drop;
+
+insert into tile_lineage (power_id, power_type)
+with recursive lineage (power_id, power_type) as (
+     select k.power_id, k.power_type from (
+            select s.station_id, 's'::char(1) from :tile_schema.power_station s, conversion_tiles o
+             where o.tile_id = :tile_id and st_intersects(st_pointonsurface(s.area), o.core)
+             union
+            select l.line_id, 'l'::char(1) from :tile_schema.power_line l, conversion_tiles o
+             where o.tile_id = :tile_id and st_intersects(st_lineinterpolatepoint(l.extent, 0.5), o.core)
+             union
+            select n.station_id, 's'::char(1) from :tile_schema.topology_nodes n, conversion_tiles o
+             where o.tile_id = :tile_id and st_intersects(n.station_location, o.core)
+             union
+            select e.line_id, 'l'::char(1) from :tile_schema.topology_edges e, conversion_tiles o
+             where o.tile_id = :tile_id and st_intersects(st_lineinterpolatepoint(e.line_extent, 0.5), o.core)
+     ) k (power_id, power_type)
+     union
+     select s.id, d.source_type
+       from lineage l
+       join :tile_schema.derived_objects d on d.derived_id = l.power_id and d.derived_type = l.power_type
+      cross join unnest(d.source_id) s (id)
+)
+     select power_id, power_type from lineage;
+
+-- an OSM object kept in more than one tile (a line crossing the
+-- border, split in both) is traced from the first
+insert into source_objects (osm_id, osm_type, power_id, power_type)
+     select s.osm_id, s.osm_type,
+            s.power_id + case s.power_type when 's' then o.station_offset else o.line_offset end,
+            s.power_type
+       from :tile_schema.source_objects s
+       join tile_lineage k on k.power_id = s.power_id and k.power_type = s.power_type
+       join conversion_tiles o on o.tile_id = :tile_id
+      where not exists (select 1 from source_objects p where p.osm_id = s.osm_id and p.osm_type = s.osm_type);
+
+insert into source_tags (power_id, power_type, tags)
+     select t.power_id + case t.power_type when 's' then o.station_offset else o.line_offset end,
+            t.power_type, t.tags
+       from :tile_schema.source_tags t
+       join tile_lineage k on k.power_id = t.power_id and k.power_type = t.power_type
+       join conversion_tiles o on o.tile_id = :tile_id;
+
+insert into derived_objects (derived_id, derived_type, operation, source_id, source_type)
+     select d.derived_id + case d.derived_type when 's' then o.station_offset else o.line_offset end,
+            d.derived_type, d.operation,
+            array(select i + case d.source_type when 's' then o.station_offset else o.line_offset end
+                    from unnest(d.source_id) i),
+            d.source_type
+       from :tile_schema.derived_objects d
+       join tile_lineage k on k.power_id = d.derived_id and k.power_type = d.derived_type
+       join conversion_tiles o on o.tile_id = :tile_id;
+
+insert into node_geometry (node_id, point)
+     select g.node_id, g.point from :tile_schema.node_geometry g
+      where not exists (select 1 from node_geometry p where p.node_id = g.node_id);
+
+insert into way_geometry (way_id, line)
+     select g.way_id, g.line from :tile_schema.way_geometry g
+      where not exists (select 1 from way_geometry p where p.way_id = g.way_id);
+
+-- power objects in the core of the tile
+insert into power_station (station_id, power_name, area)
+     select s.station_id + o.station_offset, s.power_name, s.area
+       from :tile_schema.power_station s, conversion_tiles o
+      where o.tile_id = :tile_id and st_intersects(st_pointonsurface(s.area), o.core);
+
+insert into power_line (line_id, power_name, extent, radius)
+     select l.line_id + o.line_offset, l.power_name, l.extent, l.radius
+       from :tile_schema.power_line l, conversion_tiles o
+      where o.tile_id = :tile_id and st_intersects(st_lineinterpolatepoint(l.extent, 0.5), o.core);
+
+insert into power_generator (generator_id, osm_id, osm_type, geometry, location, tags)
+     select g.generator_id + o.generator_offset, g.osm_id, g.osm_type, g.geometry, g.location, g.tags
+       from :tile_schema.power_generator g, conversion_tiles o
+      where o.tile_id = :tile_id and st_intersects(g.location, o.core)
+        and not exists (select 1 from power_generator p where p.osm_id = g.osm_id and p.osm_type = g.osm_type);
+
+-- network elements, identified by the OSM objects they derive from
+insert into tile_topology_nodes (tile_id, station_id, station_location, topology_name, osm_key, owned)
+with recursive lineage (element_id, power_id, power_type) as (
+     select station_id, station_id, 's'::char(1) from :tile_schema.topology_nodes
+     union
+     select l.element_id, s.id, d.source_type
+       from lineage l
+       join :tile_schema.derived_objects d on d.derived_id = l.power_id and d.derived_type = l.power_type
+      cross join unnest(d.source_id) s (id)
+), osm_keys (element_id, osm_key) as (
+     select l.element_id, string_agg(distinct so.osm_type || so.osm_id, ',' order by so.osm_type || so.osm_id)
+       from lineage l
+       join :tile_schema.source_objects so on so.power_id = l.power_id and so.power_type = l.power_type
+      group by l.element_id
+)
+     select o.tile_id, n.station_id + o.station_offset, n.station_location, n.topology_name,
+            coalesce(k.osm_key, 'tile ' || o.tile_id || ' station ' || n.station_id),
+            st_intersects(n.station_location, o.core)
+       from :tile_schema.topology_nodes n
+       join conversion_tiles o on o.tile_id = :tile_id
+  left join osm_keys k on k.element_id = n.station_id;
+
+insert into tile_topology_edges (tile_id, line_id, station_id, line_extent, topology_name, osm_key, owned)
+with recursive lineage (element_id, power_id, power_type) as (
+     select line_id, line_id, 'l'::char(1) from :tile_schema.topology_edges
+     union
+     select l.element_id, s.id, d.source_type
+       from lineage l
+       join :tile_schema.derived_objects d on d.derived_id = l.power_id and d.derived_type = l.power_type
+      cross join unnest(d.source_id) s (id)
+), osm_keys (element_id, osm_key) as (
+     select l.element_id, string_agg(distinct so.osm_type || so.osm_id, ',' order by so.osm_type || so.osm_id)
+       from lineage l
+       join :tile_schema.source_objects so on so.power_id = l.power_id and so.power_type = l.power_type
+      group by l.element_id
+)
+     select o.tile_id, e.line_id + o.line_offset,
+            array(select i + o.station_offset from unnest(e.station_id) with ordinality s (i, n) order by s.n),
+            e.line_extent, e.topology_name,
+            coalesce(k.osm_key, 'tile ' || o.tile_id || ' line ' || e.line_id),
+            st_intersects(st_lineinterpolatepoint(e.line_extent, 0.5), o.core)
+       from :tile_schema.topology_edges e
+       join conversion_tiles o on o.tile_id = :tile_id
+  left join osm_keys k on k.element_id = e.line_id;
+
+insert into tile_topology_generators (station_id, generator_id)
+     select g.station_id + o.station_offset, g.generator_id + o.generator_offset
+       from :tile_schema.topology_generators g
+       join conversion_tiles o on o.tile_id = :tile_id
+      where g.generator_id + o.generator_offset in (select generator_id from power_generator);
+commit;
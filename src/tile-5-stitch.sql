@@ -0,0 +1,80 @@
+/* stitch the network elements of the tiles together. Each element is
+ * taken from the tile that owns it, once per set of OSM objects it is
+ * derived from; lines crossing the border of a tile are connected to
+ * the stations of the neighbouring tile by the same OSM objects. */
+begin;
+drop table if exists tile_station_map;
+
+create table tile_station_map (
+    station_id integer primary key,
+    network_id integer
+);
+
+create index tile_topology_nodes_osm_key on tile_topology_nodes (osm_key);
+create index tile_topology_nodes_location on tile_topology_nodes using gist (station_location);
+
+insert into topology_nodes (station_id, line_id, station_location, topology_name)
+     select distinct on (osm_key) station_id, array[]::integer[], station_location, topology_name
+       from tile_topology_nodes
+      where owned
+      order by osm_key, tile_id;
+
+insert into topology_edges (line_id, station_id, line_extent, topology_name)
+     select distinct on (osm_key) line_id, station_id, line_extent, topology_name
+       from tile_topology_edges
+      where owned
+      order by osm_key, tile_id;
+
+-- stations of the tiles to stations of the network, by their OSM
+-- objects, or else by location
+insert into tile_station_map (station_id, network_id)
+     select t.station_id, coalesce(
+            (select n.station_id from tile_topology_nodes c
+               join topology_nodes n on n.station_id = c.station_id
+              where c.osm_key = t.osm_key limit 1),
+            (select n.station_id from topology_nodes n
+              where st_dwithin(n.station_location, t.station_location, 1)
+              order by n.station_location <-> t.station_location limit 1)
+       ) from tile_topology_nodes t;
+
+-- anything unmatched that a line ends at is added after all
+insert into topology_nodes (station_id, line_id, station_location, topology_name)
+     select t.station_id, array[]::integer[], t.station_location, t.topology_name
+       from tile_topology_nodes t
+       join tile_station_map m on m.station_id = t.station_id
+      where m.network_id is null
+        and t.station_id in (select unnest(station_id) from topology_edges);
+
+update tile_station_map set network_id = station_id
+ where network_id is null and station_id in (select station_id from topology_nodes);
+
+update topology_edges e
+   set station_id = array(select m.network_id from unnest(e.station_id) with ordinality s (id, n)
+                            join tile_station_map m on m.station_id = s.id order by s.n);
+
+update topology_nodes n
+   set line_id = array(select e.line_id from topology_edges e where n.station_id = any(e.station_id));
+
+delete from topology_nodes where line_id = array[]::integer[];
+
+insert into topology_generators (station_id, generator_id)
+     select distinct m.network_id, g.generator_id
+       from tile_topology_generators g
+       join tile_station_map m on m.station_id = g.station_id
+      where m.network_id in (select station_id from topology_nodes);
+
+do $$
+begin
+    perform setval('station_id', max(station_offset + station_count)),
+            setval('line_id', max(line_offset + line_count)),
+            setval('generator_id', max(generator_offset + generator_count))
+       from conversion_tiles;
+end
+$$ language plpgsql;
+
+drop table tile_topology_nodes;
+drop table tile_topology_edges;
+drop table tile_topology_generators;
+drop table tile_station_map;
+drop table tile_objects;
+commit;
@@ -0,0 +1,82 @@
+/* find the area affected by the changes in update_changes, which have
+ * been applied to the planet_osm tables; node_geometry, way_geometry
+ * and the power tables still describe the network before the update */
+begin;
+drop table if exists update_objects;
+drop table if exists update_geometry;
+drop table if exists update_area;
+
+create table update_objects (
+    osm_id   bigint not null,
+    osm_type char(1) not null,
+    primary key (osm_id, osm_type)
+);
+
+create table update_geometry (
+    geometry geometry(geometry, 3857) not null
+);
+
+create table update_area (
+    affected geometry(geometry, 3857),
+    region   geometry(geometry, 3857)
+);
+
+-- changed objects that were or are power objects
+insert into update_objects (osm_id, osm_type)
+     select distinct c.osm_id, c.osm_type from update_changes c
+      where exists (select 1 from source_objects o where o.osm_id = c.osm_id and o.osm_type = c.osm_type)
+         or exists (select 1 from power_generator g where g.osm_id = c.osm_id and g.osm_type = c.osm_type)
+         or exists (select 1 from planet_osm_nodes n
+                      join power_type_names t on hstore(n.tags)->'power' = t.power_name
+                     where c.osm_type = 'n' and n.id = c.osm_id)
+         or exists (select 1 from planet_osm_ways w
+                      join power_type_names t on hstore(w.tags)->'power' = t.power_name
+                     where c.osm_type = 'w' and w.id = c.osm_id);
+
+-- power ways change shape when any of their nodes moves
+insert into update_objects (osm_id, osm_type)
+     select w.id, 'w' from planet_osm_ways w
+       join power_type_names t on hstore(w.tags)->'power' = t.power_name
+      where w.nodes && array(select osm_id from update_changes where osm_type = 'n')
+        and not exists (select 1 from update_objects u where u.osm_id = w.id and u.osm_type = 'w');
+
+-- geometry before the update
+insert into update_geometry (geometry)
+     select g.point from node_geometry g
+       join update_objects u on u.osm_type = 'n' and u.osm_id = g.node_id;
+
+insert into update_geometry (geometry)
+     select g.line from way_geometry g
+       join update_objects u on u.osm_type = 'w' and u.osm_id = g.way_id;
+
+-- geometry after the update
+insert into update_geometry (geometry)
+     select st_setsrid(st_makepoint(n.lon/100.0, n.lat/100.0), 3857)
+       from planet_osm_nodes n
+       join update_objects u on u.osm_type = 'n' and u.osm_id = n.id;
+
+insert into update_geometry (geometry)
+     select st_collect(st_setsrid(st_makepoint(n.lon/100.0, n.lat/100.0), 3857))
+       from planet_osm_ways w
+       join update_objects u on u.osm_type = 'w' and u.osm_id = w.id
+       join planet_osm_nodes n on n.id = any(w.nodes)
+      group by w.id;
+
+-- whole stations and (merged) lines must be recomputed, so include
+-- the objects derived from the changed ones, plus their terminals
+insert into update_area (affected)
+     select st_buffer(st_union(g.geometry), :terminal_radius) from (
+            select geometry from update_geometry
+            union all
+            select l.extent from power_line l
+             where exists (select 1 from update_geometry u where st_intersects(l.extent, u.geometry))
+            union all
+            select s.area from power_station s
+             where exists (select 1 from update_geometry u where st_intersects(s.area, u.geometry))
+       ) g (geometry)
+     having count(*) > 0;
+
+-- the region is recomputed, so that the affected area sees the same
+-- surroundings as in a complete conversion
+update update_area set region = st_buffer(affected, :update_buffer);
+commit;
@@ -0,0 +1,24 @@
+/* copy the power objects in the update region into a separate schema,
+ * where the conversion stages can be repeated for just this region */
+begin;
+drop schema if exists gridkit_update cascade;
+create schema gridkit_update;
+
+-- power ways with any node in the region, complete with all their nodes
+create table gridkit_update.planet_osm_ways as
+     select w.* from planet_osm_ways w
+       join power_type_names t on hstore(w.tags)->'power' = t.power_name
+      where exists (
+            select 1 from planet_osm_nodes n, update_area a
+             where n.id = any(w.nodes)
+               and st_intersects(st_setsrid(st_makepoint(n.lon/100.0, n.lat/100.0), 3857), a.region)
+      );
+
+create table gridkit_update.planet_osm_nodes as
+     select n.* from planet_osm_nodes n
+      where n.id in (select unnest(nodes) from gridkit_update.planet_osm_ways)
+     union
+     select n.* from planet_osm_nodes n
+       join power_type_names t on hstore(n.tags)->'power' = t.power_name
+       join update_area a on st_intersects(st_setsrid(st_makepoint(n.lon/100.0, n.lat/100.0), 3857), a.region);
+commit;
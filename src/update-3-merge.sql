@@ -0,0 +1,294 @@
+/* replace the network in the affected area with the one computed for
+ * the update region (in the gridkit_update schema). Identifiers in the
+ * region start from 1 again, so they are shifted past those in use. */
+begin;
+drop table if exists update_offsets;
+drop table if exists update_removed_nodes;
+drop table if exists update_removed_edges;
+drop table if exists update_added_nodes;
+drop table if exists update_added_edges;
+drop table if exists update_station_map;
+
+create table update_offsets as
+     select (select last_value from station_id) as station_offset,
+            (select last_value from line_id) as line_offset,
+            (select last_value from generator_id) as generator_offset;
+
+create table update_removed_nodes (
+    station_id integer primary key
+);
+
+create table update_removed_edges (
+    line_id integer primary key
+);
+
+create table update_added_nodes (
+    station_id integer primary key
+);
+
+create table update_added_edges (
+    line_id integer primary key
+);
+
+-- region station id to network station id
+create table update_station_map (
+    region_id  integer primary key,
+    station_id integer
+);
+
+insert into update_removed_nodes (station_id)
+     select n.station_id from topology_nodes n, update_area a
+      where st_intersects(n.station_location, a.affected);
+
+insert into update_removed_edges (line_id)
+     select e.line_id from topology_edges e, update_area a
+      where st_intersects(e.line_extent, a.affected)
+         or e.station_id && array(select station_id from update_removed_nodes);
+
+insert into update_added_nodes (station_id)
+     select n.station_id from gridkit_update.topology_nodes n, update_area a
+      where st_intersects(n.station_location, a.affected);
+
+insert into update_added_edges (line_id)
+     select e.line_id from gridkit_update.topology_edges e, update_area a
+      where st_intersects(e.line_extent, a.affected)
+         or e.station_id && array(select station_id from update_added_nodes);
+
+-- added lines may end at stations outside the affected area, which are
+-- already in the network; these are at the same location
+insert into update_station_map (region_id, station_id)
+     select station_id, station_id + o.station_offset
+       from update_added_nodes, update_offsets o;
+
+insert into update_station_map (region_id, station_id)
+     select r.station_id, (
+            select n.station_id from topology_nodes n
+             where n.station_id not in (select station_id from update_removed_nodes)
+               and st_dwithin(n.station_location, r.station_location, 1)
+             order by n.station_location <-> r.station_location limit 1
+       ) from gridkit_update.topology_nodes r
+      where r.station_id in (select unnest(station_id) from gridkit_update.topology_edges e
+                               join update_added_edges a on a.line_id = e.line_id)
+        and r.station_id not in (select station_id from update_added_nodes);
+
+-- anything unmatched is added after all
+insert into update_added_nodes (station_id)
+     select region_id from update_station_map where station_id is null;
+
+update update_station_map m set station_id = m.region_id + o.station_offset
+  from update_offsets o where m.station_id is null;
+
+-- network elements
+delete from topology_edges where line_id in (select line_id from update_removed_edges);
+delete from topology_nodes where station_id in (select station_id from update_removed_nodes);
+delete from topology_generators g
+      where g.station_id in (select station_id from update_removed_nodes)
+         or g.generator_id in (select generator_id from power_generator p, update_area a
+                                where st_intersects(p.location, a.affected));
+
+insert into topology_edges (line_id, station_id, line_extent, topology_name)
+     select e.line_id + o.line_offset,
+            array(select m.station_id from unnest(e.station_id) s(id)
+                    join update_station_map m on m.region_id = s.id),
+            e.line_extent, e.topology_name
+       from gridkit_update.topology_edges e
+       join update_added_edges a on a.line_id = e.line_id, update_offsets o;
+
+insert into topology_nodes (station_id, line_id, station_location, topology_name)
+     select m.station_id, array[]::integer[], n.station_location, n.topology_name
+       from gridkit_update.topology_nodes n
+       join update_added_nodes a on a.station_id = n.station_id
+       join update_station_map m on m.region_id = n.station_id;
+
+-- lines of all stations that lost or gained any
+update topology_nodes n
+   set line_id = array(select e.line_id from topology_edges e where n.station_id = any(e.station_id))
+ where n.station_id in (select station_id from update_station_map)
+    or n.line_id && array(select line_id from update_removed_edges);
+
+insert into topology_generators (station_id, generator_id)
+     select m.station_id, g.generator_id + o.generator_offset
+       from gridkit_update.topology_generators g
+       join gridkit_update.power_generator p on p.generator_id = g.generator_id
+       join update_station_map m on m.region_id = g.station_id, update_area a, update_offsets o
+      where st_intersects(p.location, a.affected);
+
+-- power objects in the affected area
+-- the objects replaced, whose history goes with them
+create temporary table update_removed_objects (
+    power_id   integer not null,
+    power_type char(1) not null,
+    primary key (power_id, power_type)
+) on commit drop;
+
+with removed as (
+     delete from power_station s using update_area a where st_intersects(s.area, a.affected)
+     returning s.station_id
+)
+insert into update_removed_objects (power_id, power_type)
+     select station_id, 's' from removed;
+
+with removed as (
+     delete from power_line l using update_area a where st_intersects(l.extent, a.affected)
+     returning l.line_id
+)
+insert into update_removed_objects (power_id, power_type)
+     select line_id, 'l' from removed;
+delete from power_generator g using update_area a where st_intersects(g.location, a.affected);
+
+insert into power_station (station_id, power_name, area)
+     select s.station_id + o.station_offset, s.power_name, s.area
+       from gridkit_update.power_station s, update_area a, update_offsets o
+      where st_intersects(s.area, a.affected);
+
+insert into power_line (line_id, power_name, extent, radius)
+     select l.line_id + o.line_offset, l.power_name, l.extent, l.radius
+       from gridkit_update.power_line l, update_area a, update_offsets o
+      where st_intersects(l.extent, a.affected);
+
+insert into power_generator (generator_id, osm_id, osm_type, geometry, location, tags)
+     select g.generator_id + o.generator_offset, g.osm_id, g.osm_type, g.geometry, g.location, g.tags
+       from gridkit_update.power_generator g, update_area a, update_offsets o
+      where st_intersects(g.location, a.affected);
+
+-- the electric stages trace lines and stations back to their tags
+-- through derived_objects, so keep the history of the objects merged
+-- in the affected area; that of the rest of the region stays as it is
+create temporary table update_lineage (
+    power_id   integer not null,
+    power_type char(1) not null,
+    primary key (power_id, power_type)
+) on commit drop;
+
+insert into update_lineage (power_id, power_type)
+with recursive lineage (power_id, power_type) as (
+     select k.power_id, k.power_type from (
+            select s.station_id, 's'::char(1) from gridkit_update.power_station s, update_area a
+             where st_intersects(s.area, a.affected)
+             union
+            select l.line_id, 'l'::char(1) from gridkit_update.power_line l, update_area a
+             where st_intersects(l.extent, a.affected)
+             union
+            select station_id, 's'::char(1) from update_added_nodes
+             union
+            select line_id, 'l'::char(1) from update_added_edges
+     ) k (power_id, power_type)
+     union
+     select s.id, d.source_type
+       from lineage l
+       join gridkit_update.derived_objects d on d.derived_id = l.power_id and d.derived_type = l.power_type
+      cross join unnest(d.source_id) s (id)
+)
+     select power_id, power_type from lineage;
+
+-- the history of the removed stations, lines and network elements,
+-- except for what objects that remain were derived from as well
+create temporary table update_removed_lineage (
+    power_id   integer not null,
+    power_type char(1) not null,
+    primary key (power_id, power_type)
+) on commit drop;
+
+insert into update_removed_lineage (power_id, power_type)
+with recursive lineage (power_id, power_type) as (
+     select k.power_id, k.power_type from (
+            select power_id, power_type from update_removed_objects
+             union
+            select station_id, 's'::char(1) from update_removed_nodes
+             union
+            select line_id, 'l'::char(1) from update_removed_edges
+     ) k (power_id, power_type)
+     union
+     select s.id, d.source_type
+       from lineage l
+       join derived_objects d on d.derived_id = l.power_id and d.derived_type = l.power_type
+      cross join unnest(d.source_id) s (id)
+)
+     select power_id, power_type from lineage;
+
+create temporary table update_lineage_uses (
+    derived_id   integer not null,
+    derived_type char(1) not null,
+    power_id     integer not null,
+    power_type   char(1) not null
+) on commit drop;
+
+insert into update_lineage_uses (derived_id, derived_type, power_id, power_type)
+     select d.derived_id, d.derived_type, s.id, d.source_type
+       from derived_objects d
+      cross join unnest(d.source_id) s (id)
+       join update_removed_lineage r on r.power_id = s.id and r.power_type = d.source_type;
+
+do $$
+begin
+    loop
+        delete from update_removed_lineage r
+         where exists (select 1 from update_lineage_uses u
+                        where u.power_id = r.power_id and u.power_type = r.power_type
+                          and not exists (select 1 from update_removed_lineage x
+                                           where x.power_id = u.derived_id and x.power_type = u.derived_type));
+        exit when not found;
+    end loop;
+end
+$$ language plpgsql;
+
+delete from source_objects s using update_removed_lineage r
+ where s.power_id = r.power_id and s.power_type = r.power_type;
+delete from source_tags t using update_removed_lineage r
+ where t.power_id = r.power_id and t.power_type = r.power_type;
+delete from derived_objects d using update_removed_lineage r
+ where d.derived_id = r.power_id and d.derived_type = r.power_type;
+
+delete from source_objects where (osm_id, osm_type) in (
+       select s.osm_id, s.osm_type from gridkit_update.source_objects s
+         join update_lineage k on k.power_id = s.power_id and k.power_type = s.power_type
+       union all
+       select osm_id, osm_type from update_changes
+);
+
+insert into source_objects (osm_id, osm_type, power_id, power_type)
+     select s.osm_id, s.osm_type,
+            s.power_id + case s.power_type when 's' then o.station_offset else o.line_offset end,
+            s.power_type
+       from gridkit_update.source_objects s
+       join update_lineage k on k.power_id = s.power_id and k.power_type = s.power_type, update_offsets o
+      where not exists (select 1 from source_objects p where p.osm_id = s.osm_id and p.osm_type = s.osm_type);
+
+insert into source_tags (power_id, power_type, tags)
+     select t.power_id + case t.power_type when 's' then o.station_offset else o.line_offset end,
+            t.power_type, t.tags
+       from gridkit_update.source_tags t
+       join update_lineage k on k.power_id = t.power_id and k.power_type = t.power_type, update_offsets o;
+
+insert into derived_objects (derived_id, derived_type, operation, source_id, source_type)
+     select d.derived_id + case d.derived_type when 's' then o.station_offset else o.line_offset end,
+            d.derived_type, d.operation,
+            array(select i + case d.source_type when 's' then o.station_offset else o.line_offset end
+                    from unnest(d.source_id) i),
+            d.source_type
+       from gridkit_update.derived_objects d
+       join update_lineage k on k.power_id = d.derived_id and k.power_type = d.derived_type, update_offsets o;
+
+-- keep node and way geometry current for the next update
+delete from node_geometry where node_id in (
+       select node_id from gridkit_update.node_geometry
+       union all
+       select osm_id from update_changes where osm_type = 'n'
+);
+delete from way_geometry where way_id in (
+       select way_id from gridkit_update.way_geometry
+       union all
+       select osm_id from update_changes where osm_type = 'w'
+);
+insert into node_geometry (node_id, point) select node_id, point from gridkit_update.node_geometry;
+insert into way_geometry (way_id, line) select way_id, line from gridkit_update.way_geometry;
+
+do $$
+begin
+    perform setval('station_id', o.station_offset + (select last_value from gridkit_update.station_id)),
+            setval('line_id', o.line_offset + (select last_value from gridkit_update.line_id)),
+            setval('generator_id', o.generator_offset + (select last_value from gridkit_update.generator_id))
+       from update_offsets o;
+end
+$$ language plpgsql;
+commit;
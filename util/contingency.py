@@ -0,0 +1,186 @@
+"""N-1 contingency screening with linear sensitivities.
+
+The power transfer distribution factors (PTDF) give the change of the
+branch flows for a transfer of power between two buses; the line outage
+distribution factors (LODF) follow from them, and give the flows after
+the outage of a line without solving the power flow again. The
+branches are those of DCPowerFlow, and an outage of a line takes out
+the branches of all its voltages.
+"""
+from __future__ import unicode_literals, division, print_function
+import math
+import collections
+import numpy
+from powerflow import DCPowerFlow
+
+Overload = collections.namedtuple('Overload', 'outage line_id voltage flow limit loading')
+Screening = collections.namedtuple('Screening', 'overloads islanding')
+
+# an outage that carries all of the transfer across its own branches
+# separates the island
+ISLANDING_TOLERANCE = 1e-9
+
+
+class ContingencyAnalysis(object):
+    """Sensitivities and outage screening of a network.
+
+    The islands are factorized together by DCPowerFlow, so a transfer
+    within an island only reaches the branches of that island. The
+    screening computes the columns of the sensitivities for the lines
+    that are taken out, batch_size at a time, and only the rows of the
+    branches that have a limit.
+    """
+    def __init__(self, network, flow=None):
+        self.flow   = flow if flow is not None else DCPowerFlow(network)
+        self.arrays = self.flow.arrays
+        self.limits = self._limits()
+
+    def _limits(self):
+        # thermal limit (MW) of each branch at its voltage, from the
+        # maximum current of the line; nan for transformers and for
+        # lines without one
+        flow    = self.flow
+        is_line = flow.branch_line >= 0
+        current = numpy.full(len(flow.branch_line), numpy.nan)
+        current[is_line] = self.arrays.max_current[flow.branch_line[is_line]]
+        voltage = flow.bus_voltage[flow.branch_from]
+        limits  = math.sqrt(3) * voltage * current / 1e6
+        limits[(limits <= 0) | ~is_line] = numpy.nan
+        return limits
+
+    def line_branches(self, line_ids):
+        # the branches of each of the lines, as (branch, line number) pairs
+        lines = self.arrays.line_index(line_ids)
+        order = numpy.argsort(lines, kind='mergesort')
+        is_line  = self.flow.branch_line >= 0
+        branches = numpy.flatnonzero(is_line)
+        by_line  = branches[numpy.argsort(self.flow.branch_line[branches], kind='mergesort')]
+        counts   = numpy.bincount(self.flow.branch_line[branches], minlength=self.arrays.num_lines)
+        offsets  = numpy.concatenate([[0], numpy.cumsum(counts)])
+        result, numbers = list(), list()
+        for n in order:
+            j = lines[n]
+            result.append(by_line[offsets[j]:offsets[j + 1]])
+            numbers.append(numpy.full(counts[j], n, dtype=numpy.int64))
+        if not result:
+            return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+        return numpy.concatenate(result), numpy.concatenate(numbers)
+
+    def transfer_factors(self, branches, rows=None):
+        # flow on the branches in rows for a unit transfer across each of
+        # the branches, from their from-bus to their to-bus
+        flow = self.flow
+        rows = numpy.arange(len(flow.branch_from)) if rows is None else numpy.asarray(rows)
+        rhs  = numpy.zeros((flow.num_buses, len(branches)))
+        columns = numpy.arange(len(branches))
+        rhs[flow.branch_from[branches], columns] += 1
+        rhs[flow.branch_to[branches], columns]   -= 1
+        angles = numpy.zeros(rhs.shape)
+        if flow.factors is not None and len(branches):
+            angles[flow.solved] = flow.factors.solve(numpy.asfortranarray(rhs[flow.solved]))
+        return flow.susceptance[rows, None] * (angles[flow.branch_from[rows]] - angles[flow.branch_to[rows]])
+
+    def ptdf(self, island):
+        """Full PTDF of an island: the flow on each of its branches for a
+        unit injection at each of its buses, taken up by the reference
+        bus. Returns the matrix with the branch and bus numbers."""
+        flow     = self.flow
+        buses    = numpy.flatnonzero(flow.bus_island == island)
+        branches = numpy.flatnonzero(flow.bus_island[flow.branch_from] == island)
+        rhs = numpy.zeros((flow.num_buses, len(buses)))
+        rhs[buses, numpy.arange(len(buses))] = 1
+        angles = numpy.zeros(rhs.shape)
+        if flow.factors is not None:
+            angles[flow.solved] = flow.factors.solve(numpy.asfortranarray(rhs[flow.solved]))
+        factors = flow.susceptance[branches, None] * (angles[flow.branch_from[branches]] -
+                                                      angles[flow.branch_to[branches]])
+        return factors, branches, buses
+
+    def lodf(self, island):
+        """Full branch LODF of an island: the change of the flow on each of
+        its branches, as a fraction of the flow on the branch that is
+        taken out. Outages that separate the island have nan columns."""
+        ptdf, branches, buses = self.ptdf(island)
+        position = numpy.searchsorted(buses, self.flow.branch_from[branches])
+        sending  = ptdf[:, position]
+        position = numpy.searchsorted(buses, self.flow.branch_to[branches])
+        transfer = sending - ptdf[:, position]
+        own = numpy.diag(transfer).copy()
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            factors = transfer / (1 - own)
+        factors[:, numpy.abs(1 - own) < ISLANDING_TOLERANCE] = numpy.nan
+        numpy.fill_diagonal(factors, -1)
+        return factors, branches
+
+    def screen(self, loads, outages=None, threshold=1.0, batch_size=256):
+        """Flows after the outage of each line (all lines by default), for a
+        load dict or array as DCPowerFlow.solve takes. Returns the
+        branches loaded beyond threshold times their limit, both in the
+        base case (an outage of None) and after each outage, and the
+        outages that separate an island."""
+        flow  = self.flow
+        base  = flow.solve(loads).flows
+        rows  = numpy.flatnonzero(~numpy.isnan(self.limits))
+        limit = self.limits[rows]
+        outages = self.arrays.line_ids if outages is None else numpy.asarray(outages)
+
+        overloads = self._overloads(None, rows, base[rows, None], limit, threshold)
+        islanding = list()
+        for start in range(0, len(outages), batch_size):
+            line_ids = outages[start:start + batch_size]
+            branches, numbers = self.line_branches(line_ids)
+            watched  = numpy.concatenate([rows, branches])
+            factors  = self.transfer_factors(branches, watched)
+            monitored, own = factors[:len(rows)], factors[len(rows):]
+            ends   = numpy.flatnonzero(numpy.diff(numpy.concatenate([numbers, [-1]])) != 0) + 1
+            begins = numpy.concatenate([[0], ends[:-1]])
+
+            # the flows after the outage compensate for the transfers
+            # across the branches that are taken out; for lines of a
+            # single voltage, that is the LODF column of the branch
+            single = begins[ends - begins == 1]
+            remain = 1 - own[single, single]
+            cut    = numpy.abs(remain) < ISLANDING_TOLERANCE
+            islanding.extend(line_ids[numbers[single[cut]]])
+            single, remain = single[~cut], remain[~cut]
+            after = base[rows, None] + monitored[:, single] * (base[branches[single]] / remain)
+            position, found = _positions(rows, branches[single])
+            after[position, numpy.flatnonzero(found)] = 0
+            overloads.extend(self._overloads(line_ids[numbers[single]], rows, after, limit, threshold))
+
+            for begin, end in zip(begins, ends):
+                if end - begin == 1:
+                    continue
+                outage = line_ids[numbers[begin]]
+                inner  = numpy.eye(end - begin) - own[begin:end, begin:end]
+                if abs(numpy.linalg.det(inner)) < ISLANDING_TOLERANCE:
+                    islanding.append(outage)
+                    continue
+                compensation = numpy.linalg.solve(inner, base[branches[begin:end]])
+                after = base[rows] + monitored[:, begin:end].dot(compensation)
+                position, found = _positions(rows, branches[begin:end])
+                after[position] = 0
+                overloads.extend(self._overloads([outage], rows, after[:, None], limit, threshold))
+        return Screening(overloads, islanding)
+
+    def _overloads(self, outages, rows, flows, limits, threshold):
+        # flows has a column for each outage (a single one of None for
+        # the base case)
+        flow = self.flow
+        loading = numpy.abs(flows) / limits[:, None]
+        overloads = list()
+        for i, k in zip(*numpy.nonzero(loading > threshold)):
+            branch = rows[i]
+            overloads.append(Overload(outages[k] if outages is not None else None,
+                                      self.arrays.line_ids[flow.branch_line[branch]],
+                                      flow.bus_voltage[flow.branch_from[branch]],
+                                      flows[i, k], limits[i], loading[i, k]))
+        return overloads
+
+
+def _positions(rows, branches):
+    # positions in the (sorted) rows of those branches that are found there
+    index = numpy.searchsorted(rows, branches)
+    found = index < len(rows)
+    found[found] = rows[index[found]] == branches[found]
+    return index[found], found
@@ -1,12 +1,12 @@
 #!/usr/bin/env python
 from __future__ import print_function, unicode_literals
 import operator
-import psycopg2
-import psycopg2.extras
+import collections
 import io
 import json
 import sys
 import logging
+from postgres import Psycopg2Wrapper
 
 
 CREATE_TABLES = '''
@@ -32,10 +32,10 @@ CREATE TABLE feature_multilines (
 )
 '''
 
-INSERT_STATEMENT = {
-    'Point': 'INSERT INTO feature_points (point, properties) VALUES (ST_SetSRID(ST_GeomFromText(%s), 4326), %s);',
-    'LineString': 'INSERT INTO feature_lines (line, properties) VALUES (ST_SetSRID(ST_GeomFromText(%s), 4326), %s);',
-    'MultiLineString': 'INSERT INTO feature_multilines (multiline, properties) VALUES (ST_SetSRID(ST_GeomFromText(%s), 4326), %s);',
+COPY_TARGET = {
+    'Point': ('feature_points', ['point', 'properties']),
+    'LineString': ('feature_lines', ['line', 'properties']),
+    'MultiLineString': ('feature_multilines', ['multiline', 'properties']),
 }
 
 REMOVE_DUPLICATES = '''
@@ -55,7 +55,12 @@ INSERT INTO feature_lines (line, properties)
 '''
 
 def hstore(d):
-    return dict((unicode(k), unicode(v)) for k, v, in d.items())
+    # text representation, as COPY reads it
+    def quote(v):
+        if v is None:
+            return 'NULL'
+        return '"{0}"'.format('{0}'.format(v).replace('\\', '\\\\').replace('"', '\\"'))
+    return ', '.join('{0}=>{1}'.format(quote(k), quote(v)) for k, v in d.items())
 
 def wkt(g):
     def coords(c):
@@ -71,25 +76,24 @@ def wkt(g):
     return '{0:s} ({1:s})'.format(g['type'].upper(), coords(g['coordinates']))
 
 
-def import_feature(cur,feature_data):
+def collect_features(rows, feature_data):
+    # rows per geometry type, to be copied in bulk
     if feature_data.get('type') == 'FeatureCollection':
         for feature in feature_data['features']:
-            import_feature(cur, feature)
+            collect_features(rows, feature)
     elif feature_data.get('type') == 'Feature':
-        cur.execute(INSERT_STATEMENT[feature_data['geometry']['type']],
-                    (wkt(feature_data['geometry']),
-                     hstore(feature_data['properties'])))
+        rows[feature_data['geometry']['type']].append(
+            ('SRID=4326;' + wkt(feature_data['geometry']),
+             hstore(feature_data['properties'])))
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.DEBUG)
-    con = psycopg2.connect('')
+    client = Psycopg2Wrapper()
+    if not client.check_connection():
+        logging.error("Cannot connect to database")
+        quit(1)
     # create table
-    with con:
-        with con.cursor() as cur:
-            cur.execute(CREATE_TABLES)
-
-    # use hstore to store attributes
-    psycopg2.extras.register_hstore(con)
+    client.do_query(CREATE_TABLES)
 
 
     if len(sys.argv) == 1:
@@ -99,9 +103,9 @@ if __name__ == '__main__':
     for handle in handles:
         with handle:
             feature_data = json.load(handle)
-        with con:
-            with con.cursor() as cur:
-                import_feature(cur, feature_data)
-                cur.execute(SPLIT_MULTILINES)
-                cur.execute(REMOVE_DUPLICATES)
-            con.commit()
+        rows = collections.defaultdict(list)
+        collect_features(rows, feature_data)
+        for geometry_type, (table, columns) in COPY_TARGET.items():
+            client.do_putcsv(table, rows[geometry_type], columns)
+        client.do_query(SPLIT_MULTILINES)
+        client.do_query(REMOVE_DUPLICATES)
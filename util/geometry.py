@@ -1,5 +1,21 @@
 from __future__ import print_function, division
+import array
+import math
 import collections
+import warnings
+
+try:
+    import numpy
+except ImportError as e:
+    warnings.warn(str(e))
+
+# point-edge pairs tested at once by Polygon.contains_many
+PAIRS_PER_BATCH = 1 << 20
+
+def orientation(ax, ay, bx, by, cx, cy):
+    # twice the signed area of the triangle abc; positive when c lies left
+    # of the line from a to b, zero when on it. Works on arrays, too.
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
 
 
 def cross_vertical(line_d, line_v):
@@ -100,41 +116,108 @@ class Edges(object):
 
 
 class IntervalTree(object):
-    Node = collections.namedtuple('Node', ['left','right','interval','value'])
+    """Stabbing index of closed intervals, in flat arrays.
+
+    The intervals are sorted by their low end and form an implicit
+    binary tree, like cgranges: the node at position i on level k (the
+    number of trailing one bits of i) has children at i - 2**(k-1) and
+    i + 2**(k-1). Each node keeps the highest high end of its subtree,
+    so a query skips every subtree that ends before x."""
+    # subtrees up to this level are scanned instead
+    SCAN_LEVEL = 3
 
     def __init__(self, intervals):
-        # first, transform of a,b into min(a,b),max(a,b), i sorted
-        prepared = sorted((min(x1,x2),max(x1,x2), i) for (i, (x1, x2)) in enumerate(intervals))
-        # then recursively build a tree
-        self.root = self._build_tree(prepared, 0, len(prepared))
-
-    def _build_tree(self, sorted_intervals, left, right):
-        if left == right or left + 1 == right:
-            # leaf node
-            return self.Node(None, None, sorted_intervals[left][0:2], sorted_intervals[left][2])
-        else:
-            mid        = (left + right) // 2
-            left_node  = self._build_tree(sorted_intervals, left, mid)
-            right_node = self._build_tree(sorted_intervals, mid, right)
-            interval   = left_node.interval[0], max(left_node.interval[1], right_node.interval[1])
-            # interior node
-            return self.Node(left_node, right_node, interval, None)
-
-    def _query_tree(self, node, x):
-        min_x, max_x = node.interval
-        results      = []
-        if min_x > x or max_x < x:
+        bounds = numpy.array(list(intervals), dtype=numpy.float64).reshape(-1, 2)
+        low, high = bounds.min(axis=1), bounds.max(axis=1)
+        self.order = numpy.lexsort((high, low))
+        self.low   = low[self.order]
+        self.high  = high[self.order]
+        self.levels, self.subtree_high = self._build(self.high)
+        # the queries run in python, on typed arrays that index quickly;
+        # the numpy arrays share their memory
+        self._low  = array.array(str('d'), self.low.tolist())
+        self._high = array.array(str('d'), self.high.tolist())
+        self._max  = array.array(str('d'), self.subtree_high.tolist())
+        self._ids  = array.array(str('l'), self.order.tolist())
+        self.low, self.high, self.subtree_high = [numpy.frombuffer(a, dtype=numpy.float64)
+                                                  for a in (self._low, self._high, self._max)]
+        self.order = numpy.frombuffer(self._ids, dtype=numpy.dtype(str('l')))
+
+    @staticmethod
+    def _build(high):
+        # the highest end within the subtree of each node, a level at a time;
+        # the subtree of a node at i on level k spans i - 2**k + 1 to i + 2**k - 1
+        size = len(high)
+        subtree = high.copy()
+        padded  = numpy.concatenate([high, [-numpy.inf]])
+        level = 0
+        while (1 << (level + 1)) <= size:
+            level += 1
+            nodes  = numpy.arange((1 << level) - 1, size, 1 << (level + 1))
+            starts = nodes - (1 << level) + 1
+            stops  = numpy.minimum(nodes + (1 << level), size)
+            bounds = numpy.column_stack([starts, stops]).ravel()
+            subtree[nodes] = numpy.maximum.reduceat(padded, bounds)[::2]
+        return level, subtree
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, x):
+        # ids (positions in the original order) of the intervals containing x
+        low, high, highest, ids = self._low, self._high, self._max, self._ids
+        size    = len(ids)
+        results = []
+        if not size:
             return results
-        if node.left is not None:
-            results.extend(self._query_tree(node.left, x))
-        if node.right is not None:
-            results.extend(self._query_tree(node.right, x))
-        if node.value is not None:
-            results.append(node.value)
+        stack = [((1 << self.levels) - 1, self.levels)]
+        while stack:
+            i, level = stack.pop()
+            if level <= self.SCAN_LEVEL:
+                for j in range(i - (1 << level) + 1, min(i + (1 << level), size)):
+                    if low[j] > x:
+                        break
+                    if high[j] >= x:
+                        results.append(ids[j])
+                continue
+            half = 1 << (level - 1)
+            if i >= size:
+                # only the left subtree exists
+                stack.append((i - half, level - 1))
+                continue
+            if highest[i] < x:
+                continue
+            stack.append((i - half, level - 1))
+            if low[i] <= x:
+                if high[i] >= x:
+                    results.append(ids[i])
+                stack.append((i + half, level - 1))
         return results
 
-    def __getitem__(self, x):
-        return self._query_tree(self.root, x)
+    def query_many(self, xs, batch_size=None):
+        """All the pairs of a position in xs and the id of an interval that
+        contains it, as two arrays per batch of about batch_size pairs."""
+        xs    = numpy.asarray(xs, dtype=numpy.float64).ravel()
+        order = numpy.argsort(xs, kind='mergesort')
+        first = numpy.searchsorted(xs[order], self.low, 'left')
+        last  = numpy.searchsorted(xs[order], self.high, 'right')
+        for intervals in _batches(last - first, batch_size or PAIRS_PER_BATCH):
+            interval, position = _pairs(first[intervals], last[intervals])
+            yield order[position], self.order[intervals[interval]]
+
+
+def _batches(counts, limit):
+    # consecutive groups of indices, the counts of each adding up to about limit
+    group = numpy.cumsum(counts) // max(limit, 1)
+    breaks = numpy.flatnonzero(numpy.diff(group)) + 1
+    return [b for b in numpy.split(numpy.flatnonzero(numpy.ones(len(counts), dtype=bool)), breaks) if len(b)]
+
+def _pairs(first, last):
+    # for each i, the positions first[i] up to last[i], as (i, position) pairs
+    counts = numpy.maximum(last - first, 0)
+    index  = numpy.repeat(numpy.arange(len(counts)), counts)
+    starts = numpy.cumsum(counts) - counts
+    return index, numpy.arange(counts.sum()) - numpy.repeat(starts - first, counts)
 
 
 class Polygon(object):
@@ -151,6 +234,44 @@ class Polygon(object):
     def __iter__(self):
         return iter(self.points)
 
+    @property
+    def edge_array(self):
+        # x1, y1, x2, y2 of each edge, the last one closing the ring
+        if getattr(self, '_edge_array', None) is None:
+            points = numpy.asarray(self.points, dtype=numpy.float64).reshape(-1, 2)
+            self._edge_array = numpy.column_stack([points, numpy.roll(points, -1, axis=0)])
+        return self._edge_array
+
+    def contains_many(self, points, boundary=True):
+        """Which of points, an array of (x, y) pairs, lie within the polygon,
+        counting those on an edge or vertex if boundary.
+
+        A ray from each point towards +x crosses the edges that span its
+        y half-open (so that passing through a vertex counts once) and
+        lie to its right, by the sign of orientation()."""
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        # sorted, the pairs of each edge are neighbours
+        order  = numpy.argsort(points[:, 1], kind='mergesort')
+        points = points[order]
+        x1, y1, x2, y2 = self.edge_array.T
+        upward    = y2 > y1
+        high      = numpy.maximum(y1, y2)
+        crossings = numpy.zeros(len(points), dtype=numpy.int64)
+        on_edge   = numpy.zeros(len(points), dtype=bool)
+        for point, edge in self.vertical_intervals.query_many(points[:, 1]):
+            px, py = points[point, 0], points[point, 1]
+            side = orientation(x1[edge], y1[edge], x2[edge], y2[edge], px, py)
+            touch = numpy.flatnonzero(side == 0)
+            e, p = edge[touch], px[touch]
+            on_edge[point[touch[(p >= numpy.minimum(x1[e], x2[e])) & (p <= numpy.maximum(x1[e], x2[e]))]]] = True
+            crosses = (py < high[edge]) & ((side > 0) == upward[edge]) & (side != 0)
+            crossings += numpy.bincount(point[crosses], minlength=len(points))
+
+        inside = (crossings & 1) == 1
+        result = numpy.empty(len(points), dtype=bool)
+        result[order] = (inside | on_edge) if boundary else (inside & ~on_edge)
+        return result
+
     def __contains__(self, point):
         x, y        = point
         left, right = 0, 0
@@ -177,6 +298,322 @@ class Polygon(object):
         return 'POLYGON(({0}))'.format(','.join('{0} {1}'.format(x, y) for (x,y) in self.points))
 
 
+class MultiPolygon(object):
+    """An area of one or more polygons, less the holes in them, such as
+    all the sections of a poly file.
+
+    After prepare(), the bounding box is divided in a grid of cells that
+    lie wholly inside or outside the area, or that an edge passes; only
+    points in the latter need the exact test."""
+    OUTSIDE, INSIDE, BOUNDARY = 0, 1, 2
+
+    def __init__(self, polygons, holes=()):
+        self.polygons = [p if isinstance(p, Polygon) else Polygon(p) for p in polygons]
+        self.holes    = [p if isinstance(p, Polygon) else Polygon(p) for p in holes]
+        self.grid     = None
+
+    @classmethod
+    def from_sections(cls, sections):
+        # as parsed by PolyfileParser; sections named !... are holes
+        names = sorted(sections)
+        return cls([sections[n] for n in names if not n.startswith('!')],
+                   [sections[n] for n in names if n.startswith('!')])
+
+    def __contains__(self, point):
+        return bool(self.contains_many([point])[0])
+
+    def contains_many(self, points, boundary=True):
+        # like Polygon.contains_many; the edges of holes are boundary, too
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        if self.grid is None:
+            return self._contains_exact(points, boundary)
+        cells = self._cells(points)
+        state = numpy.where(cells >= 0, self.grid.ravel()[numpy.maximum(cells, 0)], self.OUTSIDE)
+        result = state == self.INSIDE
+        exact  = numpy.flatnonzero(state == self.BOUNDARY)
+        result[exact] = self._contains_exact(points[exact], boundary)
+        return result
+
+    def _contains_exact(self, points, boundary):
+        inside = numpy.zeros(len(points), dtype=bool)
+        for polygon in self.polygons:
+            inside |= polygon.contains_many(points, boundary)
+        for hole in self.holes:
+            inside &= ~hole.contains_many(points, not boundary)
+        return inside
+
+    def prepare(self, size=None):
+        """Classify the cells of a size by size grid over the bounding box;
+        by default about two cells for each edge along either axis."""
+        edges = numpy.concatenate([p.edge_array for p in self.polygons + self.holes])
+        x1, y1, x2, y2 = edges.T
+        min_x, min_y = min(x1.min(), x2.min()), min(y1.min(), y2.min())
+        max_x, max_y = max(x1.max(), x2.max()), max(y1.max(), y2.max())
+        if size is None:
+            size = int(min(max(2 * math.sqrt(len(edges)), 16), 1024))
+        self.size   = size
+        self.bbox   = (min_x, min_y, max_x, max_y)
+        self.width  = (max_x - min_x) / size or 1.0
+        self.height = (max_y - min_y) / size or 1.0
+
+        # samples along each edge, at most half a cell apart, so that the
+        # cells the edge passes are those of the samples or next to them
+        dx, dy  = x2 - x1, y2 - y1
+        counts  = numpy.ceil(2 * numpy.maximum(numpy.abs(dx) / self.width, numpy.abs(dy) / self.height)).astype(numpy.int64) + 1
+        edge, step = _pairs(numpy.zeros(len(counts), dtype=numpy.int64), counts)
+        along = step / numpy.maximum(counts[edge] - 1, 1)
+        row, column = self._grid_position(x1[edge] + along * dx[edge], y1[edge] + along * dy[edge])
+        grid = numpy.zeros(size * size, dtype=numpy.int8)
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                grid[numpy.clip(row + dr, 0, size - 1) * size + numpy.clip(column + dc, 0, size - 1)] = self.BOUNDARY
+
+        # any other cell lies wholly inside or outside, like its centre
+        free = numpy.flatnonzero(grid != self.BOUNDARY)
+        centres = numpy.column_stack([min_x + (free % size + 0.5) * self.width,
+                                      min_y + (free // size + 0.5) * self.height])
+        grid[free[self._contains_exact(centres, True)]] = self.INSIDE
+        self.grid = grid.reshape(size, size)
+        return self
+
+    def _grid_position(self, x, y):
+        column = numpy.floor((x - self.bbox[0]) / self.width).astype(numpy.int64)
+        row    = numpy.floor((y - self.bbox[1]) / self.height).astype(numpy.int64)
+        return numpy.clip(row, 0, self.size - 1), numpy.clip(column, 0, self.size - 1)
+
+    def _cells(self, points):
+        # the cell of each point, or -1 outside the bounding box
+        x, y = points[:, 0], points[:, 1]
+        min_x, min_y, max_x, max_y = self.bbox
+        row, column = self._grid_position(x, y)
+        within = (x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)
+        return numpy.where(within, row * self.size + column, -1)
+
+    def to_wkt(self):
+        # each hole goes with the first polygon it lies in
+        rings = [[polygon] for polygon in self.polygons]
+        for hole in self.holes:
+            for ring in rings:
+                if ring[0].contains_many(hole.points[:1])[0]:
+                    ring.append(hole)
+                    break
+        return 'MULTIPOLYGON({0})'.format(','.join(
+            '({0})'.format(','.join(_ring_wkt(p.points) for p in ring)) for ring in rings))
+
+    def sections(self):
+        # as PolyfileParser returns them
+        sections = dict((str(i + 1), p.points) for i, p in enumerate(self.polygons))
+        sections.update(('!{0}'.format(len(self.polygons) + i + 1), p.points) for i, p in enumerate(self.holes))
+        return sections
+
+    def simplify(self, tolerance):
+        """A simpler area that contains this one: the rings are simplified
+        to within tolerance, only ever moving outward (holes inward), see
+        simplify_ring. Holes that disappear are left out, and polygons that
+        do are replaced by their bounding box. Raises ValueError if the
+        rings of the result meet."""
+        polygons, holes = list(), list()
+        for polygon in self.polygons:
+            ring = simplify_ring(polygon.points, tolerance, side=1)
+            if len(ring) < 3:
+                x, y = zip(*polygon.points)
+                ring = [(min(x), min(y)), (max(x), min(y)), (max(x), max(y)), (min(x), max(y))]
+            polygons.append(ring)
+        for hole in self.holes:
+            ring = simplify_ring(hole.points, tolerance, side=-1)
+            if len(ring) >= 3:
+                holes.append(ring)
+        if _rings_cross(polygons + holes):
+            raise ValueError("Rings meet after simplifying by {0}".format(tolerance))
+        simple = MultiPolygon(polygons, holes)
+        original = numpy.concatenate([p.edge_array[:, :2] for p in self.polygons])
+        if not numpy.all(simple.contains_many(original)):
+            raise ValueError("Simplified area does not contain the original")
+        return simple
+
+
+def simplify_ring(points, tolerance, side=0):
+    """Douglas-Peucker simplification of a closed ring, leaving out vertices
+    within tolerance of the result. With side 1, only vertices on the
+    inside of the result are left out, so that it contains the ring;
+    with side -1, only those outside it."""
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    if len(points) > 1 and numpy.array_equal(points[0], points[-1]):
+        points = points[:-1]
+    if len(points) < 4:
+        return [tuple(p) for p in points.tolist()]
+    # the ring is split at the vertex farthest from the first
+    far = int(numpy.argmax(((points - points[0]) ** 2).sum(axis=1)))
+    closed = numpy.concatenate([points, points[:1]])
+    inward = side * (1 if _signed_area(points) > 0 else -1)
+    keep  = numpy.zeros(len(closed), dtype=bool)
+    keep[[0, far, len(points)]] = True
+    stack = [(0, far), (far, len(points))]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        chain, start, end = closed[first + 1:last], closed[first], closed[last]
+        if side:
+            # distance towards the kept side of the line from start to end;
+            # a vertex on the other side must stay
+            length = math.hypot(*(end - start)) or 1.0
+            distance = inward * orientation(start[0], start[1], end[0], end[1], chain[:, 0], chain[:, 1]) / length
+            worst = int(numpy.argmin(distance))
+            if distance[worst] >= 0:
+                worst = int(numpy.argmax(distance))
+                if distance[worst] <= tolerance:
+                    continue
+        else:
+            distance = _segment_distance(chain, start, end)
+            worst = int(numpy.argmax(distance))
+            if distance[worst] <= tolerance:
+                continue
+        middle = first + 1 + worst
+        keep[middle] = True
+        stack.extend([(first, middle), (middle, last)])
+    return [tuple(p) for p in closed[:-1][keep[:-1]].tolist()]
+
+def _segment_distance(points, start, end):
+    # distance of each of points to the segment from start to end
+    direction = end - start
+    length = (direction ** 2).sum()
+    if length == 0:
+        along = numpy.zeros(len(points))
+    else:
+        along = numpy.clip(((points - start) * direction).sum(axis=1) / length, 0, 1)
+    nearest = start + along[:, None] * direction
+    return numpy.sqrt(((points - nearest) ** 2).sum(axis=1))
+
+def _signed_area(points):
+    # positive for counterclockwise rings
+    x, y = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2).T
+    return (x * numpy.roll(y, -1) - numpy.roll(x, -1) * y).sum() / 2
+
+def _rings_cross(rings):
+    # whether any two edges of the rings meet, other than successive edges
+    # of a ring at their shared vertex
+    edges = numpy.concatenate([numpy.asarray(Polygon(r).edge_array) for r in rings])
+    sizes = numpy.array([len(r) for r in rings])
+    ring  = numpy.repeat(numpy.arange(len(rings)), sizes)
+    index = numpy.arange(len(edges)) - numpy.repeat(numpy.cumsum(sizes) - sizes, sizes)
+    first, second, points = segment_intersections(edges)
+    same = ring[first] == ring[second]
+    gap  = numpy.abs(index[first] - index[second])
+    adjacent = same & ((gap == 1) | (gap == sizes[ring[first]] - 1))
+    return not numpy.all(adjacent)
+
+
+def segment_intersections(segments, touching=True, batch_size=PAIRS_PER_BATCH):
+    """All pairs of segments (rows of x1, y1, x2, y2) that meet, as the
+    numbers first < second of the segments of each pair and the points
+    where they meet, ordered by first and second.
+
+    Pairs are tested when their bounding boxes share a cell of a grid,
+    batch_size pairs at a time, with orientation predicates, so vertical
+    and parallel segments are no special case. With touching, segments
+    that meet at an endpoint of either (or overlap) count as well, and
+    meet at that endpoint; otherwise only crossings of their interiors."""
+    segments = numpy.asarray(segments, dtype=numpy.float64).reshape(-1, 4)
+    found = [(numpy.zeros(0, dtype=numpy.int64),) * 2 + (numpy.zeros((0, 2)),)]
+    for first, second in _candidate_pairs(segments, batch_size):
+        meet, points = _segments_meet(segments[first], segments[second], touching)
+        found.append((first[meet], second[meet], points[meet]))
+    first, second, points = (numpy.concatenate(f) for f in zip(*found))
+    order = numpy.lexsort((second, first))
+    return Intersections(first[order], second[order], points[order])
+
+Intersections = collections.namedtuple('Intersections', 'first second points')
+
+# segments whose bounding box covers more cells of the grid are compared
+# with all others directly
+LONG_SEGMENT_CELLS = 64
+
+def _candidate_pairs(segments, batch_size):
+    # batches of pairs (i < j) of segments whose bounding boxes overlap in
+    # a cell of a grid; each pair is found in the cell of the lower left
+    # corner of the overlap only
+    if len(segments) < 2:
+        return
+    x1, y1, x2, y2 = segments.T
+    min_x, max_x = numpy.minimum(x1, x2), numpy.maximum(x1, x2)
+    min_y, max_y = numpy.minimum(y1, y2), numpy.maximum(y1, y2)
+    x0, y0 = min_x.min(), min_y.min()
+    extent = max(max_x.max() - x0, max_y.max() - y0) or 1.0
+    size = max(numpy.median(numpy.maximum(max_x - min_x, max_y - min_y)), extent / 4096) or 1.0
+    cx1, cx2 = ((min_x - x0) // size).astype(numpy.int64), ((max_x - x0) // size).astype(numpy.int64)
+    cy1, cy2 = ((min_y - y0) // size).astype(numpy.int64), ((max_y - y0) // size).astype(numpy.int64)
+    width = cx2 - cx1 + 1
+    cells = width * (cy2 - cy1 + 1)
+    is_long = cells > LONG_SEGMENT_CELLS
+
+    def overlap(first, second):
+        return ((min_x[first] <= max_x[second]) & (min_x[second] <= max_x[first]) &
+                (min_y[first] <= max_y[second]) & (min_y[second] <= max_y[first]))
+
+    for i in numpy.flatnonzero(is_long):
+        others = numpy.flatnonzero(~is_long | (numpy.arange(len(segments)) > i))
+        others = others[(others != i) & overlap(numpy.full(len(others), i), others)]
+        first, second = numpy.minimum(others, i), numpy.maximum(others, i)
+        yield first, second
+
+    # every cell of the bounding box of each of the other segments
+    short = numpy.flatnonzero(~is_long)
+    segment, cell = _pairs(numpy.zeros(len(short), dtype=numpy.int64), cells[short])
+    segment = short[segment]
+    cell_x  = cx1[segment] + cell % width[segment]
+    cell_y  = cy1[segment] + cell // width[segment]
+    columns = cx2.max() + 1
+    key = cell_y * columns + cell_x
+    order = numpy.lexsort((segment, key))
+    segment, key = segment[order], key[order]
+    # each segment with those after it in the same cell
+    starts = numpy.flatnonzero(numpy.concatenate([[True], key[1:] != key[:-1]]))
+    ends   = numpy.concatenate([starts[1:], [len(key)]])
+    stop   = numpy.repeat(ends, ends - starts)
+    begin  = numpy.arange(len(key)) + 1
+    for batch in _batches(stop - begin, batch_size):
+        position, other = _pairs(begin[batch], stop[batch])
+        position = batch[position]
+        first, second = segment[position], segment[other]
+        keep = overlap(first, second)
+        first, second, key_batch = first[keep], second[keep], key[position[keep]]
+        corner_x = (numpy.maximum(min_x[first], min_x[second]) - x0) // size
+        corner_y = (numpy.maximum(min_y[first], min_y[second]) - y0) // size
+        keep = corner_y.astype(numpy.int64) * columns + corner_x.astype(numpy.int64) == key_batch
+        yield first[keep], second[keep]
+
+def _segments_meet(a, b, touching=True):
+    # whether segments a and b (rows of x1, y1, x2, y2) meet, and where
+    o1 = orientation(a[:, 0], a[:, 1], a[:, 2], a[:, 3], b[:, 0], b[:, 1])
+    o2 = orientation(a[:, 0], a[:, 1], a[:, 2], a[:, 3], b[:, 2], b[:, 3])
+    o3 = orientation(b[:, 0], b[:, 1], b[:, 2], b[:, 3], a[:, 0], a[:, 1])
+    o4 = orientation(b[:, 0], b[:, 1], b[:, 2], b[:, 3], a[:, 2], a[:, 3])
+    crossing = (numpy.sign(o1) * numpy.sign(o2) < 0) & (numpy.sign(o3) * numpy.sign(o4) < 0)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        along = numpy.where(crossing, o3 / (o3 - o4), 0)
+    points = a[:, :2] + along[:, None] * (a[:, 2:] - a[:, :2])
+    if not touching:
+        return crossing, points
+    def within(s, x, y):
+        return ((numpy.minimum(s[:, 0], s[:, 2]) <= x) & (x <= numpy.maximum(s[:, 0], s[:, 2])) &
+                (numpy.minimum(s[:, 1], s[:, 3]) <= y) & (y <= numpy.maximum(s[:, 1], s[:, 3])))
+    # the endpoints of either on the other, the last found taking precedence
+    meet = crossing.copy()
+    for o, s, end in ((o4, b, a[:, 2:]), (o3, b, a[:, :2]), (o2, a, b[:, 2:]), (o1, a, b[:, :2])):
+        on = (o == 0) & within(s, end[:, 0], end[:, 1])
+        points[on] = end[on]
+        meet |= on
+    return meet, points
+
+
+def _ring_wkt(points):
+    points = list(points)
+    if points and points[0] != points[-1]:
+        points.append(points[0])
+    return '({0})'.format(','.join('{0} {1}'.format(x, y) for (x, y) in points))
+
+
 if __name__ == '__main__':
     line_a = ((1,1), (3,4))
     line_b = ((1,3), (3,2))
@@ -197,4 +634,17 @@ if __name__ == '__main__':
     pentagon = ((1,0), (0, 2), (2, 3), (4,2), (3,0))
     assert polygon_includes(pentagon, (2, 2))
     assert not polygon_includes(pentagon, (1,3))
+    assert list(Polygon(square).contains_many([(2, 2), (7, 2), (0, 3), (5, 5)])) == [True, False, True, True]
+    assert list(Polygon(pentagon).contains_many([(2, 2), (1, 3), (2, 3)], boundary=False)) == [True, False, False]
+    area = MultiPolygon([square, ((6, 0), (6, 2), (8, 2), (8, 0))], [((1, 1), (1, 2), (2, 2), (2, 1))])
+    tests = [(3, 3), (1.5, 1.5), (1, 1.5), (7, 1), (5.5, 1), (9, 9)]
+    assert list(area.contains_many(tests)) == [True, False, True, True, False, False]
+    assert list(area.prepare(4).contains_many(tests)) == [True, False, True, True, False, False]
+    jagged = [(0, 0), (2, 0.1), (4, 0), (4, 4), (2, 3.9), (0, 4)]
+    assert len(simplify_ring(jagged, 0.2, side=1)) == 4
+    assert len(simplify_ring(jagged, 0.2, side=-1)) == 6
+    first, second, points = segment_intersections([(0, 0, 4, 4), (0, 4, 4, 0), (2, 0, 2, 9), (5, 5, 6, 6), (4, 4, 5, 5)])
+    assert list(zip(first, second)) == [(0, 1), (0, 2), (0, 4), (1, 2), (3, 4)]
+    assert points.tolist() == [[2, 2], [2, 2], [4, 4], [2, 2], [5, 5]]
+    assert all(area.simplify(0.5).contains_many(tests[:1] + tests[2:4]))
     print("done")
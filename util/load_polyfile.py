@@ -5,7 +5,7 @@ import sys
 import os
 import io
 from polyfile import PolyfileParser
-from geometry import Polygon
+from geometry import MultiPolygon
 
 ap = argparse.ArgumentParser()
 ap.add_argument('file', nargs='+', type=str)
@@ -20,7 +20,7 @@ for file_name in args.file:
     name, ext = os.path.splitext(os.path.basename(file_name))
     try:
         pr = parser.parse(io.open(file_name, 'r').read())
-        pl = Polygon(pr[1]['1'])
+        pl = MultiPolygon.from_sections(pr[1])
         polygons[name] = pl.to_wkt()
     except Exception as e:
         print("Could not process {0} because {1}".format(file_name, e), file=sys.stderr)
@@ -34,7 +34,7 @@ BEGIN;
 DROP TABLE IF EXISTS {0};
 CREATE TABLE {0} (
     name varchar(64) primary key,
-    polygon geometry(polygon, 4326)
+    polygon geometry(multipolygon, 4326)
 );
 INSERT INTO {0} (name, polygon) VALUES {1};
 COMMIT;
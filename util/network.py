@@ -1,11 +1,22 @@
 from __future__ import unicode_literals, division, print_function
+import os
 import io
+import sys
 import csv
+import hashlib
+import zipfile
 import random
 import itertools
 import heapq
 import math
+import weakref
+import operator
 import warnings
+import collections
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 try:
     from recordclass import recordclass
 except ImportError:
@@ -13,7 +24,18 @@ except ImportError:
     warnings.warn("recordclass is necessary for Network.patch() to work")
 
 try:
+    import numpy
     from numpy import array
+except ImportError as e:
+    warnings.warn(str(e))
+
+try:
+    from scipy.spatial import cKDTree
+    from scipy.sparse import csgraph, csr_matrix
+except ImportError as e:
+    warnings.warn(str(e))
+
+try:
     from matplotlib import pyplot
 except ImportError as e:
     warnings.warn(str(e))
@@ -21,7 +43,14 @@ except ImportError as e:
 
 
 
-class Station(recordclass('Station', str('station_id lat lon name operator voltages frequencies lines'))):
+# as used by Station.distance
+EARTH_RADIUS = 6372.8
+
+
+class StationMethods(object):
+    # shared by Station and the StationView of a CompactNetwork
+    __slots__ = ()
+
     def __hash__(self):
         return hash(self.station_id)
 
@@ -32,7 +61,7 @@ class Station(recordclass('Station', str('station_id lat lon name operator volta
     def distance(self, other):
         # See https://www.math.ksu.edu/~dbski/writings/haversine.pdf
         # earths radius will be 6.371 km
-        R  = 6372.8
+        R  = EARTH_RADIUS
         delta_lat = math.radians(other.lat - self.lat)
         delta_lon = math.radians(other.lon - self.lon)
         a = math.sin(delta_lat/2)**2 + math.cos(math.radians(self.lat))*math.cos(math.radians(other.lat))*math.sin(delta_lon/2)**2
@@ -44,7 +73,13 @@ class Station(recordclass('Station', str('station_id lat lon name operator volta
         return 'SRID=4326;POINT({0} {1})'.format(self.lon, self.lat)
 
 
-class Line(recordclass('Line', str('line_id operator left right length frequencies voltages resistance reactance capacitance max_current'))):
+class Station(StationMethods, recordclass('Station', str('station_id lat lon name operator voltages frequencies lines'))):
+    pass
+
+
+class LineMethods(object):
+    __slots__ = ()
+
     def __hash__(self):
         return hash(self.line_id)
 
@@ -57,6 +92,10 @@ class Line(recordclass('Line', str('line_id operator left right length frequenci
             return None
         return self.capacitance * max(self.frequencies)
 
+
+class Line(LineMethods, recordclass('Line', str('line_id operator left right length frequencies voltages resistance reactance capacitance max_current'))):
+    pass
+
 class Path(object):
     def __init__(self, stations):
         self.stations = stations
@@ -101,79 +140,763 @@ class Path(object):
 
 
 
+class SetCodes(object):
+    "Encodes sets of values (voltages, frequencies) as rows of bitmasks"
+    def __init__(self, values=()):
+        self.levels = list()
+        self.bits   = dict()
+        for value in sorted(set(values)):
+            self.add(value)
+
+    @classmethod
+    def from_levels(cls, levels):
+        # in the order of the bits, as saved
+        codes = cls()
+        for value in levels:
+            codes.add(value)
+        return codes
+
+    @property
+    def words(self):
+        return max(1, (len(self.levels) + 63) // 64)
+
+    def add(self, value):
+        # bits are never reassigned, so existing masks stay valid
+        if value not in self.bits:
+            self.bits[value] = len(self.levels)
+            self.levels.append(value)
+        return self.bits[value]
+
+    def encode(self, sets):
+        for values in sets:
+            for value in values:
+                self.add(value)
+        masks = numpy.zeros((len(sets), self.words), dtype=numpy.uint64)
+        for i, values in enumerate(sets):
+            masks[i] = self.mask(values)
+        return masks
+
+    def mask(self, values):
+        bits = [self.add(value) for value in values]
+        row  = numpy.zeros(self.words, dtype=numpy.uint64)
+        for bit in bits:
+            row[bit // 64] |= numpy.uint64(1) << numpy.uint64(bit % 64)
+        return row
+
+    def decode(self, row):
+        return set(self.levels[bit] for bit in self.set_bits(row))
+
+    def set_bits(self, row):
+        for word, value in enumerate(row):
+            value = int(value)
+            while value:
+                low = value & -value
+                yield word * 64 + low.bit_length() - 1
+                value ^= low
+
+    def membership(self, masks):
+        # boolean matrix of (element, level)
+        bits = numpy.arange(len(self.levels))
+        return (masks[:, bits // 64] >> (bits % 64).astype(numpy.uint64)) & numpy.uint64(1) != 0
+
+
+def _index_of(ids, keys):
+    # positions of keys in the sorted ids, or KeyError
+    keys    = numpy.asarray(keys)
+    index   = numpy.searchsorted(ids, keys)
+    if len(ids):
+        missing = (index >= len(ids)) | (ids[numpy.minimum(index, len(ids) - 1)] != keys)
+    else:
+        missing = numpy.ones(keys.shape, dtype=bool)
+    if numpy.any(missing):
+        raise KeyError(keys[missing].tolist() if keys.ndim else keys.item())
+    return index
+
+def _widen(masks, words):
+    if masks.shape[1] >= words:
+        return masks
+    wider = numpy.zeros((masks.shape[0], words), dtype=numpy.uint64)
+    wider[:, :masks.shape[1]] = masks
+    return wider
+
+
+# bbox is (min_lon, min_lat, max_lon, max_lat), length the total length of its lines
+Island = collections.namedtuple('Island', 'label station_ids size voltages length bbox')
+
+
+class NetworkArrays(object):
+    """Compact representation of a network in numpy arrays.
+
+    Stations and lines are stored by index, sorted by id. Voltage and
+    frequency sets are rows of bitmasks (see SetCodes), missing numbers
+    are NaN. The lines at station i are adjacent_lines[offsets[i]:offsets[i+1]],
+    leading to adjacent_stations at the same positions.
+    """
+    STATION_FIELDS = ('station_ids', 'lat', 'lon', 'station_names', 'station_operators',
+                      'station_voltages', 'station_frequencies')
+    LINE_FIELDS    = ('line_ids', 'left', 'right', 'length', 'line_operators',
+                      'line_voltages', 'line_frequencies',
+                      'resistance', 'reactance', 'capacitance', 'max_current')
+
+    def __init__(self, voltage_codes, frequency_codes, **fields):
+        self.voltage_codes   = voltage_codes
+        self.frequency_codes = frequency_codes
+        for name in self.STATION_FIELDS + self.LINE_FIELDS:
+            setattr(self, name, fields[name])
+        self.revision = 0
+        self._build_adjacency()
+
+    @classmethod
+    def from_network(cls, network):
+        stations = sorted(network.stations.values(), key=operator.attrgetter('station_id'))
+        lines    = sorted(network.lines.values(), key=operator.attrgetter('line_id'))
+        voltage_codes   = SetCodes(v for e in stations + lines for v in e.voltages)
+        frequency_codes = SetCodes(f for e in stations + lines for f in e.frequencies)
+        station_ids = numpy.array([s.station_id for s in stations], dtype=numpy.int64)
+        number = lambda values: numpy.array([numpy.nan if v is None else v for v in values], dtype=numpy.float64)
+        return cls(voltage_codes, frequency_codes,
+                   station_ids=station_ids,
+                   lat=number(s.lat for s in stations),
+                   lon=number(s.lon for s in stations),
+                   station_names=numpy.array([s.name for s in stations], dtype=object),
+                   station_operators=numpy.array([s.operator for s in stations], dtype=object),
+                   station_voltages=voltage_codes.encode([s.voltages for s in stations]),
+                   station_frequencies=frequency_codes.encode([s.frequencies for s in stations]),
+                   line_ids=numpy.array([l.line_id for l in lines], dtype=numpy.int64),
+                   left=numpy.searchsorted(station_ids, [l.left.station_id for l in lines]).astype(numpy.int64),
+                   right=numpy.searchsorted(station_ids, [l.right.station_id for l in lines]).astype(numpy.int64),
+                   length=number(l.length for l in lines),
+                   line_operators=numpy.array([l.operator for l in lines], dtype=object),
+                   line_voltages=voltage_codes.encode([l.voltages for l in lines]),
+                   line_frequencies=frequency_codes.encode([l.frequencies for l in lines]),
+                   resistance=number(l.resistance for l in lines),
+                   reactance=number(l.reactance for l in lines),
+                   capacitance=number(l.capacitance for l in lines),
+                   max_current=number(l.max_current for l in lines))
+
+    def _build_adjacency(self):
+        # compressed sparse rows of the incidence of stations and lines;
+        # lines from a station to itself are listed twice, like in Station.lines
+        num_lines = len(self.line_ids)
+        ends  = numpy.concatenate([self.left, self.right])
+        order = numpy.argsort(ends, kind='mergesort')
+        self.adjacent_lines    = order % num_lines if num_lines else order
+        self.adjacent_stations = numpy.concatenate([self.right, self.left])[order]
+        self.offsets = numpy.zeros(len(self.station_ids) + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(ends, minlength=len(self.station_ids)), out=self.offsets[1:])
+
+    @property
+    def num_stations(self):
+        return len(self.station_ids)
+
+    @property
+    def num_lines(self):
+        return len(self.line_ids)
+
+    @property
+    def degree(self):
+        return numpy.diff(self.offsets)
+
+    def station_index(self, station_ids):
+        # index of each of station_ids, or KeyError
+        return _index_of(self.station_ids, station_ids)
+
+    def line_index(self, line_ids):
+        return _index_of(self.line_ids, line_ids)
+
+    def station_lines(self, i):
+        return self.adjacent_lines[self.offsets[i]:self.offsets[i+1]]
+
+    def neighbours(self, i):
+        return self.adjacent_stations[self.offsets[i]:self.offsets[i+1]]
+
+    def components(self):
+        # the number of connected components and the component of each station
+        num_stations = self.num_stations
+        graph = csr_matrix((numpy.ones(len(self.adjacent_stations)), self.adjacent_stations, self.offsets),
+                           shape=(num_stations, num_stations))
+        return csgraph.connected_components(graph, directed=False)
+
+    def islands(self):
+        # a summary of each connected component, by component
+        num_islands, labels = self.components()
+        if not num_islands:
+            return []
+        order  = numpy.argsort(labels, kind='mergesort')
+        counts = numpy.bincount(labels, minlength=num_islands)
+        bounds = numpy.cumsum(counts)[:-1]
+        length = numpy.bincount(labels[self.left], minlength=num_islands,
+                                weights=numpy.where(numpy.isnan(self.length), 0, self.length))
+        voltages = numpy.zeros((num_islands, self.station_voltages.shape[1]), dtype=numpy.uint64)
+        numpy.bitwise_or.at(voltages, labels, self.station_voltages)
+        numpy.bitwise_or.at(voltages, labels[self.left], self.line_voltages)
+        bbox = numpy.array([numpy.full(num_islands, numpy.inf)] * 2 + [numpy.full(num_islands, -numpy.inf)] * 2)
+        for row, reduce, values in ((0, numpy.fmin, self.lon), (1, numpy.fmin, self.lat),
+                                    (2, numpy.fmax, self.lon), (3, numpy.fmax, self.lat)):
+            reduce.at(bbox[row], labels, values)
+        bbox[:, numpy.isinf(bbox[0])] = numpy.nan
+        return [Island(k, ids, int(counts[k]), self.voltage_codes.decode(voltages[k]), length[k], tuple(bbox[:, k]))
+                for k, ids in enumerate(numpy.split(self.station_ids[order], bounds))]
+
+    def codes(self, masks_name):
+        # station_voltages, line_voltages -> voltage_codes, etc
+        kind = masks_name.split('_', 1)[1]
+        return self.voltage_codes if kind == 'voltages' else self.frequency_codes
+
+    def set_codes(self, masks_name, i, values):
+        codes = self.codes(masks_name)
+        row   = codes.mask(values)
+        # new values may need another word in every mask
+        kind  = masks_name.split('_', 1)[1]
+        for name in ('station_' + kind, 'line_' + kind):
+            setattr(self, name, _widen(getattr(self, name), codes.words))
+        getattr(self, masks_name)[i] = row
+        self.changed()
+
+    def changed(self):
+        self.revision += 1
+
+    def patch(self):
+        # propagate voltages and frequencies like Network.patch; a round
+        # checks only the stations at lines that changed in the round
+        # before, and the lines at stations that changed in this round,
+        # as nothing else can change. Returns the number of changes per
+        # round and the indices of the stations and lines that changed.
+        kinds    = ('voltages', 'frequencies')
+        totals   = list()
+        stations = numpy.flatnonzero(self.degree)
+        lines    = numpy.arange(self.num_lines)
+        station_changed = numpy.zeros(self.num_stations, dtype=bool)
+        line_changed    = numpy.zeros(self.num_lines, dtype=bool)
+        while len(stations):
+            changes = 0
+            changed = numpy.zeros(len(stations), dtype=bool)
+            positions, first = _segments(self.offsets, stations)
+            adjacent = self.adjacent_lines[positions]
+            for kind in kinds:
+                station_masks = getattr(self, 'station_' + kind)
+                line_masks    = getattr(self, 'line_' + kind)
+                own    = station_masks[stations]
+                new    = own | numpy.bitwise_or.reduceat(line_masks[adjacent], first, axis=0)
+                differ = numpy.any(new != own, axis=1)
+                station_masks[stations[differ]] = new[differ]
+                changed |= differ
+                changes += int(differ.sum())
+            if totals:
+                # in the first round, all lines are checked
+                lines = numpy.unique(self.adjacent_lines[_segments(self.offsets, stations[changed])[0]])
+            station_changed[stations[changed]] = True
+
+            changed = numpy.zeros(len(lines), dtype=bool)
+            for kind in kinds:
+                station_masks = getattr(self, 'station_' + kind)
+                line_masks    = getattr(self, 'line_' + kind)
+                own    = line_masks[lines]
+                left   = station_masks[self.left[lines]]
+                right  = station_masks[self.right[lines]]
+                shared = left & right
+                extend = _nonzero(shared) & ~_nonzero(own & shared)
+                empty  = ~extend & ~_nonzero(own)
+                from_left  = empty & _nonzero(left)
+                from_right = empty & ~from_left & _nonzero(right)
+                new = own.copy()
+                new[extend] |= shared[extend]
+                new[from_left]  = left[from_left]
+                new[from_right] = right[from_right]
+                differ = extend | from_left | from_right
+                line_masks[lines[differ]] = new[differ]
+                changed |= differ
+                changes += int(differ.sum())
+            line_changed[lines[changed]] = True
+
+            if changes == 0:
+                break
+            totals.append(changes)
+            stations = numpy.unique(numpy.concatenate([self.left[lines[changed]], self.right[lines[changed]]]))
+        if totals:
+            self.changed()
+        return totals, numpy.flatnonzero(station_changed), numpy.flatnonzero(line_changed)
+
+    def to_network(self, network):
+        # fill network with station and line objects
+        voltages    = [self.voltage_codes.decode(row) for row in self.station_voltages]
+        frequencies = [self.frequency_codes.decode(row) for row in self.station_frequencies]
+        stations = list()
+        for i, station_id in enumerate(self.station_ids.tolist()):
+            station = Station(station_id=station_id, lat=float(self.lat[i]), lon=float(self.lon[i]),
+                              name=self.station_names[i], operator=self.station_operators[i],
+                              voltages=voltages[i], frequencies=frequencies[i], lines=list())
+            network.stations[station_id] = station
+            stations.append(station)
+        voltages    = [self.voltage_codes.decode(row) for row in self.line_voltages]
+        frequencies = [self.frequency_codes.decode(row) for row in self.line_frequencies]
+        number = lambda value: None if value != value else float(value)
+        for j, line_id in enumerate(self.line_ids.tolist()):
+            left, right = stations[self.left[j]], stations[self.right[j]]
+            line = Line(line_id=line_id, operator=self.line_operators[j], left=left, right=right,
+                        length=float(self.length[j]), voltages=voltages[j], frequencies=frequencies[j],
+                        resistance=number(self.resistance[j]), reactance=number(self.reactance[j]),
+                        capacitance=number(self.capacitance[j]), max_current=number(self.max_current[j]))
+            network.lines[line_id] = line
+            left.lines.append(line)
+            right.lines.append(line)
+        network.changed()
+        return network
+
+    def save(self, handle, **extra):
+        # as .npz; strings are stored each followed by a zero byte, so
+        # that loading needs no pickle
+        fields = dict(extra)
+        for name in self.STATION_FIELDS + self.LINE_FIELDS:
+            value = getattr(self, name)
+            if value.dtype == object:
+                value = numpy.frombuffer(''.join((v or '') + '\0' for v in value).encode('utf-8'), dtype=numpy.uint8)
+            fields[name] = value
+        fields['voltage_levels']   = numpy.array(self.voltage_codes.levels, dtype=numpy.int64)
+        fields['frequency_levels'] = numpy.array(self.frequency_codes.levels, dtype=numpy.float64)
+        numpy.savez(handle, **fields)
+
+    @classmethod
+    def load(cls, file_name):
+        # returns the arrays, and the extra arrays that were saved
+        with numpy.load(file_name) as data:
+            fields = dict((name, data[name]) for name in data.files)
+        for name in ('station_names', 'station_operators', 'line_operators'):
+            strings = fields[name].tobytes().decode('utf-8').split('\0')[:-1]
+            fields[name] = numpy.array(strings, dtype=object)
+        voltage_codes   = SetCodes.from_levels(fields.pop('voltage_levels').tolist())
+        frequency_codes = SetCodes.from_levels(fields.pop('frequency_levels').tolist())
+        extra = dict((name, fields.pop(name)) for name in list(fields)
+                     if name not in cls.STATION_FIELDS + cls.LINE_FIELDS)
+        return cls(voltage_codes, frequency_codes, **fields), extra
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in
+                   self.STATION_FIELDS + self.LINE_FIELDS + ('adjacent_lines', 'adjacent_stations', 'offsets'))
+
+
+def _segments(offsets, index):
+    # positions in the adjacency rows of the stations at index, and where
+    # the row of each starts among those positions
+    starts = offsets[index]
+    counts = offsets[index + 1] - starts
+    first  = numpy.cumsum(counts) - counts
+    return numpy.arange(counts.sum()) - numpy.repeat(first - starts, counts), first
+
+def _nonzero(masks):
+    return numpy.any(masks != 0, axis=1)
+
+class StationIndex(object):
+    """Spatial index of the stations of NetworkArrays, as points on the
+    unit sphere in a k-d tree. Distances are great circle distances in
+    kilometers, points are (lon, lat) pairs; results are station indices."""
+    def __init__(self, arrays):
+        self.tree  = cKDTree(_unit_vectors(arrays.lon, arrays.lat))
+        self.lon   = arrays.lon
+        self.order = numpy.argsort(arrays.lat, kind='mergesort')
+        self.lat   = arrays.lat[self.order]
+
+    def nearest(self, points, k=1):
+        # distances and indices, each of shape (len(points), k)
+        k = max(1, min(k, self.tree.n))
+        if self.tree.n == 0:
+            empty = numpy.zeros((len(points), 0))
+            return empty, empty.astype(numpy.int64)
+        chords, index = self.tree.query(_unit_vectors(*_lon_lat(points)), k=k)
+        return (_chord_to_km(chords).reshape(len(points), k),
+                numpy.asarray(index, dtype=numpy.int64).reshape(len(points), k))
+
+    def within_radius(self, points, radius):
+        # an array of indices for each of points
+        chord = 2 * math.sin(min(radius / EARTH_RADIUS, math.pi) / 2)
+        found = self.tree.query_ball_point(_unit_vectors(*_lon_lat(points)), chord)
+        return [numpy.array(sorted(f), dtype=numpy.int64) for f in found]
+
+    def in_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        candidates = self.order[numpy.searchsorted(self.lat, min_lat, 'left'):
+                                numpy.searchsorted(self.lat, max_lat, 'right')]
+        lon = self.lon[candidates]
+        if min_lon <= max_lon:
+            inside = (lon >= min_lon) & (lon <= max_lon)
+        else:
+            # across the antimeridian
+            inside = (lon >= min_lon) | (lon <= max_lon)
+        return numpy.sort(candidates[inside])
+
+class PathEngine(object):
+    """Shortest paths by line length (in meters) between the stations of
+    NetworkArrays, by station index.
+
+    Distances from a few landmarks, chosen far apart within the connected
+    components, bound the distance between any two stations from below
+    (ALT); a single query searches from both ends, guided by these
+    bounds. Many queries from the same station take a single run of
+    Dijkstra's algorithm."""
+    # sources with at least this many targets are searched in full
+    MANY_TARGETS = 8
+
+    def __init__(self, arrays, num_landmarks=16):
+        num_stations = arrays.num_stations
+        length = arrays.length.copy()
+        missing = numpy.isnan(length)
+        if numpy.any(missing):
+            # as the crow flies
+            ends = _unit_vectors(arrays.lon, arrays.lat)
+            chords = numpy.sqrt(((ends[arrays.left[missing]] - ends[arrays.right[missing]]) ** 2).sum(axis=1))
+            length[missing] = _chord_to_km(chords) * 1000
+
+        # an edge each way between neighbouring stations, over the
+        # shortest of parallel lines
+        source = numpy.concatenate([arrays.left, arrays.right])
+        target = numpy.concatenate([arrays.right, arrays.left])
+        weight = numpy.concatenate([length, length])
+        order  = numpy.lexsort((weight, target, source))
+        order  = order[source[order] != target[order]]
+        source, target, weight = source[order], target[order], weight[order]
+        first  = numpy.concatenate([[True], (numpy.diff(source) != 0) | (numpy.diff(target) != 0)]) \
+                 if len(order) else numpy.zeros(0, dtype=bool)
+        # explicit zeros would not be edges
+        weight = numpy.maximum(weight[first], 1e-9)
+        self.graph = csr_matrix((weight, (source[first], target[first])), shape=(num_stations, num_stations))
+        self.num_components, self.component = csgraph.connected_components(self.graph, directed=False)
+        self.landmarks, self.bounds = self._landmarks(num_landmarks)
+
+        # the searches run in python
+        self._offsets    = self.graph.indptr.tolist()
+        self._neighbours = self.graph.indices.tolist()
+        self._weights    = self.graph.data.tolist()
+
+    def _landmarks(self, num_landmarks):
+        # each landmark is the station farthest from those before it; the
+        # first of each component (largest first) is the farthest from an
+        # arbitrary station. The distance of each station from each
+        # landmark is 0 for landmarks of other components.
+        num_stations = len(self.component)
+        sizes   = numpy.bincount(self.component, minlength=self.num_components)
+        nearest = numpy.full(num_stations, numpy.inf)
+        nearest[sizes[self.component] < 3] = -1
+        landmarks, distances = list(), list()
+        while len(landmarks) < num_landmarks and numpy.any(nearest > 0):
+            unreached = numpy.flatnonzero(nearest == numpy.inf)
+            if len(unreached):
+                component = numpy.argmax(numpy.where(numpy.bincount(self.component[unreached],
+                                                                    minlength=self.num_components) > 0, sizes, 0))
+                start = numpy.flatnonzero(self.component == component)[0]
+                from_start = csgraph.dijkstra(self.graph, indices=start)
+                landmark = numpy.argmax(numpy.where(numpy.isinf(from_start), -1, from_start))
+            else:
+                landmark = numpy.argmax(nearest)
+            distance = csgraph.dijkstra(self.graph, indices=landmark)
+            landmarks.append(landmark)
+            distances.append(numpy.where(numpy.isinf(distance), 0, distance))
+            nearest = numpy.where(numpy.isinf(distance) | (nearest < 0), nearest, numpy.minimum(nearest, distance))
+        bounds = numpy.array(distances).T.copy() if distances else numpy.zeros((num_stations, 0))
+        return numpy.array(landmarks, dtype=numpy.int64), bounds
+
+    def lower_bound(self, i, j):
+        bounds = self.bounds
+        return numpy.abs(bounds[i] - bounds[j]).max() if bounds.shape[1] else 0.0
+
+    def find(self, i, j):
+        # length and stations of the shortest path from station i to j,
+        # or (inf, None); bidirectional A* with the average of the bounds
+        # towards either end as potential, so both searches see the same
+        # reduced lengths, and may stop when their keys together exceed
+        # the best path found
+        if i == j:
+            return 0.0, [i]
+        if self.component[i] != self.component[j]:
+            return numpy.inf, None
+        bounds, ends = self.bounds, self.bounds[[j, i]]
+        known = dict()
+        def potential(k):
+            if k not in known:
+                if bounds.shape[1]:
+                    to_target, to_source = numpy.abs(bounds[k] - ends).max(axis=1).tolist()
+                    known[k] = (to_target - to_source) / 2
+                else:
+                    known[k] = 0.0
+            return known[k]
+
+        offsets, neighbours, weights = self._offsets, self._neighbours, self._weights
+        distance = (dict([(i, 0.0)]), dict([(j, 0.0)]))
+        previous = (dict([(i, None)]), dict([(j, None)]))
+        settled  = (set(), set())
+        queues   = ([(potential(i), i)], [(-potential(j), j)])
+        signs    = (1, -1)
+        best, meeting = numpy.inf, None
+        while queues[0] and queues[1]:
+            if queues[0][0][0] + queues[1][0][0] >= best:
+                break
+            side = 0 if len(queues[0]) <= len(queues[1]) else 1
+            key, station = heapq.heappop(queues[side])
+            if station in settled[side]:
+                continue
+            settled[side].add(station)
+            here, there, sign = distance[side], distance[1 - side], signs[side]
+            for n in range(offsets[station], offsets[station + 1]):
+                neighbour = neighbours[n]
+                score = here[station] + weights[n]
+                if score < here.get(neighbour, numpy.inf):
+                    here[neighbour] = score
+                    previous[side][neighbour] = station
+                    heapq.heappush(queues[side], (score + sign * potential(neighbour), neighbour))
+                    if neighbour in there and score + there[neighbour] < best:
+                        best, meeting = score + there[neighbour], neighbour
+        if meeting is None:
+            return numpy.inf, None
+        path, station = list(), meeting
+        while station is not None:
+            path.append(station)
+            station = previous[0][station]
+        path.reverse()
+        station = previous[1][meeting]
+        while station is not None:
+            path.append(station)
+            station = previous[1][station]
+        return best, path
+
+    def find_many(self, pairs, paths=False):
+        # the lengths of the shortest paths between pairs of station
+        # indices (inf if there is none), and their stations if paths
+        pairs   = numpy.asarray(pairs, dtype=numpy.int64).reshape(-1, 2)
+        lengths = numpy.full(len(pairs), numpy.inf)
+        found   = [None] * len(pairs) if paths else None
+        sources, inverse, counts = numpy.unique(pairs[:, 0], return_inverse=True, return_counts=True)
+        many = numpy.flatnonzero(counts >= self.MANY_TARGETS)
+        for start in range(0, len(many), 64):
+            batch  = many[start:start + 64]
+            result = csgraph.dijkstra(self.graph, indices=sources[batch], return_predecessors=paths)
+            tree, previous = result if paths else (result, None)
+            for row, s in enumerate(batch):
+                queries = numpy.flatnonzero(inverse == s)
+                lengths[queries] = tree[row, pairs[queries, 1]]
+                for q in (queries if paths else ()):
+                    found[q] = _predecessor_path(previous[row], pairs[q, 0], pairs[q, 1])
+        for q in numpy.flatnonzero(counts[inverse] < self.MANY_TARGETS):
+            lengths[q], path = self.find(pairs[q, 0], pairs[q, 1])
+            if paths:
+                found[q] = path
+        return (lengths, found) if paths else lengths
+
+    def distances_from(self, i, limit=None):
+        # the length of the shortest path from station i to each station,
+        # inf beyond limit
+        return csgraph.dijkstra(self.graph, indices=i, limit=numpy.inf if limit is None else limit)
+
+def _predecessor_path(previous, i, j):
+    if i != j and previous[j] < 0:
+        return None
+    path = [j]
+    while path[-1] != i:
+        path.append(previous[path[-1]])
+    path.reverse()
+    return path
+
+def _lon_lat(points):
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    return points[:, 0], points[:, 1]
+
+def _unit_vectors(lon, lat):
+    lon, lat = numpy.radians(lon), numpy.radians(lat)
+    return numpy.column_stack([numpy.cos(lat) * numpy.cos(lon),
+                               numpy.cos(lat) * numpy.sin(lon),
+                               numpy.sin(lat)])
+
+def _chord_to_km(chords):
+    return 2 * numpy.arcsin(numpy.minimum(numpy.asarray(chords) / 2, 1)) * EARTH_RADIUS
+
+
+def _array_property(name, nullable=False, writable=True):
+    def get(self):
+        value = getattr(self._arrays, name)[self._index]
+        if nullable and value != value:
+            return None
+        return value.item() if hasattr(value, 'item') else value
+    def set(self, value):
+        getattr(self._arrays, name)[self._index] = numpy.nan if value is None else value
+        self._arrays.changed()
+    return property(get, set if writable else None)
+
+def _codes_property(name):
+    def get(self):
+        return self._arrays.codes(name).decode(getattr(self._arrays, name)[self._index])
+    def set(self, values):
+        # station.voltages |= ... reads, updates and writes back
+        self._arrays.set_codes(name, self._index, values)
+    return property(get, set)
+
+
+class StationView(StationMethods):
+    "A station of a CompactNetwork, reading and writing its arrays"
+    __slots__ = ('_network', '_arrays', '_index', '__weakref__')
+
+    def __init__(self, network, index):
+        self._network = network
+        self._arrays  = network.arrays
+        self._index   = index
+
+    station_id  = _array_property('station_ids', writable=False)
+    lat         = _array_property('lat')
+    lon         = _array_property('lon')
+    name        = _array_property('station_names')
+    operator    = _array_property('station_operators')
+    voltages    = _codes_property('station_voltages')
+    frequencies = _codes_property('station_frequencies')
+
+    @property
+    def lines(self):
+        return [self._network._line(j) for j in self._arrays.station_lines(self._index)]
+
+    def __repr__(self):
+        return 'Station({0})'.format(self.station_id)
+
+
+class LineView(LineMethods):
+    "A line of a CompactNetwork, reading and writing its arrays"
+    __slots__ = ('_network', '_arrays', '_index', '__weakref__')
+
+    def __init__(self, network, index):
+        self._network = network
+        self._arrays  = network.arrays
+        self._index   = index
+
+    line_id     = _array_property('line_ids', writable=False)
+    operator    = _array_property('line_operators')
+    length      = _array_property('length')
+    voltages    = _codes_property('line_voltages')
+    frequencies = _codes_property('line_frequencies')
+    resistance  = _array_property('resistance', nullable=True)
+    reactance   = _array_property('reactance', nullable=True)
+    capacitance = _array_property('capacitance', nullable=True)
+    max_current = _array_property('max_current', nullable=True)
+
+    @property
+    def left(self):
+        return self._network._station(self._arrays.left[self._index])
+
+    @property
+    def right(self):
+        return self._network._station(self._arrays.right[self._index])
+
+
+class _ViewMapping(Mapping):
+    # read-only mapping of ids to views, like Network.stations and .lines
+    def __init__(self, ids, view):
+        self._ids  = ids
+        self._view = view
+
+    def __getitem__(self, key):
+        i = numpy.searchsorted(self._ids, key)
+        if i >= len(self._ids) or self._ids[i] != key:
+            raise KeyError(key)
+        return self._view(i)
+
+    def __iter__(self):
+        return iter(self._ids.tolist())
+
+    def __len__(self):
+        return len(self._ids)
+
+    def values(self):
+        return [self._view(i) for i in range(len(self._ids))]
+
+    def itervalues(self):
+        return (self._view(i) for i in range(len(self._ids)))
+
+    def iteritems(self):
+        return ((key, self._view(i)) for i, key in enumerate(self._ids.tolist()))
+
+    def iterkeys(self):
+        return iter(self)
+
+
 class Network(object):
     def __init__(self):
         self.stations = dict()
         self.lines    = dict()
         self._areas   = dict()
+        self._revision = 0
+        self._cache    = dict()
+
+    def changed(self):
+        # call after modifying stations or lines in place, so that the
+        # arrays (and anything derived from them) are built again
+        self._revision += 1
+
+    @property
+    def revision(self):
+        return self._revision, len(self.stations), len(self.lines)
+
+    def cached(self, name, build):
+        # value of build(), kept until the network changes
+        revision, value = self._cache.get(name, (None, None))
+        if revision != self.revision:
+            value = build()
+            self._cache[name] = (self.revision, value)
+        return value
+
+    @property
+    def arrays(self):
+        return self.cached('arrays', lambda: NetworkArrays.from_network(self))
+
+    def compact(self):
+        return CompactNetwork(NetworkArrays.from_network(self))
+
+    @property
+    def station_index(self):
+        # rebuilt after the network changes
+        return self.cached('station_index', lambda: StationIndex(self.arrays))
+
+    @property
+    def paths(self):
+        return self.cached('paths', lambda: PathEngine(self.arrays))
+
+    def nearest(self, points, k=1):
+        # the k stations nearest to each of points, (lon, lat) pairs; as
+        # arrays of distances (km) and station ids of shape (len(points), k)
+        distances, index = self.station_index.nearest(points, k)
+        return distances, self.arrays.station_ids[index]
+
+    def within_radius(self, points, radius):
+        # an array of the ids of the stations within radius (km) for each of points
+        return [self.arrays.station_ids[index] for index in self.station_index.within_radius(points, radius)]
+
+    def in_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        return self.arrays.station_ids[self.station_index.in_bbox(min_lon, min_lat, max_lon, max_lat)]
+
+    @property
+    def components(self):
+        # the number of connected sets and the label of each station, in
+        # the order of arrays.station_ids
+        return self.cached('components', self.arrays.components)
+
+    @property
+    def islands(self):
+        # summaries of the connected sets, see Island
+        return self.cached('islands', self.arrays.islands)
 
     def connected_sets(self):
-        # bfs algorithm to find connected sets in the network
-        unseen = set(self.stations.values())
-        connected = []
-        while unseen:
-            current = []
-            root  = unseen.pop()
-            queue = [root]
-            while queue:
-                node = queue.pop()
-                if node in unseen:
-                    unseen.remove(node)
-                    current.append(node)
-                for line in node.lines:
-                    if line.left in unseen:
-                        queue.append(line.left)
-                    if line.right in unseen:
-                        queue.append(line.right)
-            connected.append(current)
-        return connected
+        # the stations of each connected set
+        return [[self.stations[int(i)] for i in island.station_ids] for island in self.islands]
 
     def patch(self):
-        # flood algorithm to patch all lines and stations with values from neighbours
-        totals = list()
-        while True:
-            changes = 0
-            for station in self.stations.itervalues():
-                line_voltages    = set(v for line in station.lines for v in line.voltages)
-                line_frequencies = set(f for line in station.lines for f in line.frequencies)
-                if line_voltages - station.voltages:
-                    station.voltages |= line_voltages
-                    changes          += 1
-                if line_frequencies - station.frequencies:
-                    station.frequencies |= line_frequencies
-                    changes             += 1
-
-
-            for line in self.lines.itervalues():
-                shared_frequencies = line.left.frequencies & line.right.frequencies
-                if shared_frequencies and not line.frequencies & shared_frequencies:
-                    line.frequencies |= shared_frequencies
-                    changes += 1
-                elif not line.frequencies:
-                    if line.left.frequencies:
-                        line.frequencies = set(line.left.frequencies)
-                        changes += 1
-                    elif line.right.frequencies:
-                        line.frequencies = set(line.right.frequencies)
-                        changes += 1
-
-                shared_voltages = line.left.voltages & line.right.voltages
-                if shared_voltages and not line.voltages & shared_voltages:
-                    line.voltages |= shared_voltages
-                    changes += 1
-                elif not line.voltages:
-                    if line.left.voltages:
-                        line.voltages = set(line.left.voltages)
-                        changes += 1
-                    elif line.right.voltages:
-                        line.voltages = set(line.right.voltages)
-                        changes += 1
-
-            if changes == 0:
-                break
-            totals.append(changes)
-            if len(totals) > 1000:
-                raise Exception('dont think ill be stopping soon')
+        # flood algorithm to patch all lines and stations with values
+        # from neighbours, see NetworkArrays.patch; returns the number of
+        # changes in each round
+        arrays = self.arrays
+        totals, stations, lines = arrays.patch()
+        for i in stations:
+            station = self.stations[int(arrays.station_ids[i])]
+            station.voltages    = arrays.voltage_codes.decode(arrays.station_voltages[i])
+            station.frequencies = arrays.frequency_codes.decode(arrays.station_frequencies[i])
+        for j in lines:
+            line = self.lines[int(arrays.line_ids[j])]
+            line.voltages    = arrays.voltage_codes.decode(arrays.line_voltages[j])
+            line.frequencies = arrays.frequency_codes.decode(arrays.line_frequencies[j])
+        if totals:
+            self.changed()
         return totals
 
     def report(self):
@@ -181,7 +904,7 @@ class Network(object):
         broken_stations = 0
         broken_lines    = 0
         mismatches      = 0
-        for station in self.stations.itervalues():
+        for station in self.stations.values():
             if not station.voltages or not station.frequencies:
                 broken_stations += 1
             for line in station.lines:
@@ -200,46 +923,33 @@ class Network(object):
                     mismatches += 1
                     continue
 
-        for line in self.lines.itervalues():
+        for line in self.lines.values():
             if not line.voltages or not line.frequencies:
                 broken_lines += 1
         return broken_stations, broken_lines, mismatches
 
     def find(self, from_id, to_id):
-        # A* algorithm to find shortest path
-        scores    = dict()
-        come_from = dict()
-        seen      = set()
-        path      = list()
+        # shortest path, see PathEngine
         try:
-            start     = self.stations[from_id]
-            goal      = self.stations[to_id]
+            i, j = self.arrays.station_index([from_id, to_id])
         except KeyError:
             return None
-        queue     = [(0,start)]
-        while queue:
-            score, station = heapq.heappop(queue)
-            if station is goal:
-                break
-            seen.add(station)
-            for line in station.lines:
-                neighbor = line.left if line.right is station else line.right
-                if neighbor in seen:
-                    continue
-                g_score = score + line.length
-                if scores.get(neighbor, g_score+1) < g_score:
-                    continue
-                h_score = goal.distance(neighbor)
-                heapq.heappush(queue, (g_score + h_score, neighbor))
-                come_from[neighbor] = station
-        if station is not goal:
+        length, path = self.paths.find(i, j)
+        if path is None:
             return None
-        while station is not start:
-            path.append(station)
-            station = come_from[station]
-        path.append(start)
-        path.reverse()
-        return Path(path)
+        return Path([self.stations[int(self.arrays.station_ids[k])] for k in path])
+
+    def find_many(self, pairs):
+        # an array of the lengths of the shortest paths between pairs of
+        # station ids, inf where there is none
+        pairs = numpy.asarray(pairs, dtype=numpy.int64).reshape(-1, 2)
+        index = self.arrays.station_index(pairs.ravel()).reshape(-1, 2)
+        return self.paths.find_many(index)
+
+    def distances_from(self, station_id, limit=None):
+        # the length of the shortest path to each station, in the order of
+        # arrays.station_ids
+        return self.paths.distances_from(self.arrays.station_index([station_id])[0], limit)
 
 
     def plot(self, figure=None, node_color='blue', edge_color='red'):
@@ -279,7 +989,7 @@ class Network(object):
         station_to_bus = dict()
         bus_id_gen     = itertools.count()
 
-        for station in self.stations.itervalues():
+        for station in self.stations.values():
             # because we do a DC PF, we ignore frequencies completely
             minv, maxv = min(station.voltages), max(station.voltages)
             for voltage in station.voltages:
@@ -302,7 +1012,7 @@ class Network(object):
                     to_bus   = station_to_bus[station.station_id, voltage]
                     edges.append(self._make_transformer(from_bus, to_bus))
 
-        for line in self.lines.itervalues():
+        for line in self.lines.values():
             # create branches between stations
             for voltage in line.voltages:
                 from_bus = station_to_bus[line.left.station_id, voltage]
@@ -406,9 +1116,9 @@ class Network(object):
         buf = io.StringIO()
         buf.write("graph {\n")
         buf.write("rankdir LR\n")
-        for station in self.stations.itervalues():
+        for station in self.stations.values():
             buf.write('s_{0} [label="{1}"]\n'.format(station.station_id, station.name.replace('"', "'")))
-        for line in self.lines.itervalues():
+        for line in self.lines.values():
             buf.write('s_{0} -- s_{1}\n'.format(line.left.station_id, line.right.station_id))
         buf.write("}\n")
         return buf.getvalue()
@@ -417,42 +1127,175 @@ class Network(object):
         return "Network of {0} stations, {1} lines".format(len(self.stations), len(self.lines)).encode('utf-8')
 
 
+class CompactNetwork(Network):
+    """Network backed by NetworkArrays. Stations and lines are views,
+    made when asked for, that read and write the arrays."""
+    def __init__(self, arrays):
+        super(CompactNetwork, self).__init__()
+        self._arrays       = arrays
+        self._station_views = weakref.WeakValueDictionary()
+        self._line_views    = weakref.WeakValueDictionary()
+        self.stations = _ViewMapping(arrays.station_ids, self._station)
+        self.lines    = _ViewMapping(arrays.line_ids, self._line)
+
+    @property
+    def arrays(self):
+        return self._arrays
+
+    @property
+    def revision(self):
+        return self._arrays.revision
+
+    def changed(self):
+        self._arrays.changed()
+
+    def compact(self):
+        return self
+
+    def patch(self):
+        # the views read the patched arrays
+        totals, stations, lines = self._arrays.patch()
+        return totals
+
+    def _station(self, i):
+        # one view per station at a time, so that they can be compared with 'is'
+        i = int(i)
+        view = self._station_views.get(i)
+        if view is None:
+            view = StationView(self, i)
+            self._station_views[i] = view
+        return view
+
+    def _line(self, j):
+        j = int(j)
+        view = self._line_views.get(j)
+        if view is None:
+            view = LineView(self, j)
+            self._line_views[j] = view
+        return view
+
+
+def _read_csv(file_name, dialect):
+    # header and columns (as lists of text)
+    if sys.version_info >= (3, 0):
+        with io.open(file_name, 'r', encoding='utf-8', newline='') as handle:
+            rows = list(csv.reader(handle, dialect=dialect))
+    else:
+        with io.open(file_name, 'rb') as handle:
+            rows = [[value.decode('utf-8') for value in row] for row in csv.reader(handle, dialect=dialect)]
+    header = rows.pop(0) if rows else []
+    columns = list(zip(*rows)) if rows else [()] * len(header)
+    return dict(zip(header, (list(column) for column in columns)))
+
+def _numbers(column):
+    # empty values become NaN
+    return numpy.array([value or 'nan' for value in column]).astype(numpy.float64)
+
+def _sets(column, codes, convert):
+    # values like '220000;380000', encoded once per distinct value
+    distinct = sorted(set(column))
+    index    = dict((value, i) for i, value in enumerate(distinct))
+    masks    = codes.encode([set(map(convert, value.split(';'))) if value else set() for value in distinct])
+    return masks[numpy.array([index[value] for value in column], dtype=numpy.int64)]
+
+def _file_key(file_name):
+    stat = os.stat(file_name)
+    return stat.st_size, stat.st_mtime
+
+def _file_hash(file_name):
+    digest = hashlib.sha1()
+    with io.open(file_name, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
 class ScigridNetwork(Network):
     class _csv_dialect(csv.excel):
-        quotechar = b"'"
-
-    def read(self, vertices_csv, links_csv):
-        with io.open(vertices_csv, 'rb') as handle:
-            for row in csv.DictReader(handle, dialect=self._csv_dialect):
-                station_id  = int(row['v_id'])
-                lat         = float(row['lat'])
-                lon         = float(row['lon'])
-                name        = row['name'].decode('utf-8')
-                operator    = row['operator'].decode('utf-8')
-                voltages    = set(map(int, row['voltage'].split(';')) if row['voltage'] else [])
-                frequencies = set(map(float, row['frequency'].split(';')) if row['frequency'] else [])
-                self.stations[station_id] = Station(station_id=station_id, lat=lat, lon=lon, name=name, operator=operator,
-                                                    voltages=voltages, frequencies=frequencies, lines=list())
-
-        with io.open(links_csv, 'rb') as handle:
-            for i, row in enumerate(csv.DictReader(handle, dialect=self._csv_dialect)):
-                line_id     = int(row['l_id'])
-                operator    = row['operator'].decode('utf-8')
-                left        = self.stations[int(row['v_id_1'])]
-                right       = self.stations[int(row['v_id_2'])]
-                length      = float(row['length_m'])
-                resistance  = float(row['r_ohmkm']) * int(row['length_m']) / 1000 if row['r_ohmkm'] else None
-                reactance   = float(row['x_ohmkm']) * int(row['length_m']) / 1000 if row['x_ohmkm'] else None
-                capacitance = float(row['c_nfkm']) * int(row['length_m']) / 1000  if row['c_nfkm'] else  None
-                max_current = float(row['i_th_max_a']) if row['i_th_max_a'] else None
-                # use complex voltages for lines
-                frequencies = set(map(float, row['frequency'].split(';')) if row['frequency'] else [])
-                voltages    = set(map(int, row['voltage'].split(';')) if row['voltage'] else [])
-                line  = Line(line_id=line_id, operator=operator, left=left, right=right, length=length,
-                             voltages=voltages, frequencies=frequencies,
-                             resistance=resistance, reactance=reactance, capacitance=capacitance,
-                             max_current=max_current)
-                self.lines[line_id] = line
-                left.lines.append(line)
-                right.lines.append(line)
+        quotechar = str("'")
+
+    def read(self, vertices_csv, links_csv, snapshot=True):
+        self.read_arrays(vertices_csv, links_csv, snapshot).to_network(self)
+
+    @classmethod
+    def load(cls, vertices_csv, links_csv, snapshot=True):
+        "Read the network as a CompactNetwork"
+        return CompactNetwork(cls.read_arrays(vertices_csv, links_csv, snapshot))
+
+    @classmethod
+    def read_arrays(cls, vertices_csv, links_csv, snapshot=True):
+        # a snapshot (.npz) is kept next to the vertices file, and used
+        # as long as both files have the same size and modification time
+        # (or else content) as when it was made
+        if not snapshot:
+            return cls.parse_arrays(vertices_csv, links_csv)
+        snapshot_file = os.path.splitext(vertices_csv)[0] + '.npz'
+        files = (vertices_csv, links_csv)
+        keys  = [_file_key(f) for f in files]
+        if os.path.isfile(snapshot_file):
+            try:
+                arrays, extra = NetworkArrays.load(snapshot_file)
+                saved_keys = [tuple(k) for k in extra['source_keys'].tolist()]
+                if saved_keys == keys:
+                    return arrays
+                if [k[0] for k in saved_keys] == [k[0] for k in keys] and \
+                   extra['source_hashes'].tolist() == [_file_hash(f) for f in files]:
+                    # touched, not changed
+                    cls._save_snapshot(arrays, snapshot_file, files, keys)
+                    return arrays
+            except (IOError, OSError, ValueError, KeyError, zipfile.BadZipfile) as e:
+                warnings.warn("Cannot use snapshot {0}: {1}".format(snapshot_file, e))
+        arrays = cls.parse_arrays(vertices_csv, links_csv)
+        cls._save_snapshot(arrays, snapshot_file, files, keys)
+        return arrays
+
+    @classmethod
+    def _save_snapshot(cls, arrays, snapshot_file, files, keys):
+        temporary_file = '{0}.{1}.tmp'.format(snapshot_file, os.getpid())
+        try:
+            with io.open(temporary_file, 'wb') as handle:
+                arrays.save(handle, source_keys=numpy.array(keys, dtype=numpy.float64),
+                            source_hashes=numpy.array([_file_hash(f) for f in files]))
+            os.rename(temporary_file, snapshot_file)
+        except (IOError, OSError) as e:
+            warnings.warn("Cannot write snapshot {0}: {1}".format(snapshot_file, e))
+
+    @classmethod
+    def parse_arrays(cls, vertices_csv, links_csv):
+        vertices = _read_csv(vertices_csv, cls._csv_dialect)
+        links    = _read_csv(links_csv, cls._csv_dialect)
+        voltage_codes   = SetCodes()
+        frequency_codes = SetCodes()
+
+        station_ids = numpy.array(vertices['v_id'], dtype=numpy.int64)
+        order       = numpy.argsort(station_ids, kind='mergesort')
+        station_ids = station_ids[order]
+        station_voltages    = _sets(vertices['voltage'], voltage_codes, int)[order]
+        station_frequencies = _sets(vertices['frequency'], frequency_codes, float)[order]
 
+        line_ids = numpy.array(links['l_id'], dtype=numpy.int64)
+        by_id    = numpy.argsort(line_ids, kind='mergesort')
+        length   = _numbers(links['length_m'])
+        line_voltages    = _sets(links['voltage'], voltage_codes, int)
+        line_frequencies = _sets(links['frequency'], frequency_codes, float)
+        widen = lambda masks, codes: _widen(masks, codes.words)
+        return NetworkArrays(voltage_codes, frequency_codes,
+                             station_ids=station_ids,
+                             lat=_numbers(vertices['lat'])[order],
+                             lon=_numbers(vertices['lon'])[order],
+                             station_names=numpy.array(vertices['name'], dtype=object)[order],
+                             station_operators=numpy.array(vertices['operator'], dtype=object)[order],
+                             station_voltages=widen(station_voltages, voltage_codes),
+                             station_frequencies=widen(station_frequencies, frequency_codes),
+                             line_ids=line_ids[by_id],
+                             left=_index_of(station_ids, numpy.array(links['v_id_1'], dtype=numpy.int64))[by_id],
+                             right=_index_of(station_ids, numpy.array(links['v_id_2'], dtype=numpy.int64))[by_id],
+                             length=length[by_id],
+                             line_operators=numpy.array(links['operator'], dtype=object)[by_id],
+                             line_voltages=widen(line_voltages, voltage_codes)[by_id],
+                             line_frequencies=widen(line_frequencies, frequency_codes)[by_id],
+                             # per kilometer, for the length of the line
+                             resistance=(_numbers(links['r_ohmkm']) * length / 1000)[by_id],
+                             reactance=(_numbers(links['x_ohmkm']) * length / 1000)[by_id],
+                             capacitance=(_numbers(links['c_nfkm']) * length / 1000)[by_id],
+                             max_current=_numbers(links['i_th_max_a'])[by_id])
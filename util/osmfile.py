@@ -0,0 +1,201 @@
+"""Streaming readers for OSM XML and o5m files.
+
+Nodes are yielded as ('n', id, lon, lat, tags) and ways as ('w', id,
+node_ids, tags), in the order of the file, with tags as a dict.
+Relations are skipped. Neither reader keeps objects in memory after
+yielding them.
+"""
+from __future__ import print_function, unicode_literals, division
+import io, gzip, bz2, collections
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+def open_file(file_name):
+    if file_name.endswith('.gz'):
+        return gzip.open(file_name, 'rb')
+    if file_name.endswith('.bz2'):
+        return bz2.BZ2File(file_name, 'rb')
+    return io.open(file_name, 'rb')
+
+def is_o5m(file_name):
+    return file_name.endswith('.o5m') or file_name.endswith('.o5c')
+
+def is_osm_xml(file_name):
+    for ext in ('.gz', '.bz2'):
+        if file_name.endswith(ext):
+            file_name = file_name[:-len(ext)]
+    return file_name.endswith('.osm') or file_name.endswith('.xml')
+
+def read_osm(file_name):
+    with open_file(file_name) as handle:
+        reader = O5mReader(handle) if is_o5m(file_name) else read_osm_xml(handle)
+        for osm_object in reader:
+            yield osm_object
+
+def read_osm_xml(handle):
+    tags, node_ids = dict(), list()
+    root = None
+    # python 2 cElementTree only accepts byte strings as events
+    for event, element in ElementTree.iterparse(handle, events=(str('start'), str('end'))):
+        if event == 'start':
+            if root is None:
+                root = element
+        elif element.tag == 'tag':
+            tags[element.get('k')] = element.get('v')
+        elif element.tag == 'nd':
+            node_ids.append(int(element.get('ref')))
+        elif element.tag in ('node', 'way', 'relation'):
+            if element.tag == 'node' and element.get('lon') is not None:
+                yield 'n', int(element.get('id')), float(element.get('lon')), float(element.get('lat')), tags
+            elif element.tag == 'way':
+                yield 'w', int(element.get('id')), node_ids, tags
+            tags, node_ids = dict(), list()
+            # the root would otherwise hold on to every (empty) element
+            root.clear()
+
+
+class O5mReader(object):
+    "Reader of the o5m format, see https://wiki.openstreetmap.org/wiki/O5m"
+    NODE     = 0x10
+    WAY      = 0x11
+    RELATION = 0x12
+    RESET    = 0xff
+    EOF      = 0xfe
+
+    # string pairs up to this length are kept for later reference
+    STRING_LENGTH = 250
+    STRING_TABLE  = 15000
+
+    class Error(Exception):
+        pass
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.reset()
+
+    def reset(self):
+        # all values are delta-coded, until the next reset
+        self.strings  = collections.deque(maxlen=self.STRING_TABLE)
+        self.id       = 0
+        self.time     = 0
+        self.cset     = 0
+        self.lon      = 0
+        self.lat      = 0
+        self.node_ref = 0
+
+    def __iter__(self):
+        while True:
+            byte = self.handle.read(1)
+            if not byte or ord(byte) == self.EOF:
+                break
+            kind = ord(byte)
+            if kind == self.RESET:
+                self.reset()
+                continue
+            elif kind >= 0xf0:
+                # other single-byte datasets carry no data
+                continue
+            length = self.read_length()
+            if kind not in (self.NODE, self.WAY):
+                self.handle.read(length)
+                continue
+            self.data     = bytearray(self.handle.read(length))
+            self.position = 0
+            if len(self.data) < length:
+                raise self.Error("Unexpected end of file")
+            osm_object = self.read_node() if kind == self.NODE else self.read_way()
+            if osm_object is not None:
+                yield osm_object
+
+    def read_length(self):
+        value, shift = 0, 0
+        while True:
+            byte = self.handle.read(1)
+            if not byte:
+                raise self.Error("Unexpected end of file")
+            value |= (ord(byte) & 0x7f) << shift
+            if ord(byte) < 0x80:
+                return value
+            shift += 7
+
+    def read_node(self):
+        self.id += self.signed()
+        if self.position == len(self.data):
+            # deleted, in change files
+            return None
+        self.read_author()
+        self.lon += self.signed()
+        self.lat += self.signed()
+        return 'n', self.id, self.lon / 1e7, self.lat / 1e7, self.read_tags()
+
+    def read_way(self):
+        self.id += self.signed()
+        if self.position == len(self.data):
+            return None
+        self.read_author()
+        length = self.unsigned()
+        end = self.position + length
+        node_ids = list()
+        while self.position < end:
+            self.node_ref += self.signed()
+            node_ids.append(self.node_ref)
+        return 'w', self.id, node_ids, self.read_tags()
+
+    def read_author(self):
+        version = self.unsigned()
+        if version == 0:
+            return
+        self.time += self.signed()
+        if self.time == 0:
+            return
+        self.cset += self.signed()
+        # user id and name; an anonymous user has neither
+        if self.data[self.position] != 0:
+            # a reference to an earlier pair
+            self.unsigned()
+            return
+        start = self.position + 1
+        self.position = start
+        user_id = self.unsigned()
+        self.position += 1
+        if user_id != 0:
+            self.position = self.data.index(b'\0', self.position) + 1
+        self.store_string(start)
+
+    def read_tags(self):
+        tags = dict()
+        while self.position < len(self.data):
+            if self.data[self.position] != 0:
+                key, value = self.strings[-self.unsigned()]
+            else:
+                start = self.position + 1
+                middle = self.data.index(b'\0', start)
+                self.position = self.data.index(b'\0', middle + 1) + 1
+                key, value = self.store_string(start)
+            tags[key.decode('utf-8')] = value.decode('utf-8')
+        return tags
+
+    def store_string(self, start):
+        # the pair that ends at the current position
+        pair = bytes(self.data[start:self.position - 1]).split(b'\0', 1)
+        if self.position - start - 2 <= self.STRING_LENGTH:
+            self.strings.append(pair)
+        return pair
+
+    def unsigned(self):
+        value, shift = 0, 0
+        while True:
+            byte = self.data[self.position]
+            self.position += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def signed(self):
+        value = self.unsigned()
+        if value & 1:
+            return -(value >> 1) - 1
+        return value >> 1
@@ -56,3 +56,14 @@ class PolyfileParser(object):
             raise self.Error("%s was not matched (got %s...)" % (expect.pattern, self.buf[self.position:self.position+10]))
         self.position = match.end()
         return match.group()
+
+
+def write_polyfile(handle, name, sections):
+    # in the format PolyfileParser reads, sections as it returns them
+    handle.write('{0}\n'.format(name))
+    for identifier in sorted(sections, key=lambda i: (i.startswith('!'), int(i.lstrip('!')))):
+        handle.write('{0}\n'.format(identifier))
+        for longitude, latitude in sections[identifier]:
+            handle.write('   {0:.7E}   {1:.7E}\n'.format(longitude, latitude))
+        handle.write('END\n')
+    handle.write('END\n')
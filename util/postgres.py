@@ -1,3 +1,14 @@
+import os
+import io
+import re
+import sys
+import csv
+import uuid
+import shutil
+import tempfile
+import contextlib
+import subprocess
+import collections
 from which import which
 try:
     import psycopg2
@@ -19,9 +30,131 @@ def make_copy_query(subquery_or_table):
         query = 'COPY {0} TO STDOUT WITH CSV HEADER'
     return query.format(subquery_or_table)
 
+def make_copy_from_query(table, columns=None, source='STDIN'):
+    if columns:
+        table = '{0} ({1})'.format(table, ', '.join(columns))
+    return 'COPY {0} FROM {1} WITH CSV'.format(table, source)
+
+def csv_line(row):
+    # quote every value, so that only None becomes NULL
+    def field(value):
+        if value is None:
+            return ''
+        text = repr(value) if isinstance(value, float) else '{0}'.format(value)
+        return '"' + text.replace('"', '""') + '"'
+    return ','.join(map(field, row)) + '\n'
+
+class CsvRowStream(object):
+    "File-like object yielding rows as CSV text, for COPY ... FROM STDIN"
+    def __init__(self, rows):
+        self.rows   = iter(rows)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        lines  = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            line = csv_line(row)
+            lines.append(line)
+            length += len(line)
+        data = ''.join(lines)
+        if size < 0:
+            size = len(data)
+        self.buffer = data[size:]
+        return data[:size]
+
+def csv_stream(data):
+    # data is either a file-like object or an iterable of rows
+    if hasattr(data, 'read'):
+        return data
+    return CsvRowStream(data)
+
+def interpolate_variables(query, variables):
+    # emulate psql's :name substitution for clients that lack it; casts
+    # (::type) are left alone, as are names for which no value is given
+    def replace(match):
+        name = match.group(1)
+        return str(variables[name]) if name in variables else match.group(0)
+    return re.sub(r'(?<!:):([A-Za-z_]\w*)', replace, query)
+
+# psql prefixes server messages with the input file and line number,
+# and its own messages with 'psql: error:'
+SERVER_MESSAGE = re.compile(r'^(?:psql:(?:\S+:\d+:)? )?((?:NOTICE|INFO|LOG|WARNING|ERROR|FATAL|DETAIL|HINT|CONTEXT|STATEMENT|error|warning):)', re.M)
+
+def split_server_messages(text):
+    starts = [m.start() for m in SERVER_MESSAGE.finditer(text)]
+    if not starts or starts[0] > 0:
+        starts.insert(0, 0)
+    for begin, end in zip(starts, starts[1:] + [len(text)]):
+        yield SERVER_MESSAGE.sub(r'\1', text[begin:end], 1)
+
+
+class PsqlSession(object):
+    "A single psql process, reading commands from stdin"
+    def __init__(self):
+        self.sentinel = '-- gridkit {0} --'.format(uuid.uuid4().hex)
+        # quiet, so that command tags don't get mixed up with notices
+        self.process  = subprocess.Popen([PSQL, '-q', '-v', 'ON_ERROR_STOP=1'], stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def execute(self, commands):
+        # psql echoes the sentinel after processing the commands; on an
+        # error it stops (ON_ERROR_STOP) and we read EOF instead
+        sentinel = self.sentinel.encode('utf-8')
+        output   = list()
+        try:
+            self.process.stdin.write(commands.encode('utf-8') + b'\n\\echo ' + sentinel + b'\n')
+            self.process.stdin.flush()
+        except (IOError, OSError):
+            # psql has exited, the output tells us why
+            pass
+        for line in iter(self.process.stdout.readline, b''):
+            if line.rstrip(b'\r\n') == sentinel:
+                return b''.join(output).decode('utf-8')
+            output.append(line)
+        self.process.wait()
+        raise subprocess.CalledProcessError(self.process.returncode, PSQL, b''.join(output).decode('utf-8'))
+
+    def close(self):
+        if self.alive():
+            self.process.stdin.close()
+        self.process.wait()
+
+
+def psql_quote(argument):
+    return "'{0}'".format(str(argument).replace("'", "''"))
+
 
 class PsqlWrapper(object):
     "Wrap psql client executable under subprocess"
+    notices    = None
+    # keep a single psql process for all queries, so that we start it
+    # only once and session settings (e.g. work_mem) are kept
+    persistent = True
+
+    def __init__(self):
+        self._session = None
+
+    def clone(self):
+        # parameters live in the environment, so they are shared
+        client = type(self)()
+        client.persistent = self.persistent
+        return client
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def collect_notices(self):
+        self.notices = collections.deque()
+
     def check_connection(self):
         try:
             self.do_query('SELECT 1')
@@ -31,6 +164,8 @@ class PsqlWrapper(object):
             return True
 
     def update_params(self, params):
+        # a running session keeps the parameters it was started with
+        self.close()
         for n,v in params.items():
             k = 'PG' + n.upper()
             os.environ[k] = str(v)
@@ -38,17 +173,69 @@ class PsqlWrapper(object):
     def do_createdb(self, database_name):
         self.do_query('CREATE DATABASE {0}'.format(database_name))
 
+    def _execute(self, commands):
+        if self._session is None or not self._session.alive():
+            self._session = PsqlSession()
+        try:
+            output = self._session.execute(commands)
+        except subprocess.CalledProcessError as e:
+            self._session = None
+            self._write_output(e.output)
+            raise
+        except:
+            # we can't tell in which state the session is
+            self.close()
+            raise
+        self._write_output(output)
+
+    def _write_output(self, output):
+        # separate output from (server) messages, as psql would do
+        for message in split_server_messages(output):
+            if not SERVER_MESSAGE.match(message):
+                sys.stdout.write(message)
+            elif message.startswith('NOTICE:') and self.notices is not None:
+                self.notices.append(message)
+            else:
+                sys.stderr.write(message)
+
+    def _check_call(self, command):
+        if self.notices is None:
+            return subprocess.check_call(command)
+        # psql writes notices to stderr, keep them and pass on the rest
+        process   = subprocess.Popen(command, stderr=subprocess.PIPE)
+        _, errors = process.communicate()
+        for message in split_server_messages(errors.decode('utf-8')):
+            if message.startswith('NOTICE:'):
+                self.notices.append(message)
+            else:
+                sys.stderr.write(message)
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, command)
+
     def do_query(self, query):
         try:
-            subprocess.check_call([PSQL, '-v', 'ON_ERROR_STOP=1', '-c', query])
+            if self.persistent:
+                # an unterminated query would wait for more input
+                self._execute(query if query.rstrip().endswith(';') else query + '\n;')
+            else:
+                self._check_call([PSQL, '-v', 'ON_ERROR_STOP=1', '-c', query])
         except subprocess.CalledProcessError as e:
             raise QueryError(e, query)
         except OSError as e:
             raise Exception(e)
 
-    def do_queryfile(self, queryfile):
+    def do_queryfile(self, queryfile, variables=None):
         try:
-            subprocess.check_call([PSQL, '-v', 'ON_ERROR_STOP=1', '-f', queryfile])
+            if self.persistent:
+                commands = ['\\set {0} {1}'.format(n, psql_quote(v)) for n, v in sorted((variables or {}).items())]
+                commands.append('\\i {0}'.format(psql_quote(os.path.abspath(queryfile))))
+                self._execute('\n'.join(commands))
+            else:
+                command = [PSQL, '-v', 'ON_ERROR_STOP=1']
+                for n, v in sorted((variables or {}).items()):
+                    command.extend(['-v', '{0}={1}'.format(n, v)])
+                command.extend(['-f', queryfile])
+                self._check_call(command)
         except subprocess.CalledProcessError as e:
             raise QueryError(e, queryfile)
         except OSError as e:
@@ -57,35 +244,125 @@ class PsqlWrapper(object):
     def do_getcsv(self, subquery_or_table, io_handle):
         query = make_copy_query(subquery_or_table)
         try:
-            command = [PSQL, '-v', 'ON_ERROR_STOP=1', '-c', query]
-            try:
-                subprocess.check_call(command, stdout=io_handle)
-            except io.UnsupportedOperation as e:
-                io_handle.write(subprocess.check_output(command).decode('utf-8'))
+            if self.persistent:
+                self._getcsv_session(query, io_handle)
+            else:
+                command = [PSQL, '-v', 'ON_ERROR_STOP=1', '-c', query]
+                try:
+                    subprocess.check_call(command, stdout=io_handle)
+                except io.UnsupportedOperation as e:
+                    io_handle.write(subprocess.check_output(command).decode('utf-8'))
         except subprocess.CalledProcessError as e:
             raise QueryError(e, subquery_or_table)
         except OSError as e:
             raise Exception(e)
 
+    def do_putcsv(self, table, data, columns=None):
+        query  = make_copy_from_query(table, columns)
+        stream = csv_stream(data)
+        try:
+            if self.persistent:
+                # stdin is taken by the session, so read from a file
+                with self._tempfile() as input_file:
+                    with io.open(input_file, 'w', encoding='utf-8') as handle:
+                        shutil.copyfileobj(stream, handle)
+                    self._execute('\\' + make_copy_from_query(table, columns, psql_quote(input_file)))
+            else:
+                process = subprocess.Popen([PSQL, '-v', 'ON_ERROR_STOP=1', '-c', query], stdin=subprocess.PIPE)
+                for chunk in iter(lambda: stream.read(1 << 16), ''):
+                    process.stdin.write(chunk.encode('utf-8'))
+                process.stdin.close()
+                if process.wait() != 0:
+                    raise subprocess.CalledProcessError(process.returncode, PSQL)
+        except subprocess.CalledProcessError as e:
+            raise QueryError(e, query)
+        except OSError as e:
+            raise Exception(e)
+
+    def do_iterrows(self, query, batch_size=10000):
+        # rows are streamed as CSV, so all values are strings (or None
+        # for NULL); batch_size is accepted for compatibility only
+        copy_query = make_copy_query(query)
+        try:
+            if self.persistent:
+                with self._tempfile() as output_file:
+                    self._execute('\\o {0}\n{1};\n\\o'.format(psql_quote(output_file), copy_query))
+                    with io.open(output_file, 'r', encoding='utf-8') as handle:
+                        for row in self._read_rows(handle):
+                            yield row
+            else:
+                process = subprocess.Popen([PSQL, '-v', 'ON_ERROR_STOP=1', '-c', copy_query], stdout=subprocess.PIPE)
+                lines = (line.decode('utf-8') for line in process.stdout)
+                for row in self._read_rows(lines):
+                    yield row
+                if process.wait() != 0:
+                    raise subprocess.CalledProcessError(process.returncode, PSQL)
+        except subprocess.CalledProcessError as e:
+            raise QueryError(e, query)
+        except OSError as e:
+            raise Exception(e)
+
+    def _read_rows(self, lines):
+        # COPY ... CSV writes NULL as an unquoted empty field, which
+        # csv.reader does not distinguish from '', so both become None
+        rows = csv.reader(lines)
+        next(rows, None) # header
+        for row in rows:
+            yield tuple(value if value != '' else None for value in row)
+
+    @contextlib.contextmanager
+    def _tempfile(self):
+        fd, name = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        try:
+            yield name
+        finally:
+            os.remove(name)
+
+    def _getcsv_session(self, query, io_handle):
+        # redirect the output to a file, so it doesn't mix with messages
+        with self._tempfile() as output_file:
+            self._execute('\\o {0}\n{1};\n\\o'.format(psql_quote(output_file), query))
+            with io.open(output_file, 'r', encoding='utf-8') as handle:
+                shutil.copyfileobj(handle, io_handle)
+
 
 class Psycopg2Wrapper(object):
     "Wrap psycopg2 for consistency with psql-wrapper"
     def __init__(self):
         self._connection = None
         self._params     = dict()
+        self.notices     = None
 
-    def update_params(self, params):
+    def collect_notices(self):
+        # psycopg2 truncates lists to the last 50 notices, but not deques
+        self.notices = collections.deque()
+        if self._connection is not None:
+            self._connection.notices = self.notices
+
+    def clone(self):
+        # a client for a separate connection with the same parameters
+        client = type(self)()
+        client.update_params(self._params)
+        return client
+
+    def close(self):
         if self._connection is not None:
-            # close existing connection
             if not self._connection.closed:
                 self._connection.close()
             self._connection = None
+
+    def update_params(self, params):
+        # close existing connection
+        self.close()
         self._params.update(**params)
 
     def check_connection(self):
         try:
             if self._connection is None:
                 self._connection = psycopg2.connect(**self._params)
+                if self.notices is not None:
+                    self._connection.notices = self.notices
         except (TypeError, psycopg2.Error) as e:
             return False
         else:
@@ -103,9 +380,11 @@ class Psycopg2Wrapper(object):
         except psycopg2.Error as e:
             raise QueryError(e, query)
 
-    def do_queryfile(self, queryfile):
+    def do_queryfile(self, queryfile, variables=None):
         with io.open(queryfile, 'r', encoding='utf-8') as handle:
             query = handle.read()
+        if variables:
+            query = interpolate_variables(query, variables)
         self.do_query(query)
 
     def do_getcsv(self, subquery_or_table, io_handle):
@@ -116,6 +395,28 @@ class Psycopg2Wrapper(object):
         except psycopg2.Error as e:
             raise QueryError(e, query)
 
+    def do_putcsv(self, table, data, columns=None):
+        query = make_copy_from_query(table, columns)
+        try:
+            with self._connection as con:
+                with con.cursor() as cursor:
+                    cursor.copy_expert(query, csv_stream(data), size=1 << 16)
+        except psycopg2.Error as e:
+            raise QueryError(e, query)
+
+    def do_iterrows(self, query, batch_size=10000):
+        # a named (server-side) cursor fetches batch_size rows at a time,
+        # rather than the whole result at once
+        try:
+            with self._connection as con:
+                with con.cursor(name='gridkit_{0}'.format(uuid.uuid4().hex)) as cursor:
+                    cursor.itersize = batch_size
+                    cursor.execute(query)
+                    for row in cursor:
+                        yield row
+        except psycopg2.Error as e:
+            raise QueryError(e, query)
+
 
 
 class PgWrapper(Psycopg2Wrapper if psycopg2 else PsqlWrapper):
@@ -0,0 +1,281 @@
+"""DC power flow over the arrays of a Network.
+
+The buses and branches are those of Network.powercase(): a bus for
+each voltage of a station, a transformer from the highest voltage bus
+of a station to each of its other buses, and a branch for each voltage
+of a line, with the same (default) reactances. Loads are placed at the
+lowest voltage bus of a station; negative loads are generation.
+"""
+from __future__ import unicode_literals, division, print_function
+import os
+import random
+import shutil
+import tempfile
+import collections
+import multiprocessing
+import numpy
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.sparse.linalg import splu
+
+# as in Network.powercase()
+BASE_MVA          = 100.0
+DEFAULT_REACTANCE = 0.01
+
+DCResult = collections.namedtuple('DCResult', 'angles flows line_flows imbalance')
+
+
+class DCPowerFlow(object):
+    """DC power flow of a network, factorized once.
+
+    Solving for a load vector (or a matrix of them, one column per
+    scenario) takes one substitution with the stored factors. Each
+    island has its own reference bus, that takes up the imbalance of
+    the island.
+    """
+    def __init__(self, network):
+        self.arrays = arrays = network.arrays
+        codes       = arrays.voltage_codes
+        levels      = numpy.array(codes.levels, dtype=numpy.float64)
+        num_levels  = max(len(levels), 1)
+
+        # buses are ordered by station and level, so their keys are sorted
+        station_levels = codes.membership(arrays.station_voltages)
+        self.bus_station, self.bus_level = numpy.nonzero(station_levels)
+        self.bus_voltage = levels[self.bus_level] if len(levels) else numpy.zeros(0)
+        bus_keys = self.bus_station * num_levels + self.bus_level
+        self.num_buses = len(bus_keys)
+
+        # lowest and highest voltage bus of each station
+        by_voltage = numpy.lexsort((self.bus_voltage, self.bus_station))
+        stations   = self.bus_station[by_voltage]
+        first = numpy.flatnonzero(numpy.diff(numpy.concatenate([[-1], stations])) != 0)
+        last  = numpy.concatenate([first[1:], [len(stations)]]) - 1
+        self.low_bus  = numpy.full(arrays.num_stations, -1, dtype=numpy.int64)
+        self.high_bus = numpy.full(arrays.num_stations, -1, dtype=numpy.int64)
+        self.low_bus[stations[first]] = by_voltage[first]
+        self.high_bus[stations[last]] = by_voltage[last]
+
+        # transformers, from the highest voltage bus to the others
+        transformer_to   = numpy.flatnonzero(self.high_bus[self.bus_station] != numpy.arange(self.num_buses))
+        transformer_from = self.high_bus[self.bus_station[transformer_to]]
+
+        # lines, for each of their voltages
+        line_levels = codes.membership(arrays.line_voltages)
+        line_index, line_level = numpy.nonzero(line_levels)
+        from_keys = arrays.left[line_index] * num_levels + line_level
+        to_keys   = arrays.right[line_index] * num_levels + line_level
+        line_from = numpy.searchsorted(bus_keys, from_keys)
+        line_to   = numpy.searchsorted(bus_keys, to_keys)
+        for keys, index in ((from_keys, line_from), (to_keys, line_to)):
+            missing = (index >= self.num_buses) | (bus_keys[numpy.minimum(index, self.num_buses - 1)] != keys) \
+                      if self.num_buses else numpy.ones(len(keys), dtype=bool)
+            if numpy.any(missing):
+                j = line_index[numpy.flatnonzero(missing)[0]]
+                raise ValueError("Line {0} has a voltage its stations don't have; patch() the network first".format(
+                    arrays.line_ids[j]))
+
+        reactance = arrays.reactance[line_index]
+        reactance = numpy.where(numpy.isnan(reactance) | (reactance == 0), DEFAULT_REACTANCE, reactance)
+        self.branch_from = numpy.concatenate([transformer_from, line_from]).astype(numpy.int64)
+        self.branch_to   = numpy.concatenate([transformer_to, line_to]).astype(numpy.int64)
+        self.branch_line = numpy.concatenate([numpy.full(len(transformer_to), -1, dtype=numpy.int64), line_index])
+        self.susceptance = 1 / numpy.concatenate([numpy.full(len(transformer_to), DEFAULT_REACTANCE), reactance])
+
+        self.bus_matrix = self._bus_matrix()
+        self._factorize()
+
+    def _bus_matrix(self):
+        f, t, b = self.branch_from, self.branch_to, self.susceptance
+        rows = numpy.concatenate([f, t, f, t])
+        cols = numpy.concatenate([f, t, t, f])
+        data = numpy.concatenate([b, b, -b, -b])
+        return sparse.coo_matrix((data, (rows, cols)), shape=(self.num_buses, self.num_buses)).tocsc()
+
+    def _factorize(self):
+        # without the reference buses, the matrix is block diagonal with
+        # a non-singular block for each island; factorizing it as a whole
+        # factorizes each island
+        adjacency = sparse.coo_matrix((numpy.ones(len(self.branch_from)), (self.branch_from, self.branch_to)),
+                                      shape=(self.num_buses, self.num_buses))
+        self.num_islands, self.bus_island = csgraph.connected_components(adjacency, directed=False)
+        first = numpy.full(self.num_islands, self.num_buses, dtype=numpy.int64)
+        numpy.minimum.at(first, self.bus_island, numpy.arange(self.num_buses))
+        self.reference = first
+        is_reference = numpy.zeros(self.num_buses, dtype=bool)
+        is_reference[self.reference] = True
+        self.solved = numpy.flatnonzero(~is_reference)
+        reduced = self.bus_matrix[self.solved, :][:, self.solved].tocsc()
+        self.factors = splu(reduced) if len(self.solved) else None
+
+    def injections(self, loads):
+        # bus injections (MW) for loads, either a dict of station id to
+        # load or an array with the load of each station (in the order of
+        # the arrays); a 2-d array has a row for each scenario, and gives
+        # a column of injections for each
+        arrays = self.arrays
+        if isinstance(loads, dict):
+            station_loads = numpy.zeros(arrays.num_stations)
+            if loads:
+                index = arrays.station_index(list(loads.keys()))
+                station_loads[index] = list(loads.values())
+        else:
+            station_loads = numpy.asarray(loads, dtype=numpy.float64)
+        loaded = numpy.flatnonzero(numpy.any(numpy.atleast_2d(station_loads) != 0, axis=0))
+        if numpy.any(self.low_bus[loaded] < 0):
+            station_id = arrays.station_ids[loaded[self.low_bus[loaded] < 0][0]]
+            raise ValueError("Station {0} has a load but no voltage".format(station_id))
+        shape = (self.num_buses,) + station_loads.shape[:-1][::-1]
+        injections = numpy.zeros(shape)
+        numpy.subtract.at(injections, self.low_bus[loaded], station_loads[..., loaded].T)
+        return injections
+
+    def solve(self, loads=None, injections=None):
+        # angles (radians) of the buses, flows (MW) of the branches and
+        # of the lines (summed over their voltages), and the imbalance
+        # taken up by the reference bus of each island
+        if injections is None:
+            injections = self.injections(loads)
+        injections = numpy.asarray(injections, dtype=numpy.float64)
+        angles = numpy.zeros(injections.shape)
+        if self.factors is not None:
+            angles[self.solved] = self.factors.solve(injections[self.solved] / BASE_MVA)
+        return self._result(angles, injections)
+
+    def __getstate__(self):
+        # for the workers of solve_batch; the factors can't be pickled
+        state = self.__dict__.copy()
+        state['factors'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if len(self.solved):
+            self.factors = splu(self.bus_matrix[self.solved, :][:, self.solved].tocsc())
+
+    def solve_batch(self, loads, jobs=1, batch_size=256, out=None):
+        """Line flows for many scenarios: loads is a (dense or scipy.sparse)
+        matrix of scenarios by stations, the result is a matrix of
+        scenarios by lines. The scenarios are solved batch_size at a
+        time, with jobs processes; out may be a numpy.memmap to keep the
+        result on disk."""
+        num_scenarios = loads.shape[0]
+        if out is None:
+            out = numpy.zeros((num_scenarios, self.arrays.num_lines))
+        batches = [(start, min(start + batch_size, num_scenarios))
+                   for start in range(0, num_scenarios, batch_size)]
+        if jobs <= 1 or len(batches) <= 1:
+            for start, stop in batches:
+                out[start:stop] = self.batch_line_flows(loads[start:stop])
+            return out
+
+        # the workers share the loads (unless sparse) and the flows as
+        # memory mapped files, and receive only the bounds of a batch
+        directory = tempfile.mkdtemp(prefix='gridkit-powerflow-')
+        try:
+            if sparse.issparse(loads):
+                loads = sparse.csr_matrix(loads)
+                loads_file = None
+                batches = [(start, stop, loads[start:stop]) for start, stop in batches]
+            else:
+                loads_file = os.path.join(directory, 'loads')
+                shared = numpy.memmap(loads_file, dtype=numpy.float64, mode='w+', shape=loads.shape)
+                shared[:] = loads
+                shared.flush()
+                del shared
+                batches = [(start, stop, None) for start, stop in batches]
+            flows_file = os.path.join(directory, 'flows')
+            flows = numpy.memmap(flows_file, dtype=numpy.float64, mode='w+', shape=out.shape)
+            pool = multiprocessing.Pool(jobs, _init_worker, (self, loads_file, loads.shape, flows_file, out.shape))
+            try:
+                pool.map(_solve_worker, batches)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+            out[:] = flows
+            del flows
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        return out
+
+    def batch_injections(self, loads):
+        # bus injections of a (dense or sparse) matrix of scenarios by
+        # station loads, as a matrix of buses by scenarios
+        incidence = self._load_incidence()
+        if sparse.issparse(loads):
+            loads = sparse.csc_matrix(loads)
+            unplaced = loads[:, self.low_bus < 0].nnz > 0
+        else:
+            loads = numpy.asarray(loads, dtype=numpy.float64)
+            unplaced = numpy.any(loads[:, self.low_bus < 0] != 0)
+        if unplaced:
+            raise ValueError("Loads of stations without voltage")
+        injections = -(incidence * loads.T)
+        return injections.toarray() if sparse.issparse(injections) else numpy.asarray(injections)
+
+    def batch_line_flows(self, loads):
+        # line flows of a matrix of scenarios, as scenarios by lines
+        injections = self.batch_injections(loads)
+        angles = numpy.zeros(injections.shape)
+        if self.factors is not None:
+            angles[self.solved] = self.factors.solve(numpy.asfortranarray(injections[self.solved] / BASE_MVA))
+        flows = self.susceptance[:, None] * (angles[self.branch_from] - angles[self.branch_to]) * BASE_MVA
+        return numpy.asarray((self._line_incidence() * flows).T)
+
+    def _load_incidence(self):
+        # buses by stations, placing the load of a station at its lowest voltage bus
+        if getattr(self, '_loads_to_buses', None) is None:
+            placed = numpy.flatnonzero(self.low_bus >= 0)
+            self._loads_to_buses = sparse.csr_matrix((numpy.ones(len(placed)), (self.low_bus[placed], placed)),
+                                                     shape=(self.num_buses, self.arrays.num_stations))
+        return self._loads_to_buses
+
+    def _line_incidence(self):
+        # lines by branches, summing the flows over the voltages of a line
+        if getattr(self, '_branches_to_lines', None) is None:
+            is_line = numpy.flatnonzero(self.branch_line >= 0)
+            self._branches_to_lines = sparse.csr_matrix((numpy.ones(len(is_line)), (self.branch_line[is_line], is_line)),
+                                                        shape=(self.arrays.num_lines, len(self.branch_line)))
+        return self._branches_to_lines
+
+    def _result(self, angles, injections):
+        susceptance = self.susceptance.reshape((-1,) + (1,) * (angles.ndim - 1))
+        flows = susceptance * (angles[self.branch_from] - angles[self.branch_to]) * BASE_MVA
+        is_line = self.branch_line >= 0
+        line_flows = numpy.zeros((self.arrays.num_lines,) + flows.shape[1:])
+        numpy.add.at(line_flows, self.branch_line[is_line], flows[is_line])
+        imbalance = numpy.zeros((self.num_islands,) + injections.shape[1:])
+        numpy.add.at(imbalance, self.bus_island, injections)
+        return DCResult(angles, flows, line_flows, imbalance)
+
+
+# state of the worker processes of DCPowerFlow.solve_batch
+_worker = dict()
+
+def _init_worker(flow, loads_file, loads_shape, flows_file, flows_shape):
+    _worker['flow']  = flow
+    _worker['loads'] = numpy.memmap(loads_file, dtype=numpy.float64, mode='r', shape=loads_shape) \
+                       if loads_file is not None else None
+    _worker['flows'] = numpy.memmap(flows_file, dtype=numpy.float64, mode='r+', shape=flows_shape)
+
+def _solve_worker(batch):
+    start, stop, loads = batch
+    if loads is None:
+        loads = _worker['loads'][start:stop]
+    flows = _worker['flows']
+    flows[start:stop] = _worker['flow'].batch_line_flows(loads)
+    flows.flush()
+
+
+def electrified_pairs(arrays, num_scenarios, generation=100, load=50, rng=random):
+    """Scenarios like those of Network.powercase() without loads: in each,
+    a random station generates and another consumes. Returns a sparse
+    matrix of scenarios by stations, for DCPowerFlow.solve_batch."""
+    stations = numpy.array([rng.sample(range(arrays.num_stations), 2) for _ in range(num_scenarios)],
+                           dtype=numpy.int64).reshape(-1, 2)
+    rows = numpy.repeat(numpy.arange(num_scenarios), 2)
+    data = numpy.tile([-generation, load], num_scenarios).astype(numpy.float64)
+    return sparse.csr_matrix((data, (rows, stations.ravel())), shape=(num_scenarios, arrays.num_stations))
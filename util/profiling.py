@@ -0,0 +1,103 @@
+from __future__ import unicode_literals, division
+import io
+import re
+import csv
+import json
+import time
+
+
+# auto_explain sends the plans of slow statements to the client as
+# notices; loading it this way requires superuser rights
+AUTO_EXPLAIN_SETTINGS = [
+    ('session_preload_libraries', 'auto_explain'),
+    ('auto_explain.log_analyze', 'on'),
+    ('auto_explain.log_buffers', 'on'),
+    ('auto_explain.log_format', 'json'),
+    ('auto_explain.log_nested_statements', 'on'),
+    ('auto_explain.log_level', 'notice'),
+]
+
+TABLE_WRITTEN = re.compile(r'^\s*(?:create table(?: if not exists)?|insert into)\s+(\w+)', re.I | re.M)
+PLAN_NOTICE   = re.compile(r'duration: ([\d.]+) ms\s+plan:\s*(.*)', re.S)
+
+
+def auto_explain_options(min_duration):
+    # connection options (PGOPTIONS) to EXPLAIN (ANALYZE, BUFFERS) all
+    # statements that take at least min_duration milliseconds
+    settings = AUTO_EXPLAIN_SETTINGS + [('auto_explain.log_min_duration', min_duration)]
+    return ' '.join('-c {0}={1}'.format(n, v) for n, v in settings)
+
+def tables_written(query_text):
+    tables = list()
+    for table in TABLE_WRITTEN.findall(query_text):
+        if table.lower() not in tables:
+            tables.append(table.lower())
+    return tables
+
+def parse_plan_notice(notice):
+    match = PLAN_NOTICE.search(notice)
+    if match is None:
+        return None
+    duration, plan_text = match.groups()
+    try:
+        # anything after the plan is not part of it
+        plan, end = json.JSONDecoder().raw_decode(plan_text)
+    except ValueError:
+        # not the json format, keep the text
+        return {'duration_ms': float(duration), 'plan': plan_text.strip()}
+    return {'duration_ms': float(duration), 'query': plan.get('Query Text'), 'plan': plan.get('Plan')}
+
+
+class StageProfiler(object):
+    "Record wall time, row counts and optionally query plans per conversion stage"
+    def __init__(self, explain=False):
+        self.explain = explain
+        self.stages  = list()
+
+    def run_stage(self, pg_client, stage_name, queryfile, variables):
+        with io.open(queryfile, 'r', encoding='utf-8') as handle:
+            tables = tables_written(handle.read())
+        if self.explain:
+            pg_client.notices.clear()
+        started = time.time()
+        pg_client.do_queryfile(queryfile, variables)
+        elapsed = time.time() - started
+        stage = {
+            'stage': stage_name,
+            'seconds': round(elapsed, 3),
+            'row_counts': self.count_rows(pg_client, tables),
+        }
+        if self.explain:
+            plans = filter(None, map(parse_plan_notice, pg_client.notices))
+            stage['plans'] = sorted(plans, key=lambda p: -p['duration_ms'])
+        self.stages.append(stage)
+
+    def count_rows(self, pg_client, tables):
+        if not tables:
+            return {}
+        # some tables are dropped again by the stage that made them
+        existing = self.select(pg_client, "SELECT relname FROM pg_class WHERE relkind = 'r' AND relname IN ({0})".format(
+            ', '.join("'{0}'".format(table) for table in tables)))
+        tables = [row[0] for row in existing]
+        if not tables:
+            return {}
+        query = ' UNION ALL '.join("SELECT '{0}', count(*) FROM {0}".format(table) for table in tables)
+        return dict((table, int(count)) for table, count in self.select(pg_client, query))
+
+    def select(self, pg_client, query):
+        io_handle = io.StringIO()
+        pg_client.do_getcsv(query, io_handle)
+        io_handle.seek(0,0)
+        rows = csv.reader(io_handle)
+        next(rows, None) # header
+        return list(rows)
+
+    def report(self):
+        return {
+            'total_seconds': round(sum(stage['seconds'] for stage in self.stages), 3),
+            'stages': self.stages,
+        }
+
+    def write(self, report_file):
+        with io.open(report_file, 'wb') as handle:
+            handle.write(json.dumps(self.report(), indent=2, sort_keys=True).encode('utf-8'))
@@ -0,0 +1,215 @@
+"""Reduction of a network to fewer stations and lines.
+
+reduce_network() removes radial stubs and contracts series chains of
+lines through stations with just those two lines, summing their
+impedances; the reduced lines keep a mapping to the lines they replace.
+kron_reduce() eliminates all but a chosen set of buses of a
+DCPowerFlow from its bus matrix.
+"""
+from __future__ import unicode_literals, division, print_function
+import collections
+import numpy
+from scipy.sparse.linalg import splu
+from network import Network, CompactNetwork, NetworkArrays
+from powerflow import DEFAULT_REACTANCE
+
+# line_map gives the original line ids of each line of the reduced
+# network, station_map the station of the reduced network that stands
+# in for each original station (if any)
+Reduction = collections.namedtuple('Reduction', 'network line_map station_map')
+
+# the bus matrix of the kept buses; distribution maps injections at all
+# buses to the kept buses, and the equivalent branches are the
+# off-diagonal entries of the matrix
+KronReduction = collections.namedtuple('KronReduction', 'buses matrix distribution branch_from branch_to susceptance')
+
+
+def reduce_network(network, keep=(), chains=True, stubs='drop'):
+    """Reduce network, never removing the stations with ids in keep.
+
+    With stubs 'drop' or 'aggregate', stations at the end of a single
+    line are removed until none remain, which removes trees hanging off
+    the network; 'aggregate' maps the stations of such a tree to the
+    station it hung from. With chains, lines meeting at a station that
+    has no other lines, and that have the same voltage and frequencies,
+    are replaced by one line. Lines of several voltages are neither
+    stubs nor part of a chain, as power can flow between the voltages at
+    their stations. Returns a Reduction, with a CompactNetwork if
+    network is one."""
+    arrays = network.arrays
+    num_stations = arrays.num_stations
+    left, right  = arrays.left.tolist(), arrays.right.tolist()
+    offsets, adjacent = arrays.offsets.tolist(), arrays.adjacent_lines.tolist()
+    kept = numpy.zeros(num_stations, dtype=bool)
+    if len(keep):
+        kept[arrays.station_index(list(keep))] = True
+    kept = kept.tolist()
+
+    station_alive = [True] * num_stations
+    line_alive    = [True] * arrays.num_lines
+    degree = numpy.diff(arrays.offsets).tolist()
+    parent = list(range(num_stations))
+    absorbed = [False] * num_stations
+    # DCPowerFlow has a branch for each voltage of a line, and connects
+    # the buses of a station by transformers, so a line of more than one
+    # voltage can close a loop through the buses of its stations
+    single = (arrays.voltage_codes.membership(arrays.line_voltages).sum(axis=1) <= 1).tolist()
+    if stubs not in (None, False, 'drop', 'aggregate'):
+        raise ValueError("stubs should be 'drop' or 'aggregate', not {0!r}".format(stubs))
+
+    if stubs:
+        leaves = [i for i in range(num_stations) if degree[i] == 1 and not kept[i]]
+        while leaves:
+            i = leaves.pop()
+            if degree[i] != 1:
+                continue
+            j = next(j for j in adjacent[offsets[i]:offsets[i + 1]] if line_alive[j])
+            if not single[j]:
+                continue
+            other = right[j] if left[j] == i else left[j]
+            line_alive[j] = station_alive[i] = False
+            parent[i] = other
+            # it stands in for the stub, if aggregated
+            absorbed[other] = stubs == 'aggregate'
+            degree[i] -= 1
+            degree[other] -= 1
+            if degree[other] == 1 and not kept[other]:
+                leaves.append(other)
+
+    chain_lines = list()
+    if chains:
+        voltages, frequencies = arrays.line_voltages, arrays.line_frequencies
+        def alive_lines(i):
+            return [j for j in adjacent[offsets[i]:offsets[i + 1]] if line_alive[j]]
+        def is_series(i):
+            if kept[i] or absorbed[i] or not station_alive[i] or degree[i] != 2:
+                return False
+            a, b = alive_lines(i)
+            return (a != b and left[a] != right[a] and left[b] != right[b] and single[a] and single[b] and
+                    numpy.array_equal(voltages[a], voltages[b]) and
+                    numpy.array_equal(frequencies[a], frequencies[b]))
+        series = [is_series(i) for i in range(num_stations)]
+        visited = [False] * arrays.num_lines
+
+        def walk(start, j):
+            # the lines from start along j up to the next station that
+            # isn't in series, and that station
+            chain, station = list(), start
+            while True:
+                visited[j] = True
+                chain.append(j)
+                station = right[j] if left[j] == station else left[j]
+                if not series[station] or station == start:
+                    return chain, station
+                j = next(k for k in alive_lines(station) if k != j)
+
+        ends = [i for i in range(num_stations) if station_alive[i] and not series[i]]
+        for i in ends + list(range(num_stations)):
+            if series[i] and any(not visited[j] for j in alive_lines(i)):
+                # a ring of stations in series; one of them stays
+                series[i] = False
+            elif series[i] or not station_alive[i]:
+                continue
+            for j in alive_lines(i):
+                if visited[j]:
+                    continue
+                chain, end = walk(i, j)
+                if len(chain) > 1:
+                    chain_lines.append((i, end, chain))
+        for i in range(num_stations):
+            if series[i]:
+                station_alive[i] = False
+        for start, end, chain in chain_lines:
+            for j in chain:
+                line_alive[j] = False
+
+    station_map = dict()
+    station_ids = arrays.station_ids.tolist()
+    for i in range(num_stations):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        if station_alive[root] and (station_alive[i] or stubs == 'aggregate'):
+            station_map[station_ids[i]] = station_ids[root]
+
+    reduced = _reduced_arrays(arrays, numpy.flatnonzero(station_alive), numpy.flatnonzero(line_alive), chain_lines)
+    line_ids = arrays.line_ids
+    line_map = dict((line_id, [line_id]) for line_id in line_ids[numpy.flatnonzero(line_alive)].tolist())
+    for start, end, chain in chain_lines:
+        line_map[int(line_ids[chain].min())] = line_ids[chain].tolist()
+    if isinstance(network, CompactNetwork):
+        reduced_network = CompactNetwork(reduced)
+    else:
+        reduced_network = reduced.to_network(Network())
+    return Reduction(reduced_network, line_map, station_map)
+
+
+def _reduced_arrays(arrays, stations, lines, chain_lines):
+    # the arrays of the remaining stations and lines, and a line for each
+    # chain; the impedances of a chain add up, its rating is the lowest.
+    # Lines without a reactance count with the one DCPowerFlow gives them,
+    # so that the chain carries the same flow.
+    chain_index = [chain for start, end, chain in chain_lines]
+    def chains(values, combine):
+        return numpy.array([combine(values[chain]) for chain in chain_index], dtype=values.dtype)
+    def rows(values):
+        return values[[chain[0] for chain in chain_index]] if chain_index else values[:0]
+    def series_reactance(values):
+        return numpy.where(numpy.isnan(values) | (values == 0), DEFAULT_REACTANCE, values).sum()
+    def lowest(values):
+        known = values[~numpy.isnan(values)]
+        return known.min() if len(known) else numpy.nan
+
+    station_ids = arrays.station_ids[stations]
+    ends = numpy.array([[arrays.station_ids[start], arrays.station_ids[end]]
+                        for start, end, chain in chain_lines], dtype=numpy.int64).reshape(-1, 2)
+    line_fields = dict(
+        line_ids=numpy.concatenate([arrays.line_ids[lines], chains(arrays.line_ids, numpy.min)]),
+        left=numpy.concatenate([arrays.station_ids[arrays.left[lines]], ends[:, 0]]),
+        right=numpy.concatenate([arrays.station_ids[arrays.right[lines]], ends[:, 1]]),
+        length=numpy.concatenate([arrays.length[lines], chains(arrays.length, numpy.sum)]),
+        line_operators=numpy.concatenate([arrays.line_operators[lines], rows(arrays.line_operators)]),
+        line_voltages=numpy.concatenate([arrays.line_voltages[lines], rows(arrays.line_voltages)]),
+        line_frequencies=numpy.concatenate([arrays.line_frequencies[lines], rows(arrays.line_frequencies)]),
+        resistance=numpy.concatenate([arrays.resistance[lines], chains(arrays.resistance, numpy.sum)]),
+        reactance=numpy.concatenate([arrays.reactance[lines], chains(arrays.reactance, series_reactance)]),
+        capacitance=numpy.concatenate([arrays.capacitance[lines], chains(arrays.capacitance, numpy.sum)]),
+        max_current=numpy.concatenate([arrays.max_current[lines], chains(arrays.max_current, lowest)]))
+    order = numpy.argsort(line_fields['line_ids'], kind='mergesort')
+    for name in line_fields:
+        line_fields[name] = line_fields[name][order]
+    line_fields['left']  = numpy.searchsorted(station_ids, line_fields['left']).astype(numpy.int64)
+    line_fields['right'] = numpy.searchsorted(station_ids, line_fields['right']).astype(numpy.int64)
+    station_fields = dict((name, getattr(arrays, name)[stations]) for name in NetworkArrays.STATION_FIELDS)
+    station_fields.update(line_fields)
+    return NetworkArrays(arrays.voltage_codes, arrays.frequency_codes, **station_fields)
+
+
+def kron_reduce(flow, station_ids):
+    """Eliminate all buses of the DCPowerFlow flow but those of the
+    stations in station_ids. Buses in islands without any kept bus are
+    left out altogether."""
+    keep = numpy.zeros(flow.arrays.num_stations, dtype=bool)
+    keep[flow.arrays.station_index(list(station_ids))] = True
+    keep = keep[flow.bus_station]
+    kept = numpy.flatnonzero(keep)
+    reached = numpy.zeros(flow.num_islands, dtype=bool)
+    reached[flow.bus_island[kept]] = True
+    eliminated = numpy.flatnonzero(~keep & reached[flow.bus_island])
+
+    matrix = flow.bus_matrix.tocsr()
+    kept_kept = matrix[kept, :][:, kept].toarray()
+    kept_eliminated = matrix[kept, :][:, eliminated].toarray()
+    distribution = numpy.zeros((len(kept), flow.num_buses))
+    distribution[numpy.arange(len(kept)), kept] = 1
+    if len(eliminated):
+        factors = splu(matrix[eliminated, :][:, eliminated].tocsc())
+        # B_ee^-1 B_ek, B being symmetric
+        transfer = factors.solve(numpy.asfortranarray(kept_eliminated.T))
+        kept_kept -= kept_eliminated.dot(transfer)
+        distribution[:, eliminated] = -transfer.T
+    upper = numpy.triu(-kept_kept, 1)
+    scale = numpy.abs(kept_kept).max() if kept_kept.size else 0
+    branch_from, branch_to = numpy.nonzero(numpy.abs(upper) > 1e-12 * scale)
+    return KronReduction(kept, kept_kept, distribution, kept[branch_from], kept[branch_to],
+                         upper[branch_from, branch_to])
@@ -0,0 +1,139 @@
+from __future__ import unicode_literals
+import io
+import os
+import hashlib
+import logging
+import collections
+import multiprocessing.pool
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+Stage = collections.namedtuple('Stage', ['name', 'path', 'variables', 'inputs', 'outputs'])
+
+def _names(column):
+    if column == '-':
+        return frozenset()
+    return frozenset(name.lower() for name in column.split(','))
+
+def read_manifest(manifest_file):
+    # stage files are relative to the manifest; the stage name is the
+    # path as written in the manifest
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+    stages   = list()
+    with io.open(manifest_file, 'r') as handle:
+        for line_number, line in enumerate(handle, 1):
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            columns = line.split()
+            if len(columns) != 4:
+                raise ValueError('{0}:{1}: expected stage, variables, inputs and outputs'.format(
+                    manifest_file, line_number))
+            name, variables, inputs, outputs = columns
+            stages.append(Stage(name, os.path.join(base_dir, name),
+                                sorted(_names(variables)), _names(inputs), _names(outputs)))
+    return stages
+
+def stage_dependencies(stages):
+    # a stage must wait for any earlier stage that writes what it reads
+    # or writes, or that reads what it writes
+    dependencies = dict()
+    for i, stage in enumerate(stages):
+        dependencies[stage.name] = [
+            earlier.name for earlier in stages[:i]
+            if earlier.outputs & (stage.inputs | stage.outputs) or earlier.inputs & stage.outputs
+        ]
+    return dependencies
+
+def stage_hashes(stages, dependencies, config):
+    # each hash covers the query text, the variables, and the hashes of
+    # the stages it depends on, so that a change invalidates exactly the
+    # stages that follow from it
+    hashes = dict()
+    for stage in stages:
+        digest = hashlib.sha1()
+        for name in dependencies[stage.name]:
+            digest.update(hashes[name].encode('ascii'))
+        with io.open(stage.path, 'rb') as handle:
+            digest.update(handle.read())
+        for name in stage.variables:
+            digest.update('{0}={1};'.format(name, config[name]).encode('utf-8'))
+        hashes[stage.name] = digest.hexdigest()
+    return hashes
+
+def stages_to_run(stages, dependencies, hashes, markers):
+    # stages without a marker have not completed and must run, and so must
+    # the stages depending on them. Stages that have completed are
+    # repeated if their marker is no longer valid; because stages modify
+    # the tables of earlier stages in place, a stage can only be repeated
+    # after the earlier stages writing the same tables have been
+    # repeated as well.
+    run    = set(stage.name for stage in stages if markers.get(stage.name) != hashes[stage.name])
+    repeat = set(name for name in run if name in markers)
+    changed = True
+    while changed:
+        changed = False
+        for i, stage in enumerate(stages):
+            if stage.name not in run and (
+                    any(name in run for name in dependencies[stage.name]) or
+                    any(later.name in repeat and later.outputs & stage.outputs for later in stages[i+1:])):
+                run.add(stage.name)
+                if stage.name in markers:
+                    repeat.add(stage.name)
+                changed = True
+    return [stage for stage in stages if stage.name in run]
+
+def run_stages(stages, dependencies, run_stage, jobs=1):
+    # run stages in manifest order, or with jobs > 1 start each stage on
+    # a worker thread as soon as the stages it depends on are done. After
+    # a failure no new stages are started, and the error is raised when
+    # the running stages have finished.
+    if jobs <= 1:
+        for stage in stages:
+            run_stage(stage)
+        return
+
+    scheduled = set(stage.name for stage in stages)
+    pending   = list(stages)
+    running   = set()
+    finished  = set()
+    results   = queue.Queue()
+    error     = None
+
+    def run(stage):
+        try:
+            run_stage(stage)
+            results.put((stage.name, None))
+        except Exception as e:
+            logging.exception("Stage %s failed", stage.name)
+            results.put((stage.name, e))
+
+    def ready(stage):
+        return all(name in finished or name not in scheduled for name in dependencies[stage.name])
+
+    pool = multiprocessing.pool.ThreadPool(jobs)
+    try:
+        while running or (pending and error is None):
+            for stage in list(pending):
+                if error is None and len(running) < jobs and ready(stage):
+                    pending.remove(stage)
+                    running.add(stage.name)
+                    pool.apply_async(run, (stage,))
+            while True:
+                # waiting with a timeout keeps Ctrl+C working in python 2
+                try:
+                    name, stage_error = results.get(timeout=1)
+                    break
+                except queue.Empty:
+                    pass
+            running.remove(name)
+            finished.add(name)
+            if stage_error is not None and error is None:
+                error = stage_error
+    finally:
+        pool.close()
+        pool.join()
+    if error is not None:
+        raise error